@@ -25,6 +25,8 @@ else {
     Copy-Item "rag\faiss_metadata_en.json" $EN_DIR
     Copy-Item "rag\chunked_scriptures_en.json" $EN_DIR
     if (Test-Path "rag\bm25_index_en.pkl") { Copy-Item "rag\bm25_index_en.pkl" $EN_DIR }
+    # Exact re-ranking matrix: only for compressed (PQ/SQ) indexes, stored as float16
+    python rag\embedding_store.py rag $EN_DIR en
 
     Write-Host "   Copying English books..."
     Copy-Item -Recurse "public\books\en" "$EN_DIR\books\"
@@ -51,6 +53,8 @@ else {
     Copy-Item "rag\faiss_metadata_ru.json" $RU_DIR
     Copy-Item "rag\chunked_scriptures_ru.json" $RU_DIR
     if (Test-Path "rag\bm25_index_ru.pkl") { Copy-Item "rag\bm25_index_ru.pkl" $RU_DIR }
+    # Exact re-ranking matrix: only for compressed (PQ/SQ) indexes, stored as float16
+    python rag\embedding_store.py rag $RU_DIR ru
 
     Write-Host "   Copying Russian books..."
     Copy-Item -Recurse "public\books\ru" "$RU_DIR\books\"
@@ -81,6 +85,7 @@ else {
     Copy-Item "rag\chunked_scriptures_ru.json" $ALL_DIR
     if (Test-Path "rag\bm25_index_en.pkl") { Copy-Item "rag\bm25_index_en.pkl" $ALL_DIR }
     if (Test-Path "rag\bm25_index_ru.pkl") { Copy-Item "rag\bm25_index_ru.pkl" $ALL_DIR }
+    python rag\embedding_store.py rag $ALL_DIR en ru
 
     Write-Host "   Copying all books..."
     Copy-Item -Recurse "public\books\en" "$ALL_DIR\books\"
@@ -90,11 +95,21 @@ else {
     Compress-Archive -Path "$ALL_DIR\*" -DestinationPath $ALL_ZIP -Force
     Write-Host "Multilingual archive ready" -ForegroundColor Green
 
+    # Manifest + per-file assets for delta updates (upload the contents of data_update too)
+    $DATA_VERSION = (Select-String -Path "rag\rag_api_server.py" -Pattern '^DATA_VERSION = (\d+)').Matches[0].Groups[1].Value
+    python rag\data_manifest.py $ALL_DIR --version $DATA_VERSION --output "$BUILD_DIR\data_update"
+
     Remove-Item -Recurse -Force $ALL_DIR
 }
 
+# --- Checksums (verified by the setup wizard after download) ---
+Get-ChildItem "$BUILD_DIR\*.zip" | ForEach-Object {
+    $hash = (Get-FileHash $_.FullName -Algorithm SHA256).Hash.ToLower()
+    Set-Content -Path "$($_.FullName).sha256" -Value "$hash  $($_.Name)" -NoNewline
+}
+
 # --- Summary ---
 Write-Host "`n====================================" -ForegroundColor Cyan
 Write-Host "Archive Summary:" -ForegroundColor Cyan
 Get-ChildItem "$BUILD_DIR\*.zip" | ForEach-Object { Write-Host "   $($_.Name): $([math]::Round($_.Length / 1MB, 2)) MB" }
-Write-Host "`nDone! Upload these to GitHub Releases with tag 'data-v2'" -ForegroundColor Green
+Write-Host "`nDone! Upload these (with .sha256 files) to GitHub Releases with tag 'data-v2'" -ForegroundColor Green
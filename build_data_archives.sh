@@ -22,6 +22,8 @@ cp rag/faiss_metadata_en.json "$EN_DIR/"
 cp rag/chunked_scriptures_en.json "$EN_DIR/"
 # BM25 will be regenerated on first run, but include if exists
 [ -f rag/bm25_index_en.pkl ] && cp rag/bm25_index_en.pkl "$EN_DIR/"
+# Exact re-ranking matrix: only for compressed (PQ/SQ) indexes, stored as float16
+python rag/embedding_store.py rag "$EN_DIR" en
 
 # Copy books
 echo "   Copying English books..."
@@ -44,6 +46,8 @@ cp rag/faiss_index_ru.bin "$RU_DIR/"
 cp rag/faiss_metadata_ru.json "$RU_DIR/"
 cp rag/chunked_scriptures_ru.json "$RU_DIR/"
 [ -f rag/bm25_index_ru.pkl ] && cp rag/bm25_index_ru.pkl "$RU_DIR/"
+# Exact re-ranking matrix: only for compressed (PQ/SQ) indexes, stored as float16
+python rag/embedding_store.py rag "$RU_DIR" ru
 
 # Copy books
 echo "   Copying Russian books..."
@@ -71,6 +75,7 @@ cp rag/faiss_metadata_ru.json "$ALL_DIR/"
 cp rag/chunked_scriptures_ru.json "$ALL_DIR/"
 [ -f rag/bm25_index_en.pkl ] && cp rag/bm25_index_en.pkl "$ALL_DIR/"
 [ -f rag/bm25_index_ru.pkl ] && cp rag/bm25_index_ru.pkl "$ALL_DIR/"
+python rag/embedding_store.py rag "$ALL_DIR" en ru
 
 # Copy all books
 echo "   Copying all books..."
@@ -84,10 +89,21 @@ zip -r shukabase_data_multilingual.zip shukabase_data_multilingual/
 cd -
 echo "✅ Multilingual archive ready"
 
+# --- Delta update manifest (upload the contents of data_update too) ---
+DATA_VERSION=$(sed -n 's/^DATA_VERSION = \([0-9]*\).*/\1/p' rag/rag_api_server.py)
+python rag/data_manifest.py "$ALL_DIR" --version "$DATA_VERSION" --output "$BUILD_DIR/data_update"
+
+# --- Checksums (verified by the setup wizard after download) ---
+cd "$BUILD_DIR"
+for archive in *.zip; do
+    sha256sum "$archive" > "$archive.sha256"
+done
+cd -
+
 # --- Summary ---
 echo ""
 echo "===================================="
 echo "📊 Archive Summary:"
 ls -lh "$BUILD_DIR"/*.zip
 echo ""
-echo "🎉 Done! Upload these to GitHub Releases with tag 'data-v2'"
+echo "🎉 Done! Upload these (with .sha256 files) to GitHub Releases with tag 'data-v2'"
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+⚖️ АДАПТИВНАЯ ГЛУБИНА ПЕРЕРАНЖИРОВАНИЯ
+
+Cross-encoder - самая дорогая часть поиска на CPU, а нужен он не всегда:
+- если у гибридного списка явный лидер (большой отрыв по RRF, и вектор
+  с BM25 оба ставят его первым), переранжирование пропускается;
+- иначе кандидаты оцениваются небольшими пачками в порядке RRF, и как только
+  очередная пачка не меняет верх выдачи, оставшиеся не оцениваются -
+  они идут после оцененных в прежнем порядке.
+"""
+
+from typing import Callable, Dict, List, Sequence, Tuple, Any
+
+# Относительный отрыв лидера по RRF от второго места
+CLEAR_WINNER_MARGIN = 0.25
+# Сколько документов оценивать за раз
+RERANK_BATCH_SIZE = 4
+# Сколько первых мест должно перестать меняться
+RERANK_STABLE_K = 3
+
+
+def has_clear_winner(candidates: Sequence[Dict[str, Any]], margin: float = CLEAR_WINNER_MARGIN) -> bool:
+    """
+    Есть ли у списка (в порядке RRF, поле 'score') явный лидер, которого
+    cross-encoder все равно не сдвинет.
+    """
+    if len(candidates) < 2:
+        return True
+    first, second = candidates[0], candidates[1]
+    # Оба поиска должны согласиться: лидер первый и в векторном, и в BM25
+    if first.get('vector_rank') != 1 or first.get('keyword_rank') != 1:
+        return False
+    if first['score'] <= 0:
+        return False
+    return (first['score'] - second['score']) / first['score'] >= margin
+
+
+def progressive_rerank(score_batch: Callable[[List[int]], List[float]], count: int,
+                       stable_k: int = RERANK_STABLE_K,
+                       batch_size: int = RERANK_BATCH_SIZE) -> Tuple[List[int], Dict[int, float]]:
+    """
+    Оценивает кандидатов 0..count-1 пачками, пока верхние stable_k мест меняются.
+
+    Args:
+        score_batch: позиции кандидатов → их оценки (в том же порядке)
+        count: число кандидатов (в порядке RRF)
+
+    Returns:
+        (порядок позиций: оцененные по убыванию оценки, затем неоцененные,
+         оценки оцененных позиций)
+    """
+    scores: Dict[int, float] = {}
+    head: List[int] = []
+    position = 0
+    while position < count:
+        batch = list(range(position, min(position + batch_size, count)))
+        position = batch[-1] + 1
+        for i, score in zip(batch, score_batch(batch)):
+            scores[i] = float(score)
+
+        ranked = sorted(scores, key=lambda i: scores[i], reverse=True)
+        new_head = ranked[:stable_k]
+        # Верх стабилен: набран целиком и пачка ничего в него не добавила
+        if len(new_head) == stable_k and new_head == head:
+            break
+        head = new_head
+
+    ranked = sorted(scores, key=lambda i: scores[i], reverse=True)
+    return ranked + list(range(position, count)), scores
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+🏁 ОФФЛАЙН БЕНЧМАРК ПОИСКА
+
+Воспроизводимый замер настоящего RAGEngine без сети:
+- корпус - синтетический (генерируется по seed) или готовые данные (--data-dir);
+- Gemini заменен детерминированным HashBackend (feature hashing слов),
+  поэтому векторный поиск осмысленный, а результаты повторяются от запуска к запуску;
+- набор запросов проигрывается с return_timings=True.
+
+Отчет (JSON): QPS, p50/p95/p99 по каждому этапу поиска, пиковый RSS,
+время запуска движка, recall@k и MRR по размеченному набору. С --baseline
+отчет сравнивается с предыдущим, и при регрессии код возврата 1.
+
+Формат размеченного набора (--queries):
+    [{"query": "...", "relevant": [["book", "chapter_file", chunk_idx], ...]}, ...]
+
+ЗАПУСК:
+    python rag/benchmark.py --synthetic --output bench.json
+    python rag/benchmark.py --data-dir rag --language ru --queries labelled.json --baseline bench.json
+
+Для готовых данных запросы эмбеддятся тем бэкендом, которым построен индекс
+(Gemini требует сеть и GEMINI_API_KEY, local - нет).
+"""
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+try:
+    from rag.rag_engine import RAGEngine, RerankerModel
+    from rag.embedding_backends import EmbeddingBackend, HashBackend
+except ImportError:
+    from rag_engine import RAGEngine, RerankerModel
+    from embedding_backends import EmbeddingBackend, HashBackend
+
+PERCENTILES = (50, 95, 99)
+
+
+class DisabledReranker:
+    """Переранжирование выключено (как RerankerModel без загруженной модели)."""
+    model = None
+
+    def rerank(self, query: str, documents: List[str], top_k: int = 5):
+        return [(i, 1.0, doc) for i, doc in enumerate(documents)][:top_k]
+
+
+def build_synthetic_corpus(base_dir: str, language: str = 'en', num_books: int = 4,
+                           chapters_per_book: int = 25, chunks_per_chapter: int = 20,
+                           words_per_chunk: int = 60, num_queries: int = 100,
+                           vocabulary_size: int = 5000, embedder: Optional[EmbeddingBackend] = None,
+                           seed: int = 42) -> List[Dict[str, Any]]:
+    """
+    Пишет в base_dir файлы в формате RAGEngine (чанки, индекс, метаданные)
+    и возвращает размеченный набор запросов: каждый запрос - несколько слов
+    одного чанка, релевантен этот чанк.
+    """
+    embedder = embedder or HashBackend()
+    rng = np.random.default_rng(seed)
+    base = Path(base_dir)
+    base.mkdir(parents=True, exist_ok=True)
+
+    syllables = ['ka', 'ri', 'sna', 'dha', 'ma', 'yo', 'ga', 'bha', 'kti', 've', 'da', 'nta', 'pra', 'bhu', 'sa', 'tya']
+    vocabulary = sorted({''.join(rng.choice(syllables, size=rng.integers(2, 5))) for _ in range(vocabulary_size * 2)})
+    vocabulary = vocabulary[:vocabulary_size]
+    # Частоты слов по закону Ципфа, как в живом тексте
+    weights = 1.0 / np.arange(1, len(vocabulary) + 1)
+    weights /= weights.sum()
+
+    chunks_data: Dict[str, Dict[str, List[str]]] = {}
+    structure: Dict[str, Dict[str, Any]] = {}
+    rows, texts = [], []
+    for b in range(num_books):
+        book = f"book{b}"
+        chunks_data[book], structure[book] = {}, {}
+        for c in range(chapters_per_book):
+            chapter = f"{book}/{c + 1}.html"
+            chunks = [' '.join(rng.choice(vocabulary, size=words_per_chunk, p=weights))
+                      for _ in range(chunks_per_chapter)]
+            chunks_data[book][chapter] = chunks
+            structure[book][chapter] = {'html_path': chapter}
+            for chunk_idx, text in enumerate(chunks):
+                rows.append([book, chapter, chunk_idx])
+                texts.append(text)
+
+    with open(base / f"chunked_scriptures_{language}.json", 'w', encoding='utf-8') as f:
+        json.dump(chunks_data, f, ensure_ascii=False)
+
+    embeddings = embedder.embed_documents(texts)
+    index = faiss.IndexFlatIP(embedder.dim)
+    index.add(embeddings)
+    faiss.write_index(index, str(base / f"faiss_index_{language}.bin"))
+
+    with open(base / f"faiss_metadata_{language}.json", 'w', encoding='utf-8') as f:
+        json.dump({
+            'rows': rows,
+            'text_previews': [text[:200] for text in texts],
+            'structure': structure,
+            'index_config': {'spec': 'Flat', 'metric': 'ip'},
+            'embedding_backend': embedder.describe()
+        }, f, ensure_ascii=False)
+
+    queries = []
+    for row_id in rng.choice(len(rows), size=min(num_queries, len(rows)), replace=False):
+        words = texts[row_id].split()
+        start = int(rng.integers(0, len(words) - 8))
+        queries.append({'query': ' '.join(words[start:start + 8]), 'relevant': [rows[row_id]]})
+    return queries
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Пиковый RSS процесса (None, если платформа не дает его узнать)."""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux отдает КБ, macOS - байты
+        return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return round(getattr(info, 'peak_wset', info.rss) / (1024 * 1024), 1)
+    except ImportError:
+        return None
+
+
+def _locations(result: Dict[str, Any]) -> List[Tuple[str, str, int]]:
+    locations = [(result.get('book'), result.get('chapter'), result.get('chunk_idx'))]
+    locations.extend((s['book'], s['chapter'], s['chunk_idx']) for s in result.get('sources', []))
+    return locations
+
+
+def relevance_scores(results: List[Dict[str, Any]], relevant: List) -> Tuple[float, float]:
+    """(recall@k, reciprocal rank) одного запроса."""
+    relevant = {tuple(item) for item in relevant}
+    found, reciprocal_rank = set(), 0.0
+    for rank, result in enumerate(results, 1):
+        hits = relevant.intersection(_locations(result))
+        if hits and not reciprocal_rank:
+            reciprocal_rank = 1.0 / rank
+        found |= hits
+    return (len(found) / len(relevant) if relevant else 0.0), reciprocal_rank
+
+
+def _summarize(values: List[float]) -> Dict[str, float]:
+    array = np.asarray(values, dtype='float64')
+    summary = {f"p{p}": round(float(np.percentile(array, p)), 3) for p in PERCENTILES}
+    summary['mean'] = round(float(array.mean()), 3)
+    return summary
+
+
+def run_benchmark(base_dir: str, queries: List[Dict[str, Any]], language: str = 'en', top_k: int = 10,
+                  repeats: int = 1, warmup: int = 5, embedder: Optional[EmbeddingBackend] = None,
+                  reranker=None, search_options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Запускает движок на данных base_dir и проигрывает queries repeats раз.
+    embedder=None - бэкенд, которым построен индекс (для синтетического корпуса - HashBackend).
+    reranker=None - без переранжирования (DisabledReranker).
+    """
+    search_options = dict(search_options or {})
+
+    start_time = time.perf_counter()
+    engine = RAGEngine(languages=[language], base_dir=base_dir, reranker=reranker or DisabledReranker(),
+                       embedding_backend=embedder)
+    startup_seconds = time.perf_counter() - start_time
+    if language not in engine.indices:
+        raise FileNotFoundError(f"В {base_dir} нет индекса для языка {language}")
+    backend = engine.embedding_backends[language]
+
+    for item in queries[:warmup]:
+        engine.search(item['query'], language=language, top_k=top_k, **search_options)
+
+    stage_timings: Dict[str, List[float]] = {}
+    recalls, reciprocal_ranks, errors = [], [], 0
+    replay_start = time.perf_counter()
+    for _ in range(repeats):
+        for item in queries:
+            response = engine.search(item['query'], language=language, top_k=top_k,
+                                     return_timings=True, **search_options)
+            for stage, ms in response.get('timings', {}).items():
+                stage_timings.setdefault(stage, []).append(ms)
+            if not response.get('success'):
+                errors += 1
+                continue
+            if item.get('relevant'):
+                recall, reciprocal_rank = relevance_scores(response['results'], item['relevant'])
+                recalls.append(recall)
+                reciprocal_ranks.append(reciprocal_rank)
+    replay_seconds = time.perf_counter() - replay_start
+    total_queries = len(queries) * repeats
+
+    return {
+        'config': {
+            'base_dir': str(base_dir),
+            'language': language,
+            'top_k': top_k,
+            'queries': len(queries),
+            'repeats': repeats,
+            'vectors': int(engine.indices[language].ntotal),
+            'index': engine.index_configs.get(language, {}).get('spec'),
+            'reranker': type(engine.reranker).__name__,
+            'embedding_backend': backend.describe(),
+            'search_options': search_options
+        },
+        'startup_seconds': round(startup_seconds, 3),
+        'qps': round(total_queries / replay_seconds, 2) if replay_seconds > 0 else None,
+        'errors': errors,
+        'latency_ms': {stage: _summarize(values) for stage, values in sorted(stage_timings.items())},
+        'peak_rss_mb': peak_rss_mb(),
+        'relevance': {
+            f'recall@{top_k}': round(float(np.mean(recalls)), 4) if recalls else None,
+            'mrr': round(float(np.mean(reciprocal_ranks)), 4) if reciprocal_ranks else None,
+            'labelled_queries': len(recalls)
+        }
+    }
+
+
+def compare_to_baseline(report: Dict[str, Any], baseline: Dict[str, Any],
+                        latency_tolerance: float = 0.10, relevance_tolerance: float = 0.01) -> List[str]:
+    """Список регрессий отчета относительно baseline (пустой - все в порядке)."""
+    regressions = []
+    old_latency = baseline.get('latency_ms', {})
+    for stage, summary in report.get('latency_ms', {}).items():
+        for percentile in ('p95', 'p99'):
+            old, new = old_latency.get(stage, {}).get(percentile), summary.get(percentile)
+            # Доли миллисекунды - шум таймера, а не регрессия
+            if old and new and new > old * (1 + latency_tolerance) and new - old > 0.5:
+                regressions.append(f"{stage} {percentile}: {old:.2f} → {new:.2f} мс")
+
+    old_qps, new_qps = baseline.get('qps'), report.get('qps')
+    if old_qps and new_qps and new_qps < old_qps * (1 - latency_tolerance):
+        regressions.append(f"QPS: {old_qps:.1f} → {new_qps:.1f}")
+
+    for metric, new in report.get('relevance', {}).items():
+        old = baseline.get('relevance', {}).get(metric)
+        if metric != 'labelled_queries' and old is not None and new is not None and new < old - relevance_tolerance:
+            regressions.append(f"{metric}: {old:.4f} → {new:.4f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Оффлайн бенчмарк RAGEngine.search")
+    parser.add_argument('--synthetic', action='store_true', help="сгенерировать синтетический корпус")
+    parser.add_argument('--data-dir', default='rag', help="папка с индексом (если не --synthetic)")
+    parser.add_argument('--language', default='en')
+    parser.add_argument('--queries', help="JSON с размеченными запросами")
+    parser.add_argument('--chunks', type=int, default=2000, help="размер синтетического корпуса")
+    parser.add_argument('--num-queries', type=int, default=100)
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--reranker', choices=['none', 'jina'], default='none')
+    parser.add_argument('--output', help="куда записать отчет JSON")
+    parser.add_argument('--baseline', help="отчет для сравнения")
+    args = parser.parse_args()
+
+    queries = []
+    if args.queries:
+        with open(args.queries, 'r', encoding='utf-8') as f:
+            queries = json.load(f)
+
+    reranker = None
+    if args.reranker == 'jina':
+        reranker = RerankerModel()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_dir = args.data_dir
+        if args.synthetic:
+            data_dir = tmp_dir
+            chapters = max(1, args.chunks // (4 * 20))
+            print(f"🧪 Генерирую синтетический корпус (~{chapters * 4 * 20:,} чанков)...")
+            generated = build_synthetic_corpus(tmp_dir, args.language, chapters_per_book=chapters,
+                                               num_queries=args.num_queries, seed=args.seed)
+            queries = queries or generated
+        if not queries:
+            parser.error("нужен --queries (или --synthetic)")
+
+        print(f"🏁 Проигрываю {len(queries)} запросов x{args.repeats}...")
+        report = run_benchmark(data_dir, queries, args.language, top_k=args.top_k,
+                               repeats=args.repeats, reranker=reranker)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+        print(f"💾 Отчет сохранен: {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare_to_baseline(report, json.load(f))
+        if regressions:
+            print("❌ Регрессии относительно baseline:")
+            for line in regressions:
+                print(f"   - {line}")
+            sys.exit(1)
+        print("✅ Регрессий относительно baseline нет")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+🧬 ДЕДУПЛИКАЦИЯ ЧАНКОВ (MinHash + LSH)
+
+Одинаковые и почти одинаковые чанки (повторяющиеся комментарии в разных
+изданиях, заголовки, дубли от вложенных тегов) находятся до генерации
+эмбеддингов:
+- текст нормализуется и режется на шинглы из shingle_size слов;
+- для каждого чанка считается MinHash-сигнатура (num_perm хешей);
+- кандидаты ищутся через LSH (сигнатура делится на bands полос),
+  а подтверждаются оценкой сходства Жаккара по сигнатурам.
+
+Каждый чанк сравнивается только с каноническими чанками (первыми в порядке
+генерации эмбеддингов), поэтому цепочек A≈B≈C, где A и C не похожи, не бывает.
+Результат - rag/chunk_duplicates_{lang}.json: дубликат → канонический чанк.
+Сам chunked_scriptures_{lang}.json не меняется.
+
+ЗАПУСК:
+    python rag/chunk_dedup.py [ru|en] [--threshold 0.9]
+"""
+
+import argparse
+import json
+import re
+import time
+import zlib
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Tuple, Optional
+
+import numpy as np
+
+# (book, file, chunk_idx)
+ChunkKey = Tuple[str, str, int]
+
+MERSENNE_PRIME = (1 << 31) - 1
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def duplicates_file_name(language: str) -> str:
+    return f"chunk_duplicates_{language}.json"
+
+
+def iter_chunks(chunks_data: Dict[str, Dict[str, List[str]]]):
+    """Чанки в том же порядке, в котором их обходит генератор эмбеддингов."""
+    for book_name in sorted(chunks_data.keys()):
+        for file_path in sorted(chunks_data[book_name].keys()):
+            for chunk_idx, chunk_text in enumerate(chunks_data[book_name][file_path]):
+                yield (book_name, file_path, chunk_idx), chunk_text
+
+
+class MinHashDeduplicator:
+    """Поиск почти-дубликатов среди чанков."""
+
+    def __init__(self, num_perm: int = 128, bands: int = 32, shingle_size: int = 5,
+                 threshold: float = 0.9, seed: int = 1):
+        """
+        Args:
+            num_perm: число хеш-функций MinHash (точность оценки сходства ~ 1/sqrt(num_perm))
+            bands: число полос LSH (num_perm должно делиться на bands)
+            shingle_size: длина шингла в словах
+            threshold: минимальное сходство Жаккара, при котором чанк считается дубликатом
+        """
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) должно делиться на bands ({bands})")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows_per_band = num_perm // bands
+        self.shingle_size = shingle_size
+        self.threshold = threshold
+
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+
+    def shingles(self, text: str) -> np.ndarray:
+        """Хеши шинглов (crc32 - стабильно между запусками, в отличие от hash())."""
+        words = WORD_RE.findall(text.lower())
+        if not words:
+            return np.empty(0, dtype=np.uint64)
+        size = min(self.shingle_size, len(words))
+        values = {zlib.crc32(' '.join(words[i:i + size]).encode('utf-8'))
+                  for i in range(len(words) - size + 1)}
+        return np.fromiter(values, dtype=np.uint64, count=len(values)) % np.uint64(MERSENNE_PRIME)
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        """MinHash-сигнатура текста; None для текста без слов."""
+        values = self.shingles(text)
+        if values.size == 0:
+            return None
+        # (a * x + b) mod p: a, x < 2^31, поэтому произведение помещается в uint64
+        hashed = (np.outer(values, self._a) + self._b) % np.uint64(MERSENNE_PRIME)
+        return hashed.min(axis=0).astype(np.uint32)
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        bands = signature.reshape(self.bands, self.rows_per_band)
+        return [i.to_bytes(2, 'little') + band.tobytes() for i, band in enumerate(bands)]
+
+    def find_duplicates(self, chunks_data: Dict[str, Dict[str, List[str]]],
+                        verbose: bool = True) -> Dict[ChunkKey, ChunkKey]:
+        """
+        Returns:
+            словарь дубликат → канонический чанк (канонические в словарь не входят)
+        """
+        buckets: Dict[bytes, List[int]] = defaultdict(list)
+        canonical_keys: List[ChunkKey] = []
+        canonical_signatures: List[np.ndarray] = []
+        duplicates: Dict[ChunkKey, ChunkKey] = {}
+
+        start_time = time.time()
+        for count, (key, text) in enumerate(iter_chunks(chunks_data), 1):
+            signature = self.signature(text)
+            if signature is None:
+                continue
+            band_keys = self._band_keys(signature)
+
+            best_id, best_similarity = None, self.threshold
+            candidates = {candidate for band_key in band_keys for candidate in buckets.get(band_key, ())}
+            for candidate in sorted(candidates):
+                similarity = float(np.mean(canonical_signatures[candidate] == signature))
+                if similarity >= best_similarity:
+                    best_id, best_similarity = candidate, similarity
+
+            if best_id is not None:
+                duplicates[key] = canonical_keys[best_id]
+            else:
+                canonical_id = len(canonical_keys)
+                canonical_keys.append(key)
+                canonical_signatures.append(signature)
+                for band_key in band_keys:
+                    buckets[band_key].append(canonical_id)
+
+            if verbose and count % 10000 == 0:
+                print(f"    ⏳ {count:,} чанков, дубликатов: {len(duplicates):,} ({time.time() - start_time:.0f} сек)")
+
+        return duplicates
+
+
+def save_duplicates(duplicates: Dict[ChunkKey, ChunkKey], language: str, base_dir: str = 'rag',
+                    params: Optional[Dict] = None) -> str:
+    output_file = Path(base_dir) / duplicates_file_name(language)
+    data = dict(params or {})
+    data['duplicates'] = [list(duplicate) + list(canonical) for duplicate, canonical in duplicates.items()]
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    return str(output_file)
+
+
+def load_duplicates(language: str, base_dir: str = 'rag') -> Dict[ChunkKey, ChunkKey]:
+    """Читает chunk_duplicates_{lang}.json (пустой словарь, если файла нет)."""
+    path = Path(base_dir) / duplicates_file_name(language)
+    if not path.exists():
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return {(b, f_, int(i)): (cb, cf, int(ci)) for b, f_, i, cb, cf, ci in data.get('duplicates', [])}
+
+
+def sources_by_canonical(duplicates: Dict[ChunkKey, ChunkKey]) -> Dict[ChunkKey, List[ChunkKey]]:
+    """Канонический чанк → все места, где встречается его текст (кроме него самого)."""
+    sources: Dict[ChunkKey, List[ChunkKey]] = defaultdict(list)
+    for duplicate, canonical in sorted(duplicates.items()):
+        sources[canonical].append(duplicate)
+    return dict(sources)
+
+
+def process_language(language: str, threshold: float = 0.9, base_dir: str = 'rag') -> Optional[Dict]:
+    chunked_file = Path(base_dir) / f"chunked_scriptures_{language}.json"
+    if not chunked_file.exists():
+        print(f"⚠️  Файл {chunked_file} не найден. Пропускаю {language}.")
+        return None
+
+    with open(chunked_file, 'r', encoding='utf-8') as f:
+        chunks_data = json.load(f)
+    total = sum(len(chunks) for book in chunks_data.values() for chunks in book.values())
+
+    print(f"\n🧬 Ищу дубликаты среди {total:,} чанков ({language}, порог {threshold})...")
+    deduplicator = MinHashDeduplicator(threshold=threshold)
+    duplicates = deduplicator.find_duplicates(chunks_data)
+    output_file = save_duplicates(duplicates, language, base_dir, params={
+        'threshold': threshold,
+        'num_perm': deduplicator.num_perm,
+        'shingle_size': deduplicator.shingle_size
+    })
+    print(f"✅ Дубликатов: {len(duplicates):,} из {total:,} ({len(duplicates) / max(total, 1):.1%}) → {output_file}")
+    return {'language': language, 'total_chunks': total, 'duplicates': len(duplicates), 'output_file': output_file}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Поиск почти-дубликатов чанков (MinHash + LSH)")
+    parser.add_argument('language', nargs='?', default='all', choices=['ru', 'en', 'all'])
+    parser.add_argument('--threshold', type=float, default=0.9, help="минимальное сходство Жаккара")
+    args = parser.parse_args()
+
+    for lang in (['ru', 'en'] if args.language == 'all' else [args.language]):
+        process_language(lang, threshold=args.threshold)
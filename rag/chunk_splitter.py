@@ -4,7 +4,8 @@
 ✂️  РАЗБИЕНИЕ ТЕКСТА НА ЧАНКИ ДЛЯ RAG
 
 Этот модуль разбивает большие текстовые фрагменты на чанки оптимального размера
-с перекрытием для лучшего контекста.
+с перекрытием для лучшего контекста, а затем ищет почти-дубликаты чанков
+(rag/chunk_dedup.py), чтобы не тратить на них эмбеддинги и место в индексе.
 
 ЗАПУСК:
     python rag/chunk_splitter.py
@@ -15,18 +16,25 @@ from pathlib import Path
 from typing import List, Dict
 import time
 
+try:
+    from rag.chunk_dedup import MinHashDeduplicator, save_duplicates
+except ImportError:
+    from chunk_dedup import MinHashDeduplicator, save_duplicates
+
 
 class ChunkSplitter:
     """Разбивает текст на чанки с перекрытием"""
     
-    def __init__(self, chunk_size=2048, overlap=256):
+    def __init__(self, chunk_size=2048, overlap=256, dedup_threshold=0.9):
         """
         Args:
             chunk_size: размер чанка в символах (увеличен с 512 для скорости)
             overlap: перекрытие между чанками в символах (увеличено с 64)
+            dedup_threshold: порог сходства для почти-дубликатов (None - не искать)
         """
         self.chunk_size = chunk_size
         self.overlap = overlap
+        self.dedup_threshold = dedup_threshold
     
     def split_text(self, text: str) -> List[str]:
         """
@@ -174,12 +182,26 @@ class ChunkSplitter:
         file_size = Path(output_file).stat().st_size / (1024*1024)
         elapsed = time.time() - start_time
         print(f"✅ Файл сохранён! Размер: {file_size:.2f} МБ")
+
+        duplicates_count = None
+        if self.dedup_threshold is not None:
+            print(f"\n🧬 Ищу почти-дубликаты чанков (порог {self.dedup_threshold})...")
+            deduplicator = MinHashDeduplicator(threshold=self.dedup_threshold)
+            duplicates = deduplicator.find_duplicates(chunked_data)
+            duplicates_file = save_duplicates(duplicates, language, params={
+                'threshold': self.dedup_threshold,
+                'num_perm': deduplicator.num_perm,
+                'shingle_size': deduplicator.shingle_size
+            })
+            duplicates_count = len(duplicates)
+            print(f"✅ Дубликатов: {duplicates_count:,} из {total_chunks:,} → {duplicates_file}")
         print(f"⏱️  Время обработки: {elapsed:.1f} сек ({elapsed/60:.1f} мин)")
         # Собираем статистику
         stats = {
             'language': language,
             'total_books': len(chunked_data),
             'total_chunks': total_chunks,
+            'duplicate_chunks': duplicates_count,
             'chunk_size': self.chunk_size,
             'overlap': self.overlap,
             'output_file': output_file,
@@ -223,6 +245,8 @@ def process_all_languages():
         if stats:
             print(f"   📚 Книг: {stats['total_books']}")
             print(f"   📄 Всего чанков: {stats['total_chunks']}")
+            if stats.get('duplicate_chunks') is not None:
+                print(f"   🧬 Дубликатов (не пойдут в эмбеддинги): {stats['duplicate_chunks']}")
             print(f"   💾 Размер файла: {stats['file_size_mb']:.2f} МБ")
             print(f"   ⏱️  Время: {stats['elapsed_seconds']:.1f} сек")
             print(f"   📝 Параметры: chunk_size={stats['chunk_size']}, overlap={stats['overlap']}")
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+🔌 ПРЕДОХРАНИТЕЛЬ ДЛЯ ВНЕШНИХ ВЫЗОВОВ
+
+Если API эмбеддингов лежит, каждый поиск ждал бы тот же падающий сетевой вызов.
+CircuitBreaker считает долю ошибок (таймаут - тоже ошибка) по последним вызовам:
+- closed    - вызовы идут как обычно;
+- open      - доля ошибок превысила порог: вызовы сразу отклоняются (CircuitOpenError)
+              в течение reset_timeout секунд;
+- half_open - после паузы пропускается один пробный вызов: успех закрывает
+              предохранитель, ошибка снова открывает.
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict
+
+try:
+    from rag.metrics import CIRCUIT_STATE, CIRCUIT_REJECTIONS
+except ImportError:
+    from metrics import CIRCUIT_STATE, CIRCUIT_REJECTIONS
+
+CLOSED = 'closed'
+HALF_OPEN = 'half_open'
+OPEN = 'open'
+STATE_CODES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(RuntimeError):
+    """Вызов отклонен без попытки: предохранитель открыт."""
+
+
+class CircuitBusyError(RuntimeError):
+    """Все потоки предохранителя заняты: вызов не начался за call_timeout (ошибкой API не считается)."""
+
+
+class CircuitBreaker:
+    """Предохранитель с таймаутом вызова, долей ошибок по окну и пробным вызовом."""
+
+    def __init__(self, name: str, failure_rate: float = 0.5, window: int = 10, min_calls: int = 3,
+                 reset_timeout: float = 30.0, call_timeout: float = 10.0, max_workers: int = 16,
+                 clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.reset_timeout = reset_timeout
+        self.call_timeout = call_timeout
+        self.max_workers = max_workers
+        self.clock = clock
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.last_error = None
+        self._results: deque = deque(maxlen=window) # True - успех
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        self._executor = None # потоки для вызовов с таймаутом (создаются при первом вызове)
+        CIRCUIT_STATE.set(STATE_CODES[self.state], name=name)
+
+    def _set_state(self, state: str):
+        self.state = state
+        CIRCUIT_STATE.set(STATE_CODES[state], name=self.name)
+
+    def rejecting(self) -> bool:
+        """Будет ли вызов сейчас отклонен (не занимает пробный вызов)."""
+        with self._lock:
+            if self.state == OPEN:
+                return self.clock() - self.opened_at < self.reset_timeout
+            return self.state == HALF_OPEN and self._probe_in_flight
+
+    def _acquire(self) -> bool:
+        with self._lock:
+            if self.state == OPEN:
+                if self.clock() - self.opened_at < self.reset_timeout:
+                    return False
+                self._set_state(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self._probe_in_flight:
+                    return False
+                self._probe_in_flight = True
+            return True
+
+    def _record(self, success: bool, error: Exception = None):
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probe_in_flight = False
+                self._results.clear()
+                if success:
+                    self._set_state(CLOSED)
+                else:
+                    self.opened_at = self.clock()
+                    self._set_state(OPEN)
+            else:
+                self._results.append(success)
+                failures = self._results.count(False)
+                if len(self._results) >= self.min_calls and failures / len(self._results) >= self.failure_rate:
+                    self.opened_at = self.clock()
+                    self._set_state(OPEN)
+            if error is not None:
+                self.last_error = f"{type(error).__name__}: {error}"
+
+    def _release_probe(self):
+        with self._lock:
+            self._probe_in_flight = False
+
+    def _run(self, func: Callable, *args, **kwargs):
+        if not self.call_timeout:
+            return func(*args, **kwargs)
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix=f"breaker-{self.name}")
+            executor = self._executor
+        started = threading.Event()
+
+        def timed():
+            started.set()
+            return func(*args, **kwargs)
+
+        future = executor.submit(timed)
+        # Таймаут считается с начала вызова: ожидание свободного потока - не вина API
+        if not started.wait(self.call_timeout):
+            if future.cancel():
+                raise CircuitBusyError(f"{self.name}: все {self.max_workers} потоков заняты")
+            started.wait()
+        try:
+            return future.result(timeout=self.call_timeout)
+        except FutureTimeoutError:
+            # Зависший вызов дорабатывает в фоне, запрос его больше не ждет
+            raise TimeoutError(f"{self.name}: нет ответа за {self.call_timeout} сек")
+
+    def call(self, func: Callable, *args, **kwargs) -> Any:
+        if not self._acquire():
+            CIRCUIT_REJECTIONS.inc(name=self.name)
+            raise CircuitOpenError(f"{self.name}: предохранитель открыт ({self.last_error})")
+        try:
+            result = self._run(func, *args, **kwargs)
+        except CircuitBusyError:
+            self._release_probe()
+            raise
+        except Exception as e:
+            self._record(False, e)
+            raise
+        self._record(True)
+        return result
+
+    def close(self):
+        """Останавливает потоки вызовов (движок освобожден); зависшие вызовы дорабатывают сами."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'state': self.state, 'failures': self._results.count(False), 'calls': len(self._results),
+                    'last_error': self.last_error}
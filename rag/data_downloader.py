@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+⬇️ ВОЗОБНОВЛЯЕМОЕ СКАЧИВАНИЕ ДАННЫХ
+
+Архив базы знаний (сотни МБ) скачивается HTTP Range-запросами:
+- файл делится на сегменты, которые качаются параллельно;
+- данные пишутся сразу на свои смещения в `<файл>.part`, а прогресс сегментов
+  сохраняется в `<файл>.part.json`, поэтому после обрыва или перезапуска
+  скачивание продолжается с того же места;
+- по завершении проверяется SHA-256 (если известен) и `.part` атомарно
+  переименовывается в итоговый файл.
+
+Если сервер не поддерживает Range или не сообщает размер, используется
+обычное последовательное скачивание одним потоком.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Any, List, Optional
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 256 * 1024
+DEFAULT_SEGMENTS = 4
+# Сегменты меньше этого размера не имеет смысла качать отдельно
+MIN_SEGMENT_SIZE = 4 * 1024 * 1024
+# Как часто (в секундах) сбрасывать прогресс сегментов на диск
+STATE_SAVE_INTERVAL = 1.0
+# Хвост файла качается отдельным сегментом первым: там лежит оглавление zip,
+# по которому можно распаковывать архив, не дожидаясь конца скачивания
+TAIL_SEGMENT_SIZE = 1024 * 1024
+
+# progress_callback(downloaded_bytes, total_bytes, speed_bytes_per_sec)
+ProgressCallback = Callable[[int, int, float], None]
+
+
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """SHA-256 файла, читается потоково."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def fetch_expected_sha256(url: str, timeout: int = 15) -> Optional[str]:
+    """
+    Пытается получить контрольную сумму из соседнего файла `<url>.sha256`
+    (формат sha256sum: "<hex>  <имя>"). Возвращает None, если его нет.
+    """
+    try:
+        response = requests.get(url + '.sha256', timeout=timeout)
+        if response.status_code != 200:
+            return None
+        value = response.text.strip().split()[0].lower()
+        return value if len(value) == 64 else None
+    except Exception as e:
+        logger.warning(f"⚠️ Could not fetch checksum for {url}: {e}")
+        return None
+
+
+class DownloadError(Exception):
+    """Скачивание не удалось (после всех повторов) или файл поврежден."""
+
+
+class RangeDownloader:
+    """
+    Параллельное возобновляемое скачивание одного файла.
+
+    Использование:
+        downloader = RangeDownloader(url, "data.zip", expected_sha256=sha)
+        downloader.download()
+
+    Пока идет скачивание, другие потоки могут ждать готовности любого
+    диапазона байт через wait_for_range() и читать его из part_path.
+    """
+
+    def __init__(self, url: str, destination: str, num_segments: int = DEFAULT_SEGMENTS,
+                 expected_sha256: Optional[str] = None, progress_callback: Optional[ProgressCallback] = None,
+                 timeout: int = 30, max_retries: int = 5, chunk_size: int = CHUNK_SIZE,
+                 min_segment_size: int = MIN_SEGMENT_SIZE):
+        self.url = url
+        self.destination = destination
+        self.part_path = destination + '.part'
+        self.state_path = destination + '.part.json'
+        self.num_segments = max(1, num_segments)
+        self.expected_sha256 = expected_sha256.lower() if expected_sha256 else None
+        self.progress_callback = progress_callback
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.chunk_size = chunk_size
+        self.min_segment_size = min_segment_size
+
+        self._lock = threading.Condition()
+        self._ready = threading.Event()
+        self._finished = False
+        self._state: Dict[str, Any] = {}
+        self._last_state_save = 0.0
+        self._session_bytes = 0
+        self._started_at = 0.0
+
+    # --- Разведка ---
+
+    def _probe(self) -> Dict[str, Any]:
+        """Узнает размер файла, поддержку Range и ETag одним запросом первого байта."""
+        with requests.get(self.url, headers={'Range': 'bytes=0-0'}, stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()
+            info = {
+                'etag': response.headers.get('ETag') or response.headers.get('Last-Modified'),
+                'accept_ranges': False,
+                'size': 0
+            }
+            content_range = response.headers.get('Content-Range', '')
+            if response.status_code == 206 and '/' in content_range:
+                total = content_range.rsplit('/', 1)[1]
+                if total.isdigit():
+                    info['size'] = int(total)
+                    info['accept_ranges'] = True
+            else:
+                info['size'] = int(response.headers.get('Content-Length', 0) or 0)
+            return info
+
+    # --- Состояние сегментов ---
+
+    def _plan_segments(self, size: int) -> List[Dict[str, int]]:
+        tail_size = TAIL_SEGMENT_SIZE if size > 2 * TAIL_SEGMENT_SIZE else 0
+        body_size = size - tail_size
+        count = max(1, min(self.num_segments, body_size // self.min_segment_size or 1))
+        step = body_size // count
+        segments = []
+        if tail_size:
+            segments.append({'start': body_size, 'end': size - 1, 'done': 0})
+        for i in range(count):
+            start = i * step
+            end = body_size - 1 if i == count - 1 else start + step - 1
+            segments.append({'start': start, 'end': end, 'done': 0})
+        return segments
+
+    def _load_state(self, probe: Dict[str, Any]) -> bool:
+        """Подхватывает незавершенное скачивание, если оно относится к тому же файлу."""
+        if not (os.path.exists(self.state_path) and os.path.exists(self.part_path)):
+            return False
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if state.get('url') != self.url or state.get('size') != probe['size'] or state.get('etag') != probe['etag']:
+            logger.info("Partial download belongs to another file version, starting over.")
+            return False
+        if os.path.getsize(self.part_path) != probe['size']:
+            return False
+        self._state = state
+        return True
+
+    def _save_state(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._last_state_save < STATE_SAVE_INTERVAL:
+            return
+        self._last_state_save = now
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._state, f)
+        os.replace(tmp_path, self.state_path)
+
+    def _cleanup_partial(self):
+        for path in (self.part_path, self.state_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    @property
+    def downloaded_bytes(self) -> int:
+        return sum(segment['done'] for segment in self._state.get('segments', []))
+
+    @property
+    def total_size(self) -> int:
+        return self._state.get('size', 0)
+
+    def wait_until_ready(self, timeout: Optional[float] = None) -> bool:
+        """Ждет, пока станет известен размер файла и создан .part (или скачивание завершится)."""
+        return self._ready.wait(timeout)
+
+    def _is_range_complete(self, start: int, end: int) -> bool:
+        for segment in self._state.get('segments', []):
+            if segment['end'] < start or segment['start'] >= end:
+                continue
+            if min(end, segment['end'] + 1) > segment['start'] + segment['done']:
+                return False
+        return bool(self._state)
+
+    def wait_for_range(self, start: int, end: int) -> bool:
+        """
+        Блокируется, пока байты [start, end) не окажутся на диске.
+        Возвращает False, если скачивание завершилось (в т.ч. с ошибкой), а диапазона так и нет.
+        """
+        with self._lock:
+            while not self._is_range_complete(start, end):
+                if self._finished:
+                    return False
+                self._lock.wait(1.0)
+            return True
+
+    def _report(self, written: int):
+        with self._lock:
+            self._session_bytes += written
+            elapsed = max(time.monotonic() - self._started_at, 1e-6)
+            speed = self._session_bytes / elapsed
+            downloaded = self.downloaded_bytes
+            self._save_state()
+            self._lock.notify_all()
+        if self.progress_callback:
+            self.progress_callback(downloaded, self._state['size'], speed)
+
+    # --- Скачивание ---
+
+    def _download_segment(self, segment: Dict[str, int]):
+        attempt = 0
+        while segment['start'] + segment['done'] <= segment['end']:
+            offset = segment['start'] + segment['done']
+            try:
+                headers = {'Range': f"bytes={offset}-{segment['end']}"}
+                with requests.get(self.url, headers=headers, stream=True, timeout=self.timeout) as response:
+                    if response.status_code != 206:
+                        raise DownloadError(f"Server ignored Range request (HTTP {response.status_code})")
+                    with open(self.part_path, 'r+b') as f:
+                        f.seek(offset)
+                        for chunk in response.iter_content(self.chunk_size):
+                            if not chunk:
+                                continue
+                            remaining = segment['end'] + 1 - (segment['start'] + segment['done'])
+                            chunk = chunk[:remaining]
+                            f.write(chunk)
+                            f.flush()
+                            with self._lock:
+                                segment['done'] += len(chunk)
+                            self._report(len(chunk))
+                            attempt = 0
+                            if remaining <= len(chunk):
+                                break
+                if segment['start'] + segment['done'] <= segment['end']:
+                    raise DownloadError("connection closed before the segment was complete")
+            except Exception as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise DownloadError(f"Segment {segment['start']}-{segment['end']} failed: {e}") from e
+                delay = min(2 ** attempt, 30)
+                logger.warning(f"⚠️ Segment at {offset} interrupted ({e}), retry {attempt}/{self.max_retries} in {delay}s")
+                time.sleep(delay)
+
+    def _download_sequential(self, size: int):
+        """Запасной путь: сервер не умеет Range, качаем целиком одним потоком."""
+        self._state = {'url': self.url, 'size': size, 'etag': None,
+                       'segments': [{'start': 0, 'end': max(size - 1, 0), 'done': 0}]}
+        segment = self._state['segments'][0]
+        self._ready.set()
+        with requests.get(self.url, stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()
+            with open(self.part_path, 'wb') as f:
+                for chunk in response.iter_content(self.chunk_size):
+                    if chunk:
+                        f.write(chunk)
+                        segment['done'] += len(chunk)
+                        with self._lock:
+                            self._session_bytes += len(chunk)
+                            self._lock.notify_all()
+                        if self.progress_callback:
+                            elapsed = max(time.monotonic() - self._started_at, 1e-6)
+                            self.progress_callback(segment['done'], size, self._session_bytes / elapsed)
+
+    def download(self, finalize: bool = True) -> str:
+        """
+        Скачивает файл (или докачивает .part) и возвращает путь к нему.
+
+        С finalize=False файл остается в part_path: так его можно дочитать
+        (например, распаковать) до проверки и переименования через finalize().
+        """
+        self._started_at = time.monotonic()
+        try:
+            probe = self._probe()
+
+            if not probe['accept_ranges'] or probe['size'] == 0:
+                logger.info(f"Server does not support Range requests, downloading {self.url} sequentially.")
+                self._cleanup_partial()
+                self._download_sequential(probe['size'])
+            else:
+                if self._load_state(probe):
+                    logger.info(f"▶️ Resuming download: {self.downloaded_bytes:,}/{probe['size']:,} bytes already on disk.")
+                else:
+                    self._cleanup_partial()
+                    with open(self.part_path, 'wb') as f:
+                        f.truncate(probe['size'])
+                    self._state = {'url': self.url, 'size': probe['size'], 'etag': probe['etag'],
+                                   'segments': self._plan_segments(probe['size'])}
+                    self._save_state(force=True)
+                self._ready.set()
+
+                pending = [s for s in self._state['segments'] if s['start'] + s['done'] <= s['end']]
+                logger.info(f"Downloading {probe['size']:,} bytes in {len(pending)} segment(s) from {self.url}")
+                try:
+                    with ThreadPoolExecutor(max_workers=max(1, len(pending))) as executor:
+                        for future in [executor.submit(self._download_segment, s) for s in pending]:
+                            future.result()
+                finally:
+                    with self._lock:
+                        self._save_state(force=True)
+        finally:
+            with self._lock:
+                self._finished = True
+                self._lock.notify_all()
+            self._ready.set()
+
+        if finalize:
+            return self.finalize()
+        return self.part_path
+
+    def finalize(self) -> str:
+        """Проверяет SHA-256 и атомарно переименовывает .part в итоговый файл."""
+        if self.expected_sha256:
+            actual = file_sha256(self.part_path)
+            if actual != self.expected_sha256:
+                self._cleanup_partial()
+                raise DownloadError(f"Checksum mismatch: expected {self.expected_sha256}, got {actual}")
+            logger.info("✅ Checksum verified.")
+
+        os.replace(self.part_path, self.destination)
+        try:
+            os.remove(self.state_path)
+        except FileNotFoundError:
+            pass
+        return self.destination
@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+🧾 МАНИФЕСТ ДАННЫХ И ДЕЛЬТА-ОБНОВЛЕНИЯ
+
+Рядом с архивами публикуется data_manifest.json: список файлов базы знаний
+с SHA-256 и размером. Клиент сравнивает его со своей копией манифеста и
+скачивает только изменившиеся файлы, а не весь shukabase_data_*.zip.
+
+- Обычные файлы (индексы, метаданные, BM25, эмбеддинги) публикуются как есть.
+- Папки books/<lang> из тысяч HTML публикуются одним zip на язык (bundle);
+  их хеш считается по содержимому (путь + SHA-256 каждого файла), поэтому
+  его можно проверить у уже установленных данных без архива.
+
+Файлы сначала скачиваются (с докачкой) в .update_staging внутри папки данных,
+а затем заменяются через os.replace.
+
+ЗАПУСК (сборка манифеста для релиза):
+    python rag/data_manifest.py <папка_с_данными> --version 3 --output builds/data_update
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import zipfile
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+from urllib.parse import urljoin
+
+import requests
+
+try:
+    from rag.data_downloader import RangeDownloader, file_sha256
+    from rag.zip_extractor import download_and_extract
+except ImportError:
+    from data_downloader import RangeDownloader, file_sha256
+    from zip_extractor import download_and_extract
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE_NAME = 'data_manifest.json'
+VERSION_FILE_NAME = 'data_version.txt'
+STAGING_DIR_NAME = '.update_staging'
+# Папки, которые публикуются одним архивом на каждую подпапку-язык
+BUNDLE_DIRS = ('books',)
+# Служебные файлы, которые не входят в манифест
+IGNORED_SUFFIXES = ('.zip', '.part', '.part.json', '.tmp', '.log')
+IGNORED_NAMES = (MANIFEST_FILE_NAME, VERSION_FILE_NAME)
+
+LANGUAGE_SUFFIX = re.compile(r'_([a-z]{2})\.[^.]+$')
+
+# progress_callback(stage, done, total): stage - 'download' | 'apply'
+UpdateProgress = Callable[[str, int, int], None]
+
+
+def language_of(path: str) -> Optional[str]:
+    """Язык файла по имени (faiss_index_ru.bin -> ru, books/en -> en); None - общий файл."""
+    parts = path.split('/')
+    if parts[0] in BUNDLE_DIRS and len(parts) > 1:
+        return parts[1]
+    match = LANGUAGE_SUFFIX.search(parts[-1])
+    return match.group(1) if match else None
+
+
+def _walk_files(directory: str) -> List[str]:
+    """Относительные пути (через '/') всех файлов папки в стабильном порядке."""
+    result = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            result.append(os.path.relpath(os.path.join(root, name), directory).replace(os.sep, '/'))
+    return result
+
+
+def tree_sha256(directory: str) -> str:
+    """Хеш содержимого папки: SHA-256 от отсортированных пар (путь, SHA-256 файла)."""
+    digest = hashlib.sha256()
+    for relative_path in _walk_files(directory):
+        digest.update(relative_path.encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(file_sha256(os.path.join(directory, relative_path)).encode('ascii'))
+        digest.update(b'\n')
+    return digest.hexdigest()
+
+
+def _is_ignored(name: str) -> bool:
+    return name.startswith('.') or name in IGNORED_NAMES or name.endswith(IGNORED_SUFFIXES)
+
+
+def _write_json_atomic(path: str, data: Dict[str, Any]):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def forget_local_manifest(data_dir: str):
+    """
+    Удаляет локальный манифест: после установки из полного архива его хеши
+    описывают уже не те файлы, и следующий plan() должен захешировать данные заново.
+    """
+    path = os.path.join(data_dir, MANIFEST_FILE_NAME)
+    if os.path.exists(path):
+        os.remove(path)
+        logger.info("🧾 Local data manifest discarded, files will be re-hashed on next update.")
+
+
+# --- Сборка манифеста (сторона релиза) ---
+
+def _zip_directory(directory: str, archive_path: str):
+    """Архив папки с фиксированными датами и порядком, чтобы одинаковое содержимое давало одинаковый zip."""
+    with zipfile.ZipFile(archive_path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for relative_path in _walk_files(directory):
+            info = zipfile.ZipInfo(relative_path, date_time=(1980, 1, 1, 0, 0, 0))
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.external_attr = 0o644 << 16
+            with open(os.path.join(directory, relative_path), 'rb') as f:
+                archive.writestr(info, f.read())
+
+
+def build_manifest(data_dir: str, version: int, output_dir: str) -> Dict[str, Any]:
+    """
+    Собирает манифест и файлы для публикации в output_dir
+    (всё содержимое output_dir загружается в релиз как есть).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    entries = []
+
+    for name in sorted(os.listdir(data_dir)):
+        path = os.path.join(data_dir, name)
+        if _is_ignored(name):
+            continue
+        if os.path.isfile(path):
+            shutil.copy2(path, os.path.join(output_dir, name))
+            entries.append({
+                'path': name,
+                'type': 'file',
+                'sha256': file_sha256(path),
+                'size': os.path.getsize(path),
+                'url': name,
+                'language': language_of(name)
+            })
+        elif name in BUNDLE_DIRS:
+            for sub_name in sorted(os.listdir(path)):
+                sub_path = os.path.join(path, sub_name)
+                if not os.path.isdir(sub_path):
+                    continue
+                asset_name = f"{name}_{sub_name}.zip"
+                asset_path = os.path.join(output_dir, asset_name)
+                _zip_directory(sub_path, asset_path)
+                entries.append({
+                    'path': f"{name}/{sub_name}",
+                    'type': 'bundle',
+                    'sha256': tree_sha256(sub_path),
+                    'archive_sha256': file_sha256(asset_path),
+                    'size': os.path.getsize(asset_path),
+                    'url': asset_name,
+                    'language': sub_name
+                })
+
+    manifest = {'version': version, 'files': entries}
+    _write_json_atomic(os.path.join(output_dir, MANIFEST_FILE_NAME), manifest)
+    return manifest
+
+
+# --- Обновление (сторона клиента) ---
+
+class DataUpdater:
+    """
+    Дельта-обновление папки данных по манифесту.
+
+    Использование:
+        updater = DataUpdater(DATA_DIR, manifest_url)
+        remote = updater.fetch_manifest()
+        changed = updater.plan(remote)
+        updater.stage(changed)          # можно долго, движок продолжает работать
+        updater.apply(remote, changed)  # быстро, движок на это время выгружается
+    """
+
+    def __init__(self, data_dir: str, manifest_url: str, progress_callback: Optional[UpdateProgress] = None,
+                 timeout: int = 30):
+        self.data_dir = data_dir
+        self.manifest_url = manifest_url
+        self.staging_dir = os.path.join(data_dir, STAGING_DIR_NAME)
+        self.progress_callback = progress_callback
+        self.timeout = timeout
+
+    def fetch_manifest(self) -> Dict[str, Any]:
+        response = requests.get(self.manifest_url, timeout=self.timeout)
+        response.raise_for_status()
+        manifest = response.json()
+        if 'files' not in manifest or 'version' not in manifest:
+            raise ValueError("Invalid data manifest: 'version' and 'files' are required")
+        return manifest
+
+    def local_manifest(self) -> Dict[str, Any]:
+        path = os.path.join(self.data_dir, MANIFEST_FILE_NAME)
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            logger.warning("⚠️ Local data manifest is unreadable, local files will be re-hashed.")
+            return {}
+
+    def installed_languages(self) -> Set[str]:
+        languages = set()
+        if os.path.exists(self.data_dir):
+            for name in os.listdir(self.data_dir):
+                if name.startswith('faiss_index_'):
+                    languages.add(language_of(name))
+        languages.discard(None)
+        return languages
+
+    def _local_path(self, entry: Dict[str, Any]) -> str:
+        return os.path.join(self.data_dir, *entry['path'].split('/'))
+
+    def _staged_path(self, entry: Dict[str, Any]) -> str:
+        return os.path.join(self.staging_dir, *entry['path'].split('/'))
+
+    def _is_current(self, entry: Dict[str, Any], local_entry: Optional[Dict[str, Any]]) -> bool:
+        path = self._local_path(entry)
+        if entry['type'] == 'bundle':
+            if not os.path.isdir(path):
+                return False
+            if local_entry is not None:
+                return local_entry.get('sha256') == entry['sha256']
+            return tree_sha256(path) == entry['sha256']
+
+        if not os.path.isfile(path) or os.path.getsize(path) != entry['size']:
+            return False
+        if local_entry is not None:
+            return local_entry.get('sha256') == entry['sha256']
+        return file_sha256(path) == entry['sha256']
+
+    def _relevant(self, entries: Iterable[Dict[str, Any]], languages: Set[str]) -> List[Dict[str, Any]]:
+        return [entry for entry in entries if entry.get('language') is None or entry.get('language') in languages]
+
+    def plan(self, remote: Dict[str, Any], languages: Optional[Set[str]] = None) -> List[Dict[str, Any]]:
+        """
+        Файлы манифеста, которые нужно скачать. Без локального манифеста
+        (данные ставились из архива) текущие файлы один раз хешируются.
+        """
+        languages = languages if languages is not None else self.installed_languages()
+        local_files = {entry['path']: entry for entry in self.local_manifest().get('files', [])}
+        return [entry for entry in self._relevant(remote['files'], languages)
+                if not self._is_current(entry, local_files.get(entry['path']))]
+
+    def stage(self, entries: List[Dict[str, Any]]):
+        """Скачивает изменившиеся файлы в staging (с докачкой и проверкой SHA-256)."""
+        os.makedirs(self.staging_dir, exist_ok=True)
+        for i, entry in enumerate(entries):
+            url = urljoin(self.manifest_url, entry['url'])
+            staged = self._staged_path(entry)
+            os.makedirs(os.path.dirname(staged), exist_ok=True)
+            logger.info(f"⬇️ Updating {entry['path']} ({entry['size']:,} bytes)")
+
+            if entry['type'] == 'bundle':
+                if os.path.isdir(staged) and tree_sha256(staged) == entry['sha256']:
+                    continue
+                shutil.rmtree(staged, ignore_errors=True)
+                archive_path = os.path.join(self.staging_dir, os.path.basename(entry['url']))
+                downloader = RangeDownloader(url, archive_path, expected_sha256=entry.get('archive_sha256'))
+                download_and_extract(downloader, staged)
+                if tree_sha256(staged) != entry['sha256']:
+                    shutil.rmtree(staged, ignore_errors=True)
+                    raise ValueError(f"Content hash mismatch for {entry['path']}")
+            else:
+                if os.path.isfile(staged) and file_sha256(staged) == entry['sha256']:
+                    continue
+                RangeDownloader(url, staged, expected_sha256=entry['sha256']).download()
+
+            if self.progress_callback:
+                self.progress_callback('download', i + 1, len(entries))
+
+    def apply(self, remote: Dict[str, Any], entries: List[Dict[str, Any]], languages: Optional[Set[str]] = None):
+        """
+        Подменяет файлы скачанными из staging и записывает новый локальный манифест.
+        Открытые файлы данных на Windows заменить нельзя, поэтому движок
+        должен быть выгружен на время вызова.
+        """
+        languages = languages if languages is not None else self.installed_languages()
+        for i, entry in enumerate(entries):
+            staged = self._staged_path(entry)
+            target = self._local_path(entry)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if entry['type'] == 'bundle':
+                old = target + '.old'
+                shutil.rmtree(old, ignore_errors=True)
+                if os.path.exists(target):
+                    os.replace(target, old)
+                os.replace(staged, target)
+                shutil.rmtree(old, ignore_errors=True)
+            else:
+                os.replace(staged, target)
+            if self.progress_callback:
+                self.progress_callback('apply', i + 1, len(entries))
+
+        # Файлы, которые были в прошлом манифесте, но исчезли из нового
+        relevant = self._relevant(remote['files'], languages)
+        remote_paths = {entry['path'] for entry in relevant}
+        for old_entry in self._relevant(self.local_manifest().get('files', []), languages):
+            if old_entry['path'] not in remote_paths:
+                path = self._local_path(old_entry)
+                logger.info(f"🗑️ Removing {old_entry['path']} (no longer in manifest)")
+                if os.path.isdir(path):
+                    shutil.rmtree(path, ignore_errors=True)
+                elif os.path.exists(path):
+                    os.remove(path)
+
+        _write_json_atomic(os.path.join(self.data_dir, MANIFEST_FILE_NAME),
+                           {'version': remote['version'], 'files': relevant})
+        with open(os.path.join(self.data_dir, VERSION_FILE_NAME), 'w') as f:
+            f.write(str(remote['version']))
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+        logger.info(f"✅ Data updated to version {remote['version']} ({len(entries)} file(s) replaced)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сборка манифеста данных для дельта-обновлений")
+    parser.add_argument('data_dir', help="папка с данными (как после распаковки архива)")
+    parser.add_argument('--version', type=int, required=True, help="DATA_VERSION этих данных")
+    parser.add_argument('--output', default='builds/data_update', help="куда сложить манифест и файлы для релиза")
+    args = parser.parse_args()
+
+    manifest = build_manifest(args.data_dir, args.version, args.output)
+    total_mb = sum(entry['size'] for entry in manifest['files']) / (1024 * 1024)
+    print(f"✅ {MANIFEST_FILE_NAME}: {len(manifest['files'])} файлов, {total_mb:.1f} МБ → {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+🧠 БЭКЕНДЫ ЭМБЕДДИНГОВ
+
+Один интерфейс для генерации эмбеддингов корпуса (embeddings_generator.py)
+и запросов (RAGEngine):
+- gemini - Google text-embedding-004 через API (по умолчанию, как раньше);
+- local  - sentence-transformers на CPU (ONNX Runtime, если доступен), без сети;
+- hash   - детерминированный feature hashing (тесты и бенчмарк).
+
+Какой бэкенд построил индекс, записано в faiss_metadata_{lang}.json
+('embedding_backend'), и RAGEngine берет для запросов тот же самый:
+векторы запроса и корпуса обязаны быть из одной модели.
+"""
+
+import logging
+import os
+import re
+import zlib
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+try:
+    from rag.gemini_clients import GeminiClientPool, shared_pool
+except ImportError:
+    from gemini_clients import GeminiClientPool, shared_pool
+
+logger = logging.getLogger(__name__)
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+class EmbeddingBackendError(RuntimeError):
+    """Бэкенд не может посчитать эмбеддинги (нет модели, сети, ключа)."""
+
+
+class EmbeddingBackend:
+    """Базовый класс: эмбеддинги запросов и документов как матрица float32 (n, dim)."""
+
+    name = 'base'
+    # Пауза между батчами при генерации корпуса (лимиты API)
+    batch_delay = 0.0
+    # Сетевой бэкенд: вызовы запросов идут через предохранитель (circuit_breaker.py),
+    # embed_queries принимает api_key пользователя
+    remote = False
+
+    def __init__(self, model_name: str, dim: int):
+        self.model_name = model_name
+        self.dim = dim
+
+    def embed_queries(self, texts: List[str]) -> np.ndarray:
+        raise NotImplementedError
+
+    def embed_documents(self, texts: List[str]) -> np.ndarray:
+        raise NotImplementedError
+
+    def describe(self) -> Dict[str, Any]:
+        """Конфигурация для метаданных индекса (см. backend_from_config)."""
+        return {'name': self.name, 'model': self.model_name, 'dim': self.dim}
+
+
+class GeminiBackend(EmbeddingBackend):
+    """
+    Google Gemini API. Клиент берется из пула по ключу (gemini_clients.py): ключ запроса
+    или GEMINI_API_KEY; глобальный genai.configure на запросах не трогается.
+    """
+
+    name = 'gemini'
+    batch_delay = 1.0
+    remote = True
+
+    def __init__(self, model_name: str = "models/text-embedding-004", dim: int = 768,
+                 clients: GeminiClientPool = None):
+        super().__init__(model_name, dim)
+        self.clients = clients if clients is not None else shared_pool
+
+    def _embed(self, texts: List[str], task_type: str, api_key: Optional[str] = None) -> np.ndarray:
+        import google.generativeai as genai
+
+        api_key = api_key or os.environ.get('GEMINI_API_KEY')
+        if not api_key:
+            # Без ключа - клиент genai по умолчанию (как раньше)
+            return self._embed_with(genai, None, texts, task_type)
+        with self.clients.lease(api_key) as client:
+            return self._embed_with(genai, client, texts, task_type)
+
+    def _embed_with(self, genai, client, texts: List[str], task_type: str) -> np.ndarray:
+        if len(texts) == 1:
+            result = genai.embed_content(model=self.model_name, content=texts[0], task_type=task_type, client=client)
+            return np.array([result['embedding']], dtype='float32')
+        result = genai.embed_content(model=self.model_name, content=texts, task_type=task_type, client=client)
+        return np.array(result['embedding'], dtype='float32')
+
+    def embed_queries(self, texts: List[str], api_key: Optional[str] = None) -> np.ndarray:
+        return self._embed(texts, "RETRIEVAL_QUERY", api_key)
+
+    def embed_documents(self, texts: List[str]) -> np.ndarray:
+        return self._embed(texts, "RETRIEVAL_DOCUMENT") # Оптимизация для поиска документов
+
+
+class LocalBackend(EmbeddingBackend):
+    """
+    Локальная модель sentence-transformers на CPU. По умолчанию multilingual-e5-small
+    (384, ru + en); e5 ожидает префиксы "query: " / "passage: ".
+    Если установлен optimum[onnxruntime], модель запускается через ONNX Runtime.
+    """
+
+    name = 'local'
+    DEFAULT_MODEL = "intfloat/multilingual-e5-small"
+
+    def __init__(self, model_name: str = DEFAULT_MODEL, dim: Optional[int] = None, onnx: bool = True,
+                 query_prefix: Optional[str] = None, document_prefix: Optional[str] = None,
+                 batch_size: int = 32):
+        super().__init__(model_name, dim or 0)
+        is_e5 = 'e5' in model_name.lower()
+        self.query_prefix = query_prefix if query_prefix is not None else ("query: " if is_e5 else "")
+        self.document_prefix = document_prefix if document_prefix is not None else ("passage: " if is_e5 else "")
+        self.onnx = onnx
+        self.batch_size = batch_size
+        self._model = None
+        self.runtime = None
+        if not dim:
+            self.dim = self._load().get_sentence_embedding_dimension()
+
+    def _load(self):
+        if self._model is not None:
+            return self._model
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise EmbeddingBackendError(
+                "Для локальных эмбеддингов нужен пакет sentence-transformers") from e
+
+        if self.onnx:
+            try:
+                self._model = SentenceTransformer(self.model_name, device='cpu', backend='onnx')
+                self.runtime = 'onnx'
+            except Exception as e:
+                # Старый sentence-transformers (без backend=) или нет optimum/onnxruntime
+                logger.warning(f"⚠️ ONNX недоступен для {self.model_name} ({e}), использую PyTorch")
+        if self._model is None:
+            self._model = SentenceTransformer(self.model_name, device='cpu')
+            self.runtime = 'torch'
+        logger.info(f"✅ Локальная модель эмбеддингов {self.model_name} загружена ({self.runtime})")
+        return self._model
+
+    def _embed(self, texts: List[str], prefix: str) -> np.ndarray:
+        vectors = self._load().encode(
+            [prefix + text for text in texts], batch_size=self.batch_size,
+            normalize_embeddings=True, convert_to_numpy=True, show_progress_bar=False
+        )
+        return np.asarray(vectors, dtype='float32')
+
+    def embed_queries(self, texts: List[str]) -> np.ndarray:
+        return self._embed(texts, self.query_prefix)
+
+    def embed_documents(self, texts: List[str]) -> np.ndarray:
+        return self._embed(texts, self.document_prefix)
+
+    def describe(self) -> Dict[str, Any]:
+        config = super().describe()
+        config.update({'query_prefix': self.query_prefix, 'document_prefix': self.document_prefix})
+        return config
+
+
+class HashBackend(EmbeddingBackend):
+    """
+    Детерминированные эмбеддинги без модели: каждое слово раскладывается
+    в несколько координат со знаком по crc32, вектор текста - нормализованная сумма.
+    Тексты с общими словами близки (только лексически).
+    """
+
+    name = 'hash'
+
+    def __init__(self, model_name: str = 'crc32', dim: int = 768, hashes_per_word: int = 4):
+        super().__init__(model_name, dim)
+        self.hashes_per_word = hashes_per_word
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype='float32')
+        for row, text in enumerate(texts):
+            for word in WORD_RE.findall(text.lower()):
+                for seed in range(self.hashes_per_word):
+                    h = zlib.crc32(f"{seed}:{word}".encode('utf-8'))
+                    vectors[row, h % self.dim] += 1.0 if (h >> 16) & 1 else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def embed_queries(self, texts: List[str]) -> np.ndarray:
+        return self._embed(texts)
+
+    def embed_documents(self, texts: List[str]) -> np.ndarray:
+        return self._embed(texts)
+
+
+BACKENDS = {
+    GeminiBackend.name: GeminiBackend,
+    LocalBackend.name: LocalBackend,
+    HashBackend.name: HashBackend,
+}
+
+
+def create_backend(name: str = 'gemini', model_name: Optional[str] = None, **options) -> EmbeddingBackend:
+    """Бэкенд по имени ('gemini', 'local', 'hash')."""
+    if name not in BACKENDS:
+        raise ValueError(f"Неизвестный бэкенд эмбеддингов: {name} (доступны: {', '.join(BACKENDS)})")
+    if model_name:
+        options['model_name'] = model_name
+    return BACKENDS[name](**options)
+
+
+def backend_from_config(config: Optional[Dict[str, Any]]) -> EmbeddingBackend:
+    """
+    Бэкенд по записи 'embedding_backend' из метаданных индекса.
+    Индексы, построенные до появления бэкендов, - это Gemini.
+    """
+    if not config:
+        return GeminiBackend()
+    options = {key: value for key, value in config.items() if key not in ('name', 'model')}
+    return create_backend(config.get('name', 'gemini'), model_name=config.get('model'), **options)
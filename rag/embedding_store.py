@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+💾 ХРАНИЛИЩЕ ЭМБЕДДИНГОВ
+
+Все эмбеддинги языка лежат в одной непрерывной матрице `embeddings_{lang}.npy`
+(float32 или float16), которая пишется батчами и открывается через
+np.load(mmap_mode='r') без копирования. Рядом хранится явная таблица
+row_id → (book, file, chunk_idx), поэтому порядок строк больше не зависит
+от сортировки ключей внутри npz.
+"""
+
+import argparse
+import json
+import struct
+from pathlib import Path
+from typing import Dict, List, Tuple, Any, Optional
+
+import numpy as np
+
+# Фиксированный размер заголовка .npy: данные начинаются с выровненного смещения,
+# а форму матрицы можно дописать после того, как станет известно число строк.
+NPY_HEADER_SIZE = 128
+NPY_MAGIC = b'\x93NUMPY\x01\x00'
+
+
+def embeddings_file_name(language: str) -> str:
+    return f"embeddings_{language}.npy"
+
+
+def _npy_header(dtype: np.dtype, shape: Tuple[int, ...]) -> bytes:
+    """Собирает заголовок .npy (формат 1.0), дополненный пробелами до NPY_HEADER_SIZE."""
+    header = "{'descr': %r, 'fortran_order': False, 'shape': %r, }" % (
+        np.lib.format.dtype_to_descr(np.dtype(dtype)), tuple(shape)
+    )
+    body_size = NPY_HEADER_SIZE - len(NPY_MAGIC) - 2
+    if len(header) + 1 > body_size:
+        raise ValueError(f"Заголовок .npy не помещается в {NPY_HEADER_SIZE} байт: {header}")
+    header = header.ljust(body_size - 1) + '\n'
+    return NPY_MAGIC + struct.pack('<H', body_size) + header.encode('latin1')
+
+
+class EmbeddingStoreWriter:
+    """
+    Инкрементальная запись эмбеддингов в один .npy файл.
+
+    Строки дописываются батчами (append), таблица строк копится в памяти
+    и возвращается через metadata(). Векторы L2-нормализуются до приведения
+    к dtype, чтобы индекс можно было строить без копии матрицы.
+    """
+
+    def __init__(self, path: str, embedding_dim: int, dtype: str = 'float32', normalize: bool = True):
+        self.path = Path(path)
+        self.embedding_dim = embedding_dim
+        self.dtype = np.dtype(dtype)
+        self.normalize = normalize
+        self.rows: List[List[Any]] = []
+        self.text_previews: List[str] = []
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, 'wb')
+        # Заголовок перезаписывается в close(), когда известна итоговая форма
+        self._file.write(_npy_header(self.dtype, (0, embedding_dim)))
+
+    @property
+    def num_rows(self) -> int:
+        return len(self.rows)
+
+    def append(self, vectors, rows: List[Tuple[str, str, int]], text_previews: Optional[List[str]] = None):
+        """
+        Дописывает батч векторов.
+
+        Args:
+            vectors: массив (n, embedding_dim)
+            rows: список (book, file, chunk_idx) для каждой строки
+            text_previews: короткие превью текста для каждой строки
+        """
+        matrix = np.asarray(vectors, dtype='float32').reshape(-1, self.embedding_dim)
+        if matrix.shape[0] != len(rows):
+            raise ValueError(f"Число векторов ({matrix.shape[0]}) не совпадает с числом строк ({len(rows)})")
+
+        if self.normalize:
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            matrix = matrix / norms
+
+        self._file.write(np.ascontiguousarray(matrix, dtype=self.dtype).tobytes())
+        self.rows.extend([list(row) for row in rows])
+        if text_previews is None:
+            text_previews = [''] * len(rows)
+        self.text_previews.extend(text_previews)
+
+    def close(self):
+        if self._file is None:
+            return
+        self._file.seek(0)
+        self._file.write(_npy_header(self.dtype, (self.num_rows, self.embedding_dim)))
+        self._file.close()
+        self._file = None
+
+    def metadata(self) -> Dict[str, Any]:
+        """Описание матрицы и таблица row_id → (book, file, chunk_idx)."""
+        return {
+            'embeddings_file': self.path.name,
+            'dtype': self.dtype.name,
+            'normalized': self.normalize,
+            'total_embeddings': self.num_rows,
+            'rows': self.rows,
+            'text_previews': self.text_previews
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def load_embedding_matrix(path: str, mmap: bool = True) -> np.ndarray:
+    """Открывает матрицу эмбеддингов (по умолчанию memory-mapped, только чтение)."""
+    return np.load(str(path), mmap_mode='r' if mmap else None)
+
+
+def rows_from_structure(structure: Dict[str, Dict[str, Any]]) -> Tuple[List[List[Any]], List[str], List[str]]:
+    """
+    Восстанавливает таблицу строк из старого формата метаданных (npz по главам).
+
+    Главы упорядочиваются по числовому номеру в embedding_key (embeddings_2 < embeddings_10),
+    как их складывают в матрицу FAISSIndexer и RAGEngine.
+
+    Returns:
+        (rows, text_previews, embedding_keys в порядке строк матрицы)
+    """
+    chapters = []
+    for book_key, book_data in structure.items():
+        for chapter_key, chapter_data in book_data.items():
+            if 'embedding_key' in chapter_data:
+                chapters.append((book_key, chapter_key, chapter_data))
+
+    def embedding_index(item):
+        try:
+            return int(item[2]['embedding_key'].split('_')[1])
+        except (IndexError, ValueError):
+            return 999999
+
+    chapters.sort(key=embedding_index)
+
+    rows, previews, keys = [], [], []
+    for book_key, chapter_key, chapter_data in chapters:
+        keys.append(chapter_data['embedding_key'])
+        text_previews = chapter_data.get('text_previews', [])
+        for i in range(chapter_data.get('num_chunks', 0)):
+            rows.append([book_key, chapter_key, i])
+            previews.append(text_previews[i] if i < len(text_previews) else "")
+    return rows, previews, keys
+
+
+def exact_rerank(query: np.ndarray, candidate_ids: np.ndarray, embeddings: np.ndarray,
+                 top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Точная переоценка кандидатов сжатого индекса по исходным векторам.
+
+    Читаются только строки кандидатов из (обычно memory-mapped float16) матрицы.
+    Векторы и запрос L2-нормализованы, поэтому скалярное произведение -
+    косинусное сходство, независимо от метрики индекса.
+
+    Returns:
+        (row_ids, similarities) - top_k лучших по убыванию сходства
+    """
+    ids = np.asarray(candidate_ids, dtype='int64')
+    ids = ids[(ids >= 0) & (ids < embeddings.shape[0])]
+    if ids.size == 0:
+        return ids, np.empty(0, dtype='float32')
+    vectors = np.asarray(embeddings[ids], dtype='float32')
+    similarities = vectors @ np.asarray(query, dtype='float32').reshape(-1)
+    best = np.argsort(-similarities, kind='stable')[:top_k]
+    return ids[best], similarities[best].astype('float32')
+
+
+def needs_embedding_matrix(index_config: Optional[Dict[str, Any]]) -> bool:
+    """
+    Нужна ли матрица приложению: только сжатому индексу (PQ/SQ) или индексу с точной
+    переоценкой. Flat / IVF-Flat / HNSW хранят векторы сами (MMR берет их через reconstruct).
+    """
+    config = index_config or {}
+    spec = str(config.get('spec', '')).upper()
+    return bool(config.get('rerank')) or 'PQ' in spec or 'SQ' in spec
+
+
+def package_embedding_matrix(data_dir: str, language: str, output_dir: str,
+                             batch_rows: int = 65536) -> Optional[Path]:
+    """
+    Кладет матрицу эмбеддингов языка в папку архива данных - в float16 и только если
+    она нужна индексу (needs_embedding_matrix). Возвращает путь копии или None.
+    """
+    source_file = Path(data_dir) / embeddings_file_name(language)
+    metadata_file = Path(data_dir) / f"faiss_metadata_{language}.json"
+    if not source_file.exists() or not metadata_file.exists():
+        return None
+    with open(metadata_file, 'r', encoding='utf-8') as f:
+        index_config = json.load(f).get('index_config')
+    if not needs_embedding_matrix(index_config):
+        return None
+
+    source = load_embedding_matrix(source_file)
+    target_file = Path(output_dir) / source_file.name
+    target = np.lib.format.open_memmap(str(target_file), mode='w+', dtype='float16', shape=source.shape)
+    for start in range(0, source.shape[0], batch_rows):
+        target[start:start + batch_rows] = source[start:start + batch_rows]
+    target.flush()
+    del target
+    return target_file
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Матрица эмбеддингов для архива данных (float16, только для сжатых индексов)")
+    parser.add_argument('data_dir', help="папка с индексом и embeddings_{lang}.npy")
+    parser.add_argument('output_dir', help="папка архива")
+    parser.add_argument('languages', nargs='+')
+    args = parser.parse_args()
+
+    for language in args.languages:
+        packaged = package_embedding_matrix(args.data_dir, language, args.output_dir)
+        if packaged:
+            print(f"✅ {packaged.name}: float16, {packaged.stat().st_size / (1024 * 1024):.1f} МБ")
+        else:
+            print(f"⏭️ {embeddings_file_name(language)}: в архив не нужна (индекс не сжат или файла нет)")
+
+
+if __name__ == "__main__":
+    main()
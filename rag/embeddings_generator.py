@@ -5,10 +5,11 @@
 
 Этот модуль создает векторные представления (эмбеддинги) чанков текста
 для использования в системе поиска по семантическому сходству.
-Он использует Google Gemini API.
+По умолчанию используется Google Gemini API; --backend local строит
+эмбеддинги локальной моделью на CPU (тогда и запросы считаются без сети).
 
 ЗАПУСК:
-    python rag/embeddings_generator.py
+    python rag/embeddings_generator.py [--float16] [--backend gemini|local] [--model NAME]
 """
 
 import json
@@ -20,166 +21,150 @@ import os
 import google.generativeai as genai
 from dotenv import load_dotenv
 
+try:
+    from rag.embedding_store import EmbeddingStoreWriter, embeddings_file_name
+    from rag.chunk_dedup import load_duplicates, sources_by_canonical
+    from rag.embedding_backends import EmbeddingBackend, GeminiBackend, create_backend
+except ImportError:
+    from embedding_store import EmbeddingStoreWriter, embeddings_file_name
+    from chunk_dedup import load_duplicates, sources_by_canonical
+    from embedding_backends import EmbeddingBackend, GeminiBackend, create_backend
+
 class EmbeddingsGenerator:
-    """Генерирует эмбеддинги для чанков текста с помощью Google Gemini API"""
+    """Генерирует эмбеддинги для чанков текста (Google Gemini API или локальная модель)"""
     
-    def __init__(self):
+    def __init__(self, backend: EmbeddingBackend = None):
         """
-        Инициализирует генератор, используя модель text-embedding-004.
+        Инициализирует генератор. По умолчанию - Gemini text-embedding-004.
         """
-        self.model_name = "models/text-embedding-004"
-        self.embedding_dim = 768  # Размерность для text-embedding-004
+        self.backend = backend or GeminiBackend()
+        self.model_name = self.backend.model_name
+        self.embedding_dim = self.backend.dim
         print(f"🔄 Инициализирован генератор с моделью: {self.model_name}")
         print(f"📏 Размерность эмбеддинга: {self.embedding_dim}")
     
     def generate_embeddings(self, chunks_data: Dict[str, Dict[str, List[str]]], 
-                          language: str = 'ru', batch_size: int = 100) -> Dict:
+                          language: str = 'ru', batch_size: int = 100,
+                          dtype: str = 'float32', duplicates: Dict = None) -> Dict:
         """
         Генерирует эмбеддинги для всех чанков через Google Gemini API
+        и сразу дописывает их батчами в rag/embeddings_{language}.npy
         
         Args:
             chunks_data: словарь с чанками
             language: язык ('ru' или 'en')
             batch_size: размер батча для обработки (max 100 для Gemini API)
+            dtype: 'float32' или 'float16' для хранения матрицы
+            duplicates: дубликат → канонический чанк (chunk_dedup); дубликаты не эмбеддятся,
+                        их места попадают в row_sources канонической строки
             
         Returns:
-            словарь с эмбеддингами и метаданными
+            метаданные матрицы с таблицей строк row_id → (book, file, chunk_idx)
         """
+        duplicates = duplicates or {}
         if batch_size > 100:
             print(f"⚠️ Размер батча ({batch_size}) превышает лимит API (100). Устанавливаю 100.")
             batch_size = 100
 
-        embeddings_data = {
-            'model': self.model_name,
-            'embedding_dim': self.embedding_dim,
-            'language': language,
-            'books': {}
-        }
-        
-        total_chunks = 0
-        total_embeddings = 0
-        
         # Собираем все чанки для обработки
         all_chunks_with_info = []
         
         for book_name in sorted(chunks_data.keys()):
-            embeddings_data['books'][book_name] = {}
-            
             for file_path in sorted(chunks_data[book_name].keys()):
-                embeddings_data['books'][book_name][file_path] = []
-                
                 for chunk_idx, chunk_text in enumerate(chunks_data[book_name][file_path]):
+                    if (book_name, file_path, chunk_idx) in duplicates:
+                        continue
                     all_chunks_with_info.append({
                         'text': chunk_text,
                         'book': book_name,
                         'file': file_path,
                         'chunk_idx': chunk_idx
                     })
-                    total_chunks += 1
         
+        total_chunks = len(all_chunks_with_info)
+        output_file = f"rag/{embeddings_file_name(language)}"
         print(f"📊 Всего чанков для обработки: {total_chunks:,}")
-        print(f"🔄 Генерирую эмбеддинги (batch_size={batch_size}). Это может занять время...\n")
+        if duplicates:
+            print(f"🧬 Пропущено дубликатов: {len(duplicates):,}")
+        print(f"🔄 Генерирую эмбеддинги (batch_size={batch_size}, dtype={dtype}) в {output_file}. Это может занять время...\n")
         
         # Генерируем эмбеддинги батчами
         start_time = time.time()
         
-        for batch_start in range(0, len(all_chunks_with_info), batch_size):
-            batch_end = min(batch_start + batch_size, len(all_chunks_with_info))
-            batch_info = all_chunks_with_info[batch_start:batch_end]
-            
-            texts = [item['text'] for item in batch_info]
-            
-            try:
-                # Генерируем эмбеддинги через API
-                result = genai.embed_content(
-                    model=self.model_name,
-                    content=texts,
-                    task_type="RETRIEVAL_DOCUMENT" # Оптимизация для поиска документов
-                )
-                batch_embeddings = result['embedding']
+        with EmbeddingStoreWriter(output_file, self.embedding_dim, dtype=dtype) as writer:
+            for batch_start in range(0, total_chunks, batch_size):
+                batch_end = min(batch_start + batch_size, total_chunks)
+                batch_info = all_chunks_with_info[batch_start:batch_end]
                 
-                # Сохраняем эмбеддинги в структуру данных
-                for i, item in enumerate(batch_info):
-                    embedding = batch_embeddings[i]
-                    embeddings_data['books'][item['book']][item['file']].append({
-                        'chunk_idx': item['chunk_idx'],
-                        'text_preview': item['text'][:100],
-                        'embedding': embedding
-                    })
-                    total_embeddings += 1
-
-                # Логируем прогресс
-                progress_pct = (batch_end / len(all_chunks_with_info)) * 100
-                elapsed = time.time() - start_time
-                rate = total_embeddings / elapsed if elapsed > 0 else 0
-                eta = (len(all_chunks_with_info) - total_embeddings) / rate if rate > 0 else 0
+                texts = [item['text'] for item in batch_info]
                 
-                print(f"  ⏳ {progress_pct:5.1f}% | {total_embeddings:7,} эмбеддингов | {rate:5.1f} шт/сек | ETA: {eta:6.0f}сек")
+                try:
+                    # Генерируем эмбеддинги (через API или локально)
+                    vectors = self.backend.embed_documents(texts)
+                    writer.append(
+                        vectors,
+                        [(item['book'], item['file'], item['chunk_idx']) for item in batch_info],
+                        [item['text'][:100] for item in batch_info]
+                    )
 
-                # Пауза, чтобы не превышать лимиты API (например, 60 запросов в минуту)
-                time.sleep(1)
+                    # Логируем прогресс
+                    progress_pct = (batch_end / total_chunks) * 100
+                    elapsed = time.time() - start_time
+                    rate = writer.num_rows / elapsed if elapsed > 0 else 0
+                    eta = (total_chunks - writer.num_rows) / rate if rate > 0 else 0
+                    
+                    print(f"  ⏳ {progress_pct:5.1f}% | {writer.num_rows:7,} эмбеддингов | {rate:5.1f} шт/сек | ETA: {eta:6.0f}сек")
+
+                    # Пауза, чтобы не превышать лимиты API (например, 60 запросов в минуту)
+                    if self.backend.batch_delay:
+                        time.sleep(self.backend.batch_delay)
 
-            except Exception as e:
-                print(f"\n❌ Ошибка при обработке батча {batch_start}-{batch_end}: {e}")
-                print("   Пропускаю этот батч. Проверьте соединение и API ключ.")
-                continue
+                except Exception as e:
+                    print(f"\n❌ Ошибка при обработке батча {batch_start}-{batch_end}: {e}")
+                    print("   Пропускаю этот батч. Проверьте соединение и API ключ.")
+                    continue
 
         elapsed = time.time() - start_time
         print(f"\n✅ Эмбеддинги созданы за {elapsed:.1f} сек ({elapsed/60:.1f} мин)")
         
+        embeddings_data = {
+            'model': self.model_name,
+            'embedding_dim': self.embedding_dim,
+            'embedding_backend': self.backend.describe(), # RAGEngine эмбеддит запросы тем же бэкендом
+            'language': language
+        }
+        embeddings_data.update(writer.metadata())
+
+        # row_id → остальные места, где встречается текст этой строки
+        sources = sources_by_canonical(duplicates)
+        embeddings_data['row_sources'] = {
+            str(row_id): [list(source) for source in sources[tuple(row)]]
+            for row_id, row in enumerate(writer.rows) if tuple(row) in sources
+        }
+        embeddings_data['deduplicated_chunks'] = len(duplicates)
         return embeddings_data
     
     def save_embeddings(self, embeddings_data: Dict, language: str = 'ru'):
         """
-        Сохраняет эмбеддинги в файл (в сжатом виде с NumPy)
+        Сохраняет метаданные матрицы эмбеддингов (сама матрица уже записана
+        в generate_embeddings)
         """
-        # ... (этот метод остается без изменений)
-        output_file = f"rag/embeddings_{language}.npz"
-        
-        print(f"\n💾 Сохраняю эмбеддинги в {output_file}...")
-        
-        embeddings_arrays = {}
-        metadata = {
-            'model': embeddings_data['model'],
-            'embedding_dim': embeddings_data['embedding_dim'],
-            'language': embeddings_data['language'],
-            'structure': {}
-        }
-        
-        idx = 0
-        for book_name in sorted(embeddings_data['books'].keys()):
-            metadata['structure'][book_name] = {}
-            
-            for file_path in sorted(embeddings_data['books'][book_name].keys()):
-                chunk_list = embeddings_data['books'][book_name][file_path]
-                
-                if chunk_list:
-                    embeddings_matrix = np.array([item['embedding'] for item in chunk_list])
-                    key = f"embeddings_{idx}"
-                    embeddings_arrays[key] = embeddings_matrix
-                    
-                    metadata['structure'][book_name][file_path] = {
-                        'embedding_key': key,
-                        'num_chunks': len(chunk_list),
-                        'text_previews': [item['text_preview'] for item in chunk_list]
-                    }
-                    idx += 1
-        
-        np.savez_compressed(output_file, **embeddings_arrays)
-        
+        output_file = f"rag/{embeddings_file_name(language)}"
         metadata_file = f"rag/embeddings_metadata_{language}.json"
+        
+        print(f"\n💾 Сохраняю метаданные в {metadata_file}...")
         with open(metadata_file, 'w', encoding='utf-8') as f:
-            json.dump(metadata, f, ensure_ascii=False, indent=2)
+            json.dump(embeddings_data, f, ensure_ascii=False)
         
-        npz_size = Path(output_file).stat().st_size / (1024*1024)
+        npy_size = Path(output_file).stat().st_size / (1024*1024)
         json_size = Path(metadata_file).stat().st_size / (1024*1024)
         
-        print(f"✅ NPZ файл сохранён: {npz_size:.2f} МБ")
+        print(f"✅ NPY файл ({embeddings_data['dtype']}, {embeddings_data['total_embeddings']:,} строк): {npy_size:.2f} МБ")
         print(f"✅ Метаданные сохранены: {json_size:.2f} МБ")
         
         return output_file, metadata_file
 
-    def process_language(self, language: str = 'ru'):
+    def process_language(self, language: str = 'ru', dtype: str = 'float32'):
         """
         Полный процесс для одного языка
         """
@@ -191,63 +176,66 @@ class EmbeddingsGenerator:
         
         print(f"✅ Загружено {len(chunks_data)} книг")
         
-        embeddings_data = self.generate_embeddings(chunks_data, language=language, batch_size=100)
+        duplicates = load_duplicates(language)
+        embeddings_data = self.generate_embeddings(chunks_data, language=language, batch_size=100, dtype=dtype,
+                                                   duplicates=duplicates)
         
-        if sum(len(file_data) for book_data in embeddings_data['books'].values() for file_data in book_data.values()) == 0:
+        if embeddings_data['total_embeddings'] == 0:
             print("❌ Не было сгенерировано ни одного эмбеддинга. Процесс прерван.")
             return None
 
-        npz_file, json_file = self.save_embeddings(embeddings_data, language=language)
+        npy_file, json_file = self.save_embeddings(embeddings_data, language=language)
         
         stats = {
             'language': language,
-            'total_books': len(embeddings_data['books']),
+            'total_books': len({row[0] for row in embeddings_data['rows']}),
             'embedding_model': embeddings_data['model'],
             'embedding_dim': embeddings_data['embedding_dim'],
-            'npz_file': npz_file,
+            'npy_file': npy_file,
             'metadata_file': json_file
         }
         
         return stats
 
 
-def process_all_languages():
+def process_all_languages(dtype: str = 'float32', backend: str = 'gemini', model_name: str = None):
     """Обрабатывает эмбеддинги для обоих языков"""
     
     print("="*70)
-    print("🧠 ГЕНЕРАЦИЯ ЭМБЕДДИНГОВ ДЛЯ RAG (GOOGLE GEMINI API)")
+    print(f"🧠 ГЕНЕРАЦИЯ ЭМБЕДДИНГОВ ДЛЯ RAG ({'GOOGLE GEMINI API' if backend == 'gemini' else backend.upper()})")
     print("="*70)
 
-    # Загружаем API ключ из .env файла
-    load_dotenv()
-    if 'GEMINI_API_KEY' not in os.environ:
-        print("❌ ОШИБКА: Переменная окружения GEMINI_API_KEY не найдена.")
-        print("   Пожалуйста, создайте файл .env в корне проекта и добавьте в него строку:")
-        print("   GEMINI_API_KEY='Ваш_ключ'")
-        return
-    
-    try:
-        genai.configure(api_key=os.environ['GEMINI_API_KEY'])
-        print("✅ Ключ Gemini API успешно сконфигурирован.")
-    except Exception as e:
-        print(f"❌ Ошибка при конфигурации Gemini API: {e}")
-        return
+    if backend == 'gemini':
+        # Загружаем API ключ из .env файла
+        load_dotenv()
+        if 'GEMINI_API_KEY' not in os.environ:
+            print("❌ ОШИБКА: Переменная окружения GEMINI_API_KEY не найдена.")
+            print("   Пожалуйста, создайте файл .env в корне проекта и добавьте в него строку:")
+            print("   GEMINI_API_KEY='Ваш_ключ'")
+            return
+        
+        try:
+            genai.configure(api_key=os.environ['GEMINI_API_KEY'])
+            print("✅ Ключ Gemini API успешно сконфигурирован.")
+        except Exception as e:
+            print(f"❌ Ошибка при конфигурации Gemini API: {e}")
+            return
 
-    generator = EmbeddingsGenerator()
+    generator = EmbeddingsGenerator(create_backend(backend, model_name=model_name))
     
     all_stats = {}
     
     # Русские писания
     print("\n📍 ЭТАП 1: ЭМБЕДДИНГИ ДЛЯ РУССКИХ ПИСАНИЙ")
     print("-" * 70)
-    stats_ru = generator.process_language('ru')
+    stats_ru = generator.process_language('ru', dtype=dtype)
     if stats_ru:
         all_stats['ru'] = stats_ru
     
     # Английские писания
     print("\n📍 ЭТАП 2: ЭМБЕДДИНГИ ДЛЯ АНГЛИЙСКИХ ПИСАНИЙ")
     print("-" * 70)
-    stats_en = generator.process_language('en')
+    stats_en = generator.process_language('en', dtype=dtype)
     if stats_en:
         all_stats['en'] = stats_en
     
@@ -263,7 +251,7 @@ def process_all_languages():
         print(f"   📚 Книг: {stats['total_books']}")
         print(f"   🧠 Модель: {stats['embedding_model']}")
         print(f"   📏 Размерность: {stats['embedding_dim']}")
-        print(f"   💾 NPZ файл: {stats['npz_file']}")
+        print(f"   💾 NPY файл: {stats['npy_file']}")
         print(f"   📝 Метаданные: {stats['metadata_file']}")
     
     if all_stats:
@@ -273,4 +261,11 @@ def process_all_languages():
 
 
 if __name__ == "__main__":
-    process_all_languages()
+    import argparse
+    parser = argparse.ArgumentParser(description="Генерация эмбеддингов чанков")
+    parser.add_argument('--float16', action='store_true', help="хранить матрицу в float16")
+    parser.add_argument('--backend', choices=['gemini', 'local'], default='gemini',
+                        help="local - модель sentence-transformers на CPU, без сети")
+    parser.add_argument('--model', help="имя модели бэкенда (по умолчанию - стандартная для бэкенда)")
+    args = parser.parse_args()
+    process_all_languages(dtype='float16' if args.float16 else 'float32', backend=args.backend, model_name=args.model)
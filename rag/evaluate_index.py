@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+📏 ОЦЕНКА СЖАТЫХ ИНДЕКСОВ FAISS
+
+Строит сжатые варианты индекса (SQ8, SQ4, IVF-PQ) на реальных эмбеддингах
+и сравнивает их с точным IndexFlat:
+- во сколько раз уменьшился индекс (RAM и размер архива),
+- recall@k без переоценки и с точной переоценкой кандидатов по
+  embeddings_{lang}.npy (так же, как это делает RAGEngine),
+- укладывается ли recall@k в заданный допуск.
+
+ЗАПУСК:
+    python rag/evaluate_index.py [--language ru] [--k 10] [--tolerance 0.02] [--output report.json]
+"""
+
+import argparse
+import json
+import sys
+import time
+from typing import Dict, Any, List
+
+import numpy as np
+
+try:
+    from rag.faiss_indexer import FAISSIndexer, METRICS, faiss
+    from rag.embedding_store import exact_rerank
+except ImportError:
+    from faiss_indexer import FAISSIndexer, METRICS, faiss
+    from embedding_store import exact_rerank
+
+
+def evaluate_config(indexer: FAISSIndexer, vectors: np.ndarray, stored: np.ndarray, queries: np.ndarray,
+                    ground_truth: np.ndarray, config: Dict[str, Any], k: int) -> Dict[str, Any]:
+    """Строит один индекс и замеряет размер, recall@k и задержку с переоценкой и без."""
+    index = indexer._build_from_config(vectors, config, verbose=False)
+    memory_mb = faiss.serialize_index(index).nbytes / (1024 * 1024)
+    factor = config.get('rerank', {}).get('factor', 1)
+
+    hits_plain = hits_rerank = 0
+    start = time.perf_counter()
+    for i in range(queries.shape[0]):
+        query = queries[i:i + 1]
+        _, found = index.search(query, k * max(1, factor))
+        hits_plain += len(np.intersect1d(found[0][:k], ground_truth[i]))
+        if factor > 1:
+            ids, _ = exact_rerank(query[0], found[0], stored, k)
+            hits_rerank += len(np.intersect1d(ids, ground_truth[i]))
+    latency_ms = (time.perf_counter() - start) * 1000 / queries.shape[0]
+
+    result = {
+        'spec': config['spec'],
+        'search_params': config.get('search_params', {}),
+        'rerank_factor': factor,
+        'memory_mb': memory_mb,
+        'recall_at_k': hits_plain / float(ground_truth.size),
+        'latency_ms': latency_ms
+    }
+    if factor > 1:
+        result['recall_at_k_reranked'] = hits_rerank / float(ground_truth.size)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Оценка сжатых FAISS индексов")
+    parser.add_argument('--language', default='ru')
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--queries', type=int, default=500, help="число запросов (случайные строки матрицы)")
+    parser.add_argument('--tolerance', type=float, default=0.02,
+                        help="допустимая потеря recall@k относительно точного поиска")
+    parser.add_argument('--rerank-factor', type=int, default=4)
+    parser.add_argument('--output', help="сохранить отчет в JSON")
+    args = parser.parse_args()
+
+    indexer = FAISSIndexer(embedding_dim=768)
+    stored, metadata = indexer.load_embeddings(args.language)
+    if stored is None:
+        sys.exit(1)
+    indexer.embedding_dim = stored.shape[1]
+    vectors = indexer._prepare_vectors(stored, metadata.get('normalized', False))
+    if not metadata.get('normalized', False):
+        # Переоценка должна видеть те же нормализованные векторы, что и индекс
+        stored = vectors
+
+    k = min(args.k, vectors.shape[0])
+    rng = np.random.default_rng(0)
+    query_ids = rng.choice(vectors.shape[0], min(args.queries, vectors.shape[0]), replace=False)
+    queries = np.ascontiguousarray(vectors[query_ids])
+
+    exact = faiss.IndexFlat(indexer.embedding_dim, METRICS[indexer.metric])
+    exact.add(vectors)
+    _, ground_truth = exact.search(queries, k)
+    flat_mb = faiss.serialize_index(exact).nbytes / (1024 * 1024)
+    del exact
+
+    print("=" * 70)
+    print(f"📏 ОЦЕНКА СЖАТЫХ ИНДЕКСОВ ({args.language}): {vectors.shape[0]:,} векторов, "
+          f"{len(query_ids)} запросов, recall@{k}, допуск {args.tolerance}")
+    print(f"   Точный IndexFlat ({indexer.metric}): {flat_mb:.1f} МБ")
+    print("=" * 70)
+
+    configs = [
+        indexer.compressed_index_config(vectors.shape[0], kind=kind, rerank_factor=args.rerank_factor)
+        for kind in ('sq8', 'sq4', 'ivfpq')
+    ]
+
+    report: List[Dict[str, Any]] = []
+    all_passed = True
+    for config in configs:
+        result = evaluate_config(indexer, vectors, stored, queries, ground_truth, config, k)
+        result['compression'] = flat_mb / result['memory_mb'] if result['memory_mb'] else None
+        best_recall = result.get('recall_at_k_reranked', result['recall_at_k'])
+        result['passed'] = best_recall >= 1.0 - args.tolerance
+        all_passed = all_passed and result['passed']
+        report.append(result)
+
+        reranked = result.get('recall_at_k_reranked')
+        print(f"  {'✅' if result['passed'] else '❌'} {result['spec']:<16} "
+              f"{result['memory_mb']:8.1f} МБ ({result['compression']:.1f}x)  "
+              f"recall@{k}={result['recall_at_k']:.3f}"
+              + (f" → {reranked:.3f} с переоценкой x{result['rerank_factor']}" if reranked is not None else "")
+              + f"  {result['latency_ms']:.3f} мс")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'language': args.language, 'k': k, 'tolerance': args.tolerance,
+                       'flat_mb': flat_mb, 'results': report}, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Отчет сохранен в {args.output}")
+
+    sys.exit(0 if all_passed else 2)
+
+
+if __name__ == "__main__":
+    main()
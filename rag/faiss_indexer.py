@@ -7,10 +7,14 @@
 по эмбеддингам чанков.
 
 ЗАПУСК:
-    python rag/faiss_indexer.py
+    python rag/faiss_indexer.py [--tune] [--force]
+    python rag/faiss_indexer.py --hnsw [--hnsw-m 32] [--ef-construction 200] [--ef-search 64] [--hnsw-sq SQ8]
+    python rag/faiss_indexer.py --compress ivfpq|sq8|sq4 [--pq-m 192] [--rerank-factor 4]
+    python rag/faiss_indexer.py --migrate-ip [--data-dir rag]   # L2 → inner product без новых эмбеддингов
 """
 
 import json
+import os
 import numpy as np
 from pathlib import Path
 from typing import Dict, List, Tuple, Any
@@ -23,14 +27,119 @@ except ImportError:
     print("   pip install faiss-cpu  (или faiss-gpu для GPU)")
     exit(1)
 
+try:
+    from rag.embedding_store import embeddings_file_name, load_embedding_matrix, rows_from_structure
+except ImportError:
+    from embedding_store import embeddings_file_name, load_embedding_matrix, rows_from_structure
+
+
+# Метрики индекса: для L2-нормализованных векторов обе дают одинаковый порядок,
+# но inner product сразу возвращает косинусное сходство
+METRICS = {'ip': faiss.METRIC_INNER_PRODUCT, 'l2': faiss.METRIC_L2}
+
+# Верхняя граница выборки для обучения IVF/PQ
+MAX_TRAIN_VECTORS = 100000
+
+
+def apply_search_params(index: faiss.Index, search_params: Dict[str, Any]):
+    """Выставляет параметры поиска (nprobe, efSearch, ...) через ParameterSpace."""
+    parameter_space = faiss.ParameterSpace()
+    for name, value in (search_params or {}).items():
+        parameter_space.set_index_parameter(index, name, value)
+
+
+def apply_build_params(index: faiss.Index, build_params: Dict[str, Any]):
+    """Параметры, которые нужно выставить до add(): efConstruction для HNSW."""
+    ef_construction = (build_params or {}).get('efConstruction')
+    if ef_construction:
+        faiss.downcast_index(index).hnsw.efConstruction = int(ef_construction)
+
+
+def pareto_front(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Оставляет конфигурации, которые не хуже других сразу по recall, задержке и памяти."""
+    def dominates(a, b):
+        not_worse = (a['recall_at_k'] >= b['recall_at_k'] and a['latency_ms'] <= b['latency_ms']
+                     and a['memory_mb'] <= b['memory_mb'])
+        better = (a['recall_at_k'] > b['recall_at_k'] or a['latency_ms'] < b['latency_ms']
+                  or a['memory_mb'] < b['memory_mb'])
+        return not_worse and better
+    return [r for r in results if not any(dominates(other, r) for other in results)]
+
+
+def reconstruct_vectors(index: faiss.Index) -> np.ndarray:
+    """
+    Достает векторы обратно из индекса: точно для Flat / IVF-Flat / HNSW-Flat,
+    приближенно для PQ / SQ.
+    """
+    try:
+        faiss.extract_index_ivf(index).make_direct_map()
+    except RuntimeError:
+        pass # не IVF индекс
+    return index.reconstruct_n(0, index.ntotal)
+
+
+# Типы ScalarQuantizer -> суффикс строки index_factory
+SQ_SPECS = {
+    faiss.ScalarQuantizer.QT_8bit: 'SQ8',
+    faiss.ScalarQuantizer.QT_4bit: 'SQ4',
+    faiss.ScalarQuantizer.QT_6bit: 'SQ6',
+    faiss.ScalarQuantizer.QT_fp16: 'SQfp16',
+}
+
+
+def _sq_spec(index: faiss.Index) -> str:
+    qtype = faiss.downcast_index(index).sq.qtype
+    if qtype not in SQ_SPECS:
+        raise ValueError(f"Неизвестный тип ScalarQuantizer: {qtype}")
+    return SQ_SPECS[qtype]
+
+
+def _pq_spec(pq) -> str:
+    return f'PQ{pq.M}' + (f'x{pq.nbits}' if pq.nbits != 8 else '')
+
+
+def infer_index_config(index: faiss.Index) -> Dict[str, Any]:
+    """
+    Восстанавливает index_config для индексов, построенных до появления index_config:
+    Flat, SQ, IVF-Flat, IVF-PQ (в том числе с OPQ), HNSW и HNSW-SQ.
+    """
+    base = faiss.downcast_index(index)
+    if isinstance(base, faiss.IndexFlat):
+        return {'spec': 'Flat', 'search_params': {}}
+    if isinstance(base, faiss.IndexScalarQuantizer):
+        return {'spec': _sq_spec(base), 'search_params': {}}
+    if isinstance(base, faiss.IndexIVFFlat):
+        return {'spec': f'IVF{base.nlist},Flat', 'search_params': {'nprobe': int(base.nprobe)}}
+    if isinstance(base, faiss.IndexIVFPQ):
+        return {'spec': f'IVF{base.nlist},{_pq_spec(base.pq)}', 'search_params': {'nprobe': int(base.nprobe)}}
+    if isinstance(base, faiss.IndexHNSW):
+        m = base.hnsw.nb_neighbors(1)
+        if isinstance(base, faiss.IndexHNSWFlat):
+            spec = f'HNSW{m}'
+        elif isinstance(base, faiss.IndexHNSWSQ):
+            spec = f'HNSW{m}_{_sq_spec(base.storage)}'
+        else:
+            raise ValueError(f"Не удалось определить конфигурацию индекса {type(base).__name__}")
+        return {'spec': spec, 'search_params': {'efSearch': int(base.hnsw.efSearch)}}
+    if isinstance(base, faiss.IndexPreTransform) and base.chain.size() == 1:
+        transform = faiss.downcast_VectorTransform(base.chain.at(0))
+        if isinstance(transform, faiss.OPQMatrix):
+            inner = infer_index_config(base.index)
+            return {**inner, 'spec': f'OPQ{transform.M},{inner["spec"]}'}
+    raise ValueError(f"Не удалось определить конфигурацию индекса {type(base).__name__}")
+
 
 class FAISSIndexer:
-    def __init__(self, embedding_dim: int = 768): # Обновленная размерность для text-embedding-004
+    def __init__(self, embedding_dim: int = 768, metric: str = 'ip'): # Обновленная размерность для text-embedding-004
         """
         Args:
             embedding_dim: размерность эмбеддингов
+            metric: 'ip' (скалярное произведение = косинус для нормализованных векторов) или 'l2'
         """
         self.embedding_dim = embedding_dim
+        if metric not in METRICS:
+            raise ValueError(f"Неизвестная метрика: {metric}")
+        self.metric = metric
         # Создаем индекс с использованием IVFFlat для больших наборов данных
         # Количество кластеров (nlist) должно быть подобрано для вашего датасета
         self.quantizer = faiss.IndexFlatL2(embedding_dim)
@@ -39,7 +148,11 @@ class FAISSIndexer:
     
     def load_embeddings(self, language: str = 'ru') -> Tuple[np.ndarray, Dict]:
         """
-        Загружает сохраненные эмбеддинги из .npz файла
+        Загружает сохраненные эмбеддинги.
+
+        Основной формат - одна матрица rag/embeddings_{language}.npy, открываемая
+        через mmap без копирования. Старый формат .npz (массив на главу)
+        поддерживается для ранее сгенерированных данных.
         
         Args:
             language: 'ru' или 'en'
@@ -48,25 +161,8 @@ class FAISSIndexer:
             (embeddings_matrix, metadata)
         """
         metadata_file = f"rag/embeddings_metadata_{language}.json"
-        npz_file = f"rag/embeddings_{language}.npz" # Изменено на .npz
-        
-        print(f"📂 Загружаю эмбеддинги из {npz_file}...")
-        if not Path(npz_file).exists():
-            print(f"⚠️  Файл {npz_file} не найден. Пропускаю обработку {language}.")
-            return None, None
-        
-        # Загрузка NPZ файла и извлечение эмбеддингов
-        npz_data = np.load(npz_file)
-        # Объединяем все массивы из npz в один
-        embeddings_list = [npz_data[key] for key in sorted(npz_data.files) if key.startswith('embeddings_')]
-        
-        if not embeddings_list:
-            print(f"❌ В файле {npz_file} не найдено массивов эмбеддингов. Пропускаю обработку {language}.")
-            return None, None
-            
-        embeddings = np.vstack(embeddings_list).astype('float32')
-        
-        print(f"✅ Загружено {embeddings.shape[0]:,} эмбеддингов размерности {embeddings.shape[1]}")
+        npy_file = f"rag/{embeddings_file_name(language)}"
+        npz_file = f"rag/embeddings_{language}.npz"
         
         if not Path(metadata_file).exists():
             print(f"⚠️  Файл {metadata_file} не найден. Пропускаю обработку {language}.")
@@ -74,15 +170,131 @@ class FAISSIndexer:
             
         with open(metadata_file, 'r', encoding='utf-8') as f:
             metadata = json.load(f)
+        
+        if Path(npy_file).exists() and 'rows' in metadata:
+            print(f"📂 Открываю матрицу эмбеддингов {npy_file} (mmap)...")
+            embeddings = load_embedding_matrix(npy_file)
+        elif Path(npz_file).exists():
+            print(f"📂 Загружаю эмбеддинги из {npz_file} (старый формат)...")
+            # Главы складываются в порядке числового номера ключа, как и таблица строк
+            rows, previews, keys = rows_from_structure(metadata.get('structure', {}))
+            npz_data = np.load(npz_file)
+            embeddings_list = [npz_data[key] for key in keys if key in npz_data.files]
             
+            if not embeddings_list:
+                print(f"❌ В файле {npz_file} не найдено массивов эмбеддингов. Пропускаю обработку {language}.")
+                return None, None
+                
+            embeddings = np.vstack(embeddings_list).astype('float32')
+            metadata['rows'] = rows
+            metadata['text_previews'] = previews
+            metadata['normalized'] = False
+        else:
+            print(f"⚠️  Файлы {npy_file} / {npz_file} не найдены. Пропускаю обработку {language}.")
+            return None, None
+        
+        if embeddings.shape[0] != len(metadata['rows']):
+            print(f"❌ Число эмбеддингов ({embeddings.shape[0]}) не совпадает с таблицей строк ({len(metadata['rows'])}). Пропускаю обработку {language}.")
+            return None, None
+        
+        print(f"✅ Загружено {embeddings.shape[0]:,} эмбеддингов размерности {embeddings.shape[1]} ({embeddings.dtype})")
         return embeddings, metadata
         
-    def build_index(self, embeddings: np.ndarray) -> faiss.Index:
+    def default_index_config(self, num_vectors: int) -> Dict[str, Any]:
+        """
+        Эвристика по умолчанию (без замеров):
+        IndexFlat - простой, для небольших наборов данных
+        IndexIVFFlat - более сложный, для больших наборов данных, требует обучения
+        """
+        if num_vectors < 10000: # Можно настроить порог
+            return {'spec': 'Flat', 'search_params': {}}
+        nlist = min(100, int(np.sqrt(num_vectors))) # Количество кластеров, эвристика
+        return {'spec': f'IVF{nlist},Flat', 'search_params': {'nprobe': min(50, nlist)}}
+
+    def hnsw_index_config(self, m: int = 32, ef_construction: int = 200, ef_search: int = 64,
+                          scalar_quantizer: str = None) -> Dict[str, Any]:
+        """
+        HNSW граф для быстрого CPU-поиска без обучения.
+
+        Args:
+            m: число связей на узел (больше - точнее и больше памяти)
+            ef_construction: ширина поиска при построении графа
+            ef_search: ширина поиска по умолчанию (RAGEngine может менять ее на запрос)
+            scalar_quantizer: 'SQ8' / 'SQ4' - хранить векторы графа квантованными
+        """
+        spec = f'HNSW{m}' + (f'_{scalar_quantizer}' if scalar_quantizer else '')
+        return {
+            'spec': spec,
+            'build_params': {'efConstruction': ef_construction},
+            'search_params': {'efSearch': ef_search}
+        }
+
+    def compressed_index_config(self, num_vectors: int, kind: str = 'ivfpq', pq_m: int = None,
+                                rerank_factor: int = 4) -> Dict[str, Any]:
+        """
+        Сжатый индекс для уменьшения RAM и размера архива с данными.
+
+        Args:
+            kind: 'sq8' (~4x), 'sq4' (~8x) или 'ivfpq' (~16x при pq_m = dim / 4)
+            pq_m: число подквантизаторов PQ (байт на вектор)
+            rerank_factor: во сколько раз больше кандидатов брать из индекса для
+                точной переоценки по embeddings_{lang}.npy (0 - без переоценки)
+        """
+        if kind == 'sq8':
+            config = {'spec': 'SQ8', 'search_params': {}}
+        elif kind == 'sq4':
+            config = {'spec': 'SQ4', 'search_params': {}}
+        elif kind == 'ivfpq':
+            pq_m = pq_m or self.embedding_dim // 4
+            nlist = int(min(4096, max(1, np.sqrt(num_vectors))))
+            config = {'spec': f'IVF{nlist},PQ{pq_m}', 'search_params': {'nprobe': min(16, nlist)}}
+        else:
+            raise ValueError(f"Неизвестный тип сжатого индекса: {kind}")
+
+        if rerank_factor and rerank_factor > 1:
+            # RAGEngine переоценивает кандидатов по точным векторам, если матрица лежит рядом с индексом
+            config['rerank'] = {'factor': int(rerank_factor)}
+        return config
+
+    def _prepare_vectors(self, embeddings: np.ndarray, normalized: bool) -> np.ndarray:
+        """Приводит матрицу к float32 и L2-нормализует ее, если это еще не сделано."""
+        # float32 mmap передается в FAISS как есть, float16 требует одного приведения типа
+        vectors = np.ascontiguousarray(embeddings, dtype='float32')
+        if not normalized:
+            if not vectors.flags.writeable:
+                vectors = vectors.copy()
+            faiss.normalize_L2(vectors)
+        return vectors
+
+    def _build_from_config(self, vectors: np.ndarray, config: Dict[str, Any], verbose: bool = True) -> faiss.Index:
+        """Строит индекс по строке index_factory и выставляет параметры построения и поиска."""
+        spec = config['spec']
+        index = faiss.index_factory(self.embedding_dim, spec, METRICS[self.metric])
+        apply_build_params(index, config.get('build_params', {}))
+        if not index.is_trained:
+            train_size = min(vectors.shape[0], MAX_TRAIN_VECTORS)
+            if verbose:
+                print(f"  ⚙️ Обучаю {spec} на {train_size:,} векторах (может занять некоторое время)...")
+            if train_size < vectors.shape[0]:
+                rng = np.random.default_rng(0)
+                train_ids = np.sort(rng.choice(vectors.shape[0], train_size, replace=False))
+                index.train(vectors[train_ids])
+            else:
+                index.train(vectors)
+        index.add(vectors)
+        apply_search_params(index, config.get('search_params', {}))
+        return index
+
+    def build_index(self, embeddings: np.ndarray, normalized: bool = False,
+                    index_config: Dict[str, Any] = None) -> faiss.Index:
         """
         Строит FAISS индекс из массива эмбеддингов.
         
         Args:
-            embeddings: массив эмбеддингов
+            embeddings: массив эмбеддингов (может быть read-only mmap)
+            normalized: векторы уже L2-нормализованы (нормализация и копия не нужны)
+            index_config: {'spec': строка index_factory, 'build_params': {...}, 'search_params': {...}};
+                по умолчанию - default_index_config()
             
         Returns:
             Построенный FAISS индекс
@@ -91,34 +303,133 @@ class FAISSIndexer:
         start_time = time.time()
         
         # Нормализуем эмбеддинги перед добавлением в индекс
-        faiss.normalize_L2(embeddings)
+        vectors = self._prepare_vectors(embeddings, normalized)
         
-        # Выбираем тип индекса в зависимости от количества эмбеддингов
-        # IndexFlatL2 - простой, для небольших наборов данных
-        # IndexIVFFlat - более сложный, для больших наборов данных, требует обучения
-        if embeddings.shape[0] < 10000: # Можно настроить порог
-            index = faiss.IndexFlatL2(self.embedding_dim)
-            print(f"  📍 Используется IndexFlatL2")
-            index.add(embeddings)
-        else:
-            # Инициализация IndexIVFFlat требует обучения
-            quantizer = faiss.IndexFlatL2(self.embedding_dim)
-            nlist = min(100, int(np.sqrt(embeddings.shape[0]))) # Количество кластеров, эвристика
-            index = faiss.IndexIVFFlat(quantizer, self.embedding_dim, nlist, faiss.METRIC_L2)
-            index.nprobe = min(50, nlist) # Количество кластеров для поиска
-            print(f"  📍 Используется IndexIVFFlat с {nlist} кластерами, nprobe={index.nprobe}")
-            
-            # Обучение индекса
-            if not index.is_trained:
-                print("  ⚙️ Обучаю IndexIVFFlat (может занять некоторое время)...")
-                index.train(embeddings)
-                print("  ✅ Обучение завершено.")
-            
-            index.add(embeddings)
+        if index_config is None:
+            index_config = self.default_index_config(vectors.shape[0])
+        print(f"  📍 Используется {index_config['spec']} {index_config.get('search_params') or ''}")
+        index = self._build_from_config(vectors, index_config)
         
         elapsed = time.time() - start_time
         print(f"✅ Индекс построен за {elapsed:.1f} сек")
         return index
+
+    def candidate_configs(self, num_vectors: int) -> List[Dict[str, Any]]:
+        """
+        Кандидаты для автоподбора: Flat, IVF-Flat, IVF-PQ, OPQ+IVF-PQ, HNSW.
+        Для каждого - набор параметров поиска, которые будут перебраны.
+        """
+        nlist = int(min(4096, max(1, np.sqrt(num_vectors))))
+        nprobes = [p for p in (1, 4, 8, 16, 32, 64, 128) if p <= nlist]
+        # Число подквантизаторов PQ должно делить размерность
+        pq_m = next((m for m in (96, 64, 48, 32, 24, 16, 8) if self.embedding_dim % m == 0), None)
+
+        candidates = [{'spec': 'Flat', 'search_params': [{}]}]
+        # k-means требует ~39 точек на кластер
+        if num_vectors >= 39 * nlist:
+            candidates.append({'spec': f'IVF{nlist},Flat', 'search_params': [{'nprobe': p} for p in nprobes]})
+            # PQ с 8 битами обучает 256 центроидов на подпространство
+            if pq_m and num_vectors >= 39 * 256:
+                candidates.append({'spec': f'IVF{nlist},PQ{pq_m}', 'search_params': [{'nprobe': p} for p in nprobes]})
+                candidates.append({'spec': f'OPQ{pq_m},IVF{nlist},PQ{pq_m}', 'search_params': [{'nprobe': p} for p in nprobes]})
+        ef_searches = [{'efSearch': ef} for ef in (16, 32, 64, 128, 256)]
+        candidates.append({'spec': 'HNSW32', 'build_params': {'efConstruction': 200}, 'search_params': ef_searches})
+        candidates.append({'spec': 'HNSW32_SQ8', 'build_params': {'efConstruction': 200}, 'search_params': ef_searches})
+        return candidates
+
+    def measure_index(self, index: faiss.Index, queries: np.ndarray, ground_truth: np.ndarray,
+                      k: int, search_params: Dict[str, Any]) -> Dict[str, Any]:
+        """Замеряет recall@k относительно точного поиска и задержку одного запроса."""
+        apply_search_params(index, search_params)
+        found = np.empty((queries.shape[0], k), dtype='int64')
+        start = time.perf_counter()
+        # По одному запросу, как в RAGEngine._search_by_vector
+        for i in range(queries.shape[0]):
+            _, found[i] = index.search(queries[i:i + 1], k)
+        latency_ms = (time.perf_counter() - start) * 1000 / queries.shape[0]
+        hits = sum(len(np.intersect1d(found[i], ground_truth[i])) for i in range(queries.shape[0]))
+        return {
+            'search_params': dict(search_params),
+            'recall_at_k': hits / float(ground_truth.size),
+            'latency_ms': latency_ms
+        }
+
+    def tune_index(self, embeddings: np.ndarray, normalized: bool = False, k: int = 10,
+                   num_queries: int = 200, min_recall: float = 0.95) -> Dict[str, Any]:
+        """
+        Строит индексы-кандидаты на реальных эмбеддингах и выбирает конфигурацию
+        с Парето-фронта (recall@k, задержка, память): самую быструю среди
+        достигших min_recall, при равенстве - самую компактную.
+
+        Returns:
+            index_config для build_index с результатами замеров
+        """
+        vectors = self._prepare_vectors(embeddings, normalized)
+        num_vectors = vectors.shape[0]
+        k = min(k, num_vectors)
+
+        rng = np.random.default_rng(0)
+        query_ids = rng.choice(num_vectors, min(num_queries, num_vectors), replace=False)
+        queries = np.ascontiguousarray(vectors[query_ids])
+
+        exact = faiss.IndexFlat(self.embedding_dim, METRICS[self.metric])
+        exact.add(vectors)
+        _, ground_truth = exact.search(queries, k)
+        del exact
+
+        print(f"\n🎛️ Автоподбор индекса: {num_vectors:,} векторов, {len(query_ids)} запросов, recall@{k} >= {min_recall}")
+        results = []
+        for candidate in self.candidate_configs(num_vectors):
+            spec = candidate['spec']
+            try:
+                build_start = time.time()
+                build_config = {'spec': spec, 'build_params': candidate.get('build_params', {})}
+                index = self._build_from_config(vectors, build_config, verbose=False)
+                build_seconds = time.time() - build_start
+                memory_mb = faiss.serialize_index(index).nbytes / (1024 * 1024)
+            except Exception as e:
+                print(f"  ⚠️ {spec}: не удалось построить ({e})")
+                continue
+
+            for params in candidate['search_params']:
+                measurement = self.measure_index(index, queries, ground_truth, k, params)
+                measurement.update({'spec': spec, 'build_params': build_config['build_params'],
+                                    'memory_mb': memory_mb, 'build_seconds': build_seconds})
+                results.append(measurement)
+                print(f"  📐 {spec:<24} {str(params):<20} recall@{k}={measurement['recall_at_k']:.3f} "
+                      f"{measurement['latency_ms']:.3f} мс {memory_mb:.1f} МБ")
+            del index
+
+        if not results:
+            raise RuntimeError("Ни один индекс-кандидат не был построен")
+
+        pareto = pareto_front(results)
+        acceptable = [r for r in pareto if r['recall_at_k'] >= min_recall]
+        if acceptable:
+            best = min(acceptable, key=lambda r: (r['latency_ms'], r['memory_mb']))
+        else:
+            best = max(pareto, key=lambda r: (r['recall_at_k'], -r['latency_ms']))
+            print(f"  ⚠️ Ни один кандидат не достиг recall@{k} >= {min_recall}, беру самый точный")
+
+        print(f"🏆 Выбран {best['spec']} {best['search_params']}: recall@{k}={best['recall_at_k']:.3f}, "
+              f"{best['latency_ms']:.3f} мс, {best['memory_mb']:.1f} МБ")
+        return {
+            'spec': best['spec'],
+            'build_params': best['build_params'],
+            'search_params': best['search_params'],
+            'tuning': {
+                'k': k,
+                'num_queries': len(query_ids),
+                'min_recall': min_recall,
+                'recall_at_k': best['recall_at_k'],
+                'latency_ms': best['latency_ms'],
+                'memory_mb': best['memory_mb'],
+                'pareto_front': [
+                    {key: r[key] for key in ('spec', 'search_params', 'recall_at_k', 'latency_ms', 'memory_mb')}
+                    for r in pareto
+                ]
+            }
+        }
     
     def save_index(self, index: faiss.Index, metadata: Dict, language: str = 'ru'):
         """
@@ -133,8 +444,9 @@ class FAISSIndexer:
         print(f"✅ Индекс сохранён: {index_size:.2f} МБ")
         
         # Добавляем информацию о модели эмбеддингов в метаданные индекса
-        metadata['embedding_model'] = "models/text-embedding-004"
+        metadata['embedding_model'] = metadata.get('model', "models/text-embedding-004")
         metadata['embedding_dim'] = self.embedding_dim
+        metadata['metric'] = 'ip' if index.metric_type == faiss.METRIC_INNER_PRODUCT else 'l2'
 
         with open(metadata_file, 'w', encoding='utf-8') as f:
             json.dump(metadata, f, ensure_ascii=False, indent=2)
@@ -142,15 +454,88 @@ class FAISSIndexer:
         print(f"✅ Метаданные сохранены: {metadata_size:.2f} МБ")
         return index_file, metadata_file
 
-    def process_language(self, language: str = 'ru') -> Dict[str, Any]:
+    def migrate_to_inner_product(self, language: str = 'ru', data_dir: str = 'rag') -> bool:
+        """
+        Перестраивает существующий L2 индекс в METRIC_INNER_PRODUCT без повторной
+        генерации эмбеддингов. Векторы берутся из embeddings_{lang}.npy, а если его
+        нет - восстанавливаются из самого индекса. Тип индекса и параметры поиска
+        сохраняются; файлы заменяются атомарно.
+        """
+        data_dir = Path(data_dir)
+        index_file = data_dir / f"faiss_index_{language}.bin"
+        metadata_file = data_dir / f"faiss_metadata_{language}.json"
+
+        if not index_file.exists():
+            print(f"⚠️  Индекс {index_file} не найден. Пропускаю {language}.")
+            return False
+        # Без метаданных у индекса нет таблицы строк: движок не сможет сопоставить результаты с чанками
+        if not metadata_file.exists():
+            print(f"⚠️  Метаданные {metadata_file} не найдены. Пропускаю {language}.")
+            return False
+
+        old_index = faiss.read_index(str(index_file))
+        if old_index.metric_type == faiss.METRIC_INNER_PRODUCT:
+            print(f"⏩ Индекс {index_file} уже использует inner product.")
+            return True
+
+        with open(metadata_file, 'r', encoding='utf-8') as f:
+            metadata = json.load(f)
+
+        embeddings_file = data_dir / embeddings_file_name(language)
+        vectors = None
+        if embeddings_file.exists():
+            vectors = load_embedding_matrix(str(embeddings_file))
+            if vectors.shape[0] != old_index.ntotal:
+                print(f"⚠️  {embeddings_file.name} не совпадает с индексом, восстанавливаю векторы из индекса")
+                vectors = None
+        if vectors is None:
+            print(f"🔁 Восстанавливаю {old_index.ntotal:,} векторов из {index_file}...")
+            vectors = reconstruct_vectors(old_index)
+
+        index_config = metadata.get('index_config')
+        if not index_config:
+            try:
+                index_config = infer_index_config(old_index)
+            except ValueError as e:
+                print(f"⚠️  {e}. Пропускаю {language}: перестройте индекс через faiss_indexer.py --force.")
+                return False
+        self.embedding_dim = old_index.d
+        self.metric = 'ip'
+        del old_index
+
+        index = self.build_index(vectors, normalized=False, index_config=index_config)
+
+        tmp_index_file = index_file.with_name(index_file.name + '.tmp')
+        faiss.write_index(index, str(tmp_index_file))
+        os.replace(tmp_index_file, index_file)
+
+        metadata['metric'] = 'ip'
+        metadata['index_config'] = index_config
+        tmp_metadata_file = metadata_file.with_name(metadata_file.name + '.tmp')
+        with open(tmp_metadata_file, 'w', encoding='utf-8') as f:
+            json.dump(metadata, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_metadata_file, metadata_file)
+
+        print(f"✅ {index_file} перестроен с METRIC_INNER_PRODUCT ({index_config['spec']})")
+        return True
+
+    def process_language(self, language: str = 'ru', tune: bool = False, force: bool = False,
+                         k: int = 10, min_recall: float = 0.95,
+                         index_config: Dict[str, Any] = None) -> Dict[str, Any]:
         """
         Полный процесс создания индекса для одного языка.
+
+        Args:
+            tune: подобрать тип индекса и параметры поиска замерами (tune_index)
+            force: пересобрать индекс, даже если он уже существует
+            index_config: явная конфигурация индекса (например, hnsw_index_config())
+                или {'compress': 'ivfpq'|'sq8'|'sq4', ...} для compressed_index_config()
         """
         index_file = f"rag/faiss_index_{language}.bin"
         metadata_file_out = f"rag/faiss_metadata_{language}.json"
 
         # Проверяем, существует ли индекс и метаданные
-        if Path(index_file).exists() and Path(metadata_file_out).exists():
+        if not force and Path(index_file).exists() and Path(metadata_file_out).exists():
             index_size = Path(index_file).stat().st_size / (1024*1024)
             print(f"⏩ Индекс и метаданные для {language} уже существуют ({index_size:.2f} МБ). Пропускаю обработку.")
             
@@ -171,12 +556,23 @@ class FAISSIndexer:
         if embeddings is None or metadata is None:
             return None
 
-        index = self.build_index(embeddings)
+        # Локальные модели дают другую размерность (например, 384 у multilingual-e5-small)
+        self.embedding_dim = embeddings.shape[1]
+        normalized = metadata.get('normalized', False)
+        if tune:
+            index_config = self.tune_index(embeddings, normalized=normalized, k=k, min_recall=min_recall)
+        elif index_config and 'compress' in index_config:
+            index_config = self.compressed_index_config(
+                embeddings.shape[0], kind=index_config['compress'],
+                pq_m=index_config.get('pq_m'), rerank_factor=index_config.get('rerank_factor', 4)
+            )
+        index_config = index_config or self.default_index_config(embeddings.shape[0])
+
+        index = self.build_index(embeddings, normalized=normalized, index_config=index_config)
+        # RAGEngine применяет search_params из index_config при загрузке индекса
+        metadata['index_config'] = index_config
         index_file, metadata_file = self.save_index(index, metadata, language)
         
-        # Тестирование поиска (опционально, можно добавить сюда)
-        # self.test_search(index, embeddings, metadata, language)
-        
         stats = {
             'language': language,
             'total_embeddings': embeddings.shape[0],
@@ -187,26 +583,29 @@ class FAISSIndexer:
         return stats
 
 
-def process_all_languages():
+def process_all_languages(tune: bool = False, force: bool = False, k: int = 10, min_recall: float = 0.95,
+                          index_config: Dict[str, Any] = None, metric: str = 'ip'):
     """Обрабатывает индексы для обоих языков."""
     
     print("="*70)
     print("🔍 СОЗДАНИЕ FAISS ИНДЕКСОВ")
     print("="*70)
     
-    indexer = FAISSIndexer(embedding_dim=768) # Обновленная размерность
+    indexer = FAISSIndexer(embedding_dim=768, metric=metric) # Обновленная размерность
     
     all_stats = {}
     
     print("\n📍 ЭТАП 1: ИНДЕКС ДЛЯ РУССКИХ ПИСАНИЙ")
     print("-" * 70)
-    stats_ru = indexer.process_language('ru')
+    stats_ru = indexer.process_language('ru', tune=tune, force=force, k=k, min_recall=min_recall,
+                                        index_config=index_config)
     if stats_ru:
         all_stats['ru'] = stats_ru
     
     print("\n📍 ЭТАП 2: ИНДЕКС ДЛЯ АНГЛИЙСКИХ ПИСАНИЙ")
     print("-" * 70)
-    stats_en = indexer.process_language('en')
+    stats_en = indexer.process_language('en', tune=tune, force=force, k=k, min_recall=min_recall,
+                                        index_config=index_config)
     if stats_en:
         all_stats['en'] = stats_en
     
@@ -235,4 +634,42 @@ def process_all_languages():
 
 
 if __name__ == "__main__":
-    process_all_languages()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Создание FAISS индексов")
+    parser.add_argument('--tune', action='store_true', help="подобрать тип индекса и параметры по recall/задержке/памяти")
+    parser.add_argument('--force', action='store_true', help="пересобрать существующие индексы")
+    parser.add_argument('--k', type=int, default=10, help="k для recall@k при автоподборе")
+    parser.add_argument('--min-recall', type=float, default=0.95, help="минимальный recall@k при автоподборе")
+    parser.add_argument('--hnsw', action='store_true', help="построить HNSW индекс")
+    parser.add_argument('--hnsw-m', type=int, default=32, help="HNSW: число связей на узел")
+    parser.add_argument('--ef-construction', type=int, default=200, help="HNSW: efConstruction")
+    parser.add_argument('--ef-search', type=int, default=64, help="HNSW: efSearch по умолчанию")
+    parser.add_argument('--hnsw-sq', choices=['SQ8', 'SQ4'], help="HNSW поверх скалярно-квантованных векторов")
+    parser.add_argument('--compress', choices=['ivfpq', 'sq8', 'sq4'], help="сжатый индекс (IVF-PQ / SQ8 / SQ4)")
+    parser.add_argument('--pq-m', type=int, help="IVF-PQ: байт на вектор (по умолчанию dim/4)")
+    parser.add_argument('--rerank-factor', type=int, default=4,
+                        help="сжатый индекс: запас кандидатов для точной переоценки по embeddings_{lang}.npy (0 - выкл.)")
+    parser.add_argument('--metric', choices=['ip', 'l2'], default='ip', help="метрика нового индекса")
+    parser.add_argument('--migrate-ip', action='store_true',
+                        help="перестроить существующие L2 индексы в inner product без повторных эмбеддингов")
+    parser.add_argument('--data-dir', default='rag', help="папка с индексами для --migrate-ip")
+    args = parser.parse_args()
+
+    if args.migrate_ip:
+        for lang in ('ru', 'en'):
+            FAISSIndexer().migrate_to_inner_product(lang, data_dir=args.data_dir)
+        raise SystemExit(0)
+
+    config = None
+    if args.compress:
+        # nlist для IVF-PQ считается в process_language по фактическому числу векторов
+        config = {'compress': args.compress, 'pq_m': args.pq_m, 'rerank_factor': args.rerank_factor}
+    elif args.hnsw:
+        config = FAISSIndexer(embedding_dim=768).hnsw_index_config(
+            m=args.hnsw_m, ef_construction=args.ef_construction,
+            ef_search=args.ef_search, scalar_quantizer=args.hnsw_sq
+        )
+
+    process_all_languages(tune=args.tune, force=args.force or args.tune or config is not None,
+                          k=args.k, min_recall=args.min_recall, index_config=config, metric=args.metric)
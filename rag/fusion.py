@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+🔀 ГИБРИДНОЕ СЛИЯНИЕ НА NUMPY
+
+Каждый поиск (вектор, BM25, простой поиск) отдает строки индекса в порядке ранга.
+fuse сливает их без словарей и циклов по результатам:
+- rrf     - взвешенный Reciprocal Rank Fusion: sum(w / (k + rank));
+- combsum - сумма взвешенных оценок, нормированных min-max в каждом поиске;
+- combmnz - combsum, умноженный на число поисков, нашедших строку.
+
+Закрепленные строки (точные совпадения стихов) всегда идут первыми в своем порядке -
+это отдельная маска, а не "очень большая оценка".
+"""
+
+from typing import Dict, Mapping, Optional, Sequence
+
+import numpy as np
+
+RRF_K = 60
+FUSION_METHODS = ('rrf', 'combsum', 'combmnz')
+# Вес каждого поиска по умолчанию (неизвестные имена - вес 1.0)
+DEFAULT_WEIGHTS = {'vector': 1.0, 'keyword': 1.0, 'simple_match': 1.0}
+
+
+class FusionResult:
+    """Итог слияния: строки по убыванию, их оценки, маска закрепленных и ранги в каждом поиске (0 - не найдена)."""
+
+    __slots__ = ('row_ids', 'scores', 'pinned', 'ranks')
+
+    def __init__(self, row_ids: np.ndarray, scores: np.ndarray, pinned: np.ndarray, ranks: Dict[str, np.ndarray]):
+        self.row_ids = row_ids
+        self.scores = scores
+        self.pinned = pinned
+        self.ranks = ranks
+
+    def __len__(self) -> int:
+        return len(self.row_ids)
+
+
+def _normalized(scores: np.ndarray) -> np.ndarray:
+    """min-max в [0, 1]; одинаковые оценки - все по 1."""
+    low, high = scores.min(), scores.max()
+    if high - low <= 0:
+        return np.ones_like(scores)
+    return (scores - low) / (high - low)
+
+
+def fuse(rankings: Mapping[str, Sequence[int]], method: str = 'rrf',
+         weights: Optional[Mapping[str, float]] = None, k: int = RRF_K,
+         scores: Optional[Mapping[str, Sequence[float]]] = None,
+         pinned: Sequence[int] = (), limit: Optional[int] = None) -> FusionResult:
+    """
+    Args:
+        rankings: имя поиска -> строки индекса в порядке ранга (дубликаты - по первому вхождению)
+        weights: имя поиска -> вес (по умолчанию DEFAULT_WEIGHTS)
+        scores: имя поиска -> исходные оценки (нужны для combsum/combmnz)
+        pinned: строки, которые идут первыми в этом порядке
+        limit: сколько строк вернуть (None - все)
+    """
+    if method not in FUSION_METHODS:
+        raise ValueError(f"Неизвестный метод слияния: {method} (доступны: {', '.join(FUSION_METHODS)})")
+    weights = {**DEFAULT_WEIGHTS, **(weights or {})}
+    pinned = np.asarray(pinned, dtype='int64')
+    names = list(rankings)
+    lists = [np.asarray(rankings[name], dtype='int64') for name in names]
+
+    all_ids = np.concatenate([pinned] + lists) if lists or len(pinned) else np.empty(0, dtype='int64')
+    unique_ids, first_seen, inverse = np.unique(all_ids, return_index=True, return_inverse=True)
+    total = np.zeros(len(unique_ids), dtype='float64')
+    hits = np.zeros(len(unique_ids), dtype='int32')
+    ranks: Dict[str, np.ndarray] = {}
+
+    offset = len(pinned)
+    for name, ids in zip(names, lists):
+        slots = inverse[offset:offset + len(ids)]
+        offset += len(ids)
+        # Первое вхождение каждой строки в этом списке
+        _, first = np.unique(slots, return_index=True)
+        slots_first = slots[first]
+        rank = first + 1
+
+        rank_of = np.zeros(len(unique_ids), dtype='int32')
+        rank_of[slots_first] = rank
+        ranks[name] = rank_of
+        if not len(first):
+            continue
+
+        weight = float(weights.get(name, 1.0))
+        if method == 'rrf':
+            contribution = weight / (k + rank)
+        else:
+            if scores is None or name not in scores:
+                raise ValueError(f"Для {method} нужны оценки поиска '{name}'")
+            contribution = weight * _normalized(np.asarray(scores[name], dtype='float64')[first])
+        np.add.at(total, slots_first, contribution)
+        np.add.at(hits, slots_first, 1)
+
+    if method == 'combmnz':
+        total *= hits
+
+    is_pinned = np.zeros(len(unique_ids), dtype=bool)
+    pin_order = np.full(len(unique_ids), np.inf)
+    if len(pinned):
+        pin_slots = inverse[:len(pinned)]
+        _, first_pin = np.unique(pin_slots, return_index=True)
+        is_pinned[pin_slots[first_pin]] = True
+        pin_order[pin_slots[first_pin]] = first_pin
+
+    candidates = np.arange(len(unique_ids))
+
+    # Закрепленные - первыми в своем порядке, остальные - по убыванию оценки,
+    # при равенстве - кто раньше встретился (порядок поисков как в rankings)
+    order_key = np.where(is_pinned[candidates], -np.inf, -total[candidates])
+    if limit is not None and limit < len(candidates):
+        top = np.argpartition(order_key, limit - 1)[:limit] if limit > 0 else np.empty(0, dtype='int64')
+        candidates, order_key = candidates[top], order_key[top]
+    chosen = candidates[np.lexsort((first_seen[candidates], pin_order[candidates], order_key))]
+
+    return FusionResult(
+        row_ids=unique_ids[chosen],
+        scores=total[chosen],
+        pinned=is_pinned[chosen],
+        ranks={name: rank_of[chosen] for name, rank_of in ranks.items()}
+    )
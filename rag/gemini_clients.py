@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+🔑 ПУЛ КЛИЕНТОВ GEMINI ПО КЛЮЧАМ
+
+genai.configure(api_key=...) меняет глобальное состояние модуля: запросы с разными
+ключами пользователей в параллельных потоках перетирали ключ друг другу, а каждое
+переключение создавало новый клиент и новые TLS-соединения.
+
+Пул держит по клиенту GenerativeServiceClient на ключ (REST-транспорт - сессия
+requests с keep-alive, соединения переиспользуются между запросами):
+- не больше max_clients клиентов: при переполнении закрывается давно не используемый;
+- клиент, простоявший idle_seconds, закрывается при следующем обращении к пулу;
+- клиент, который еще занят запросом, закрывается, когда запрос его вернет.
+"""
+
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator
+
+logger = logging.getLogger(__name__)
+
+
+def make_client(api_key: str):
+    """Клиент Gemini API с собственным ключом (не трогает genai.configure)."""
+    import google.ai.generativelanguage as glm
+
+    return glm.GenerativeServiceClient(client_options={'api_key': api_key}, transport='rest')
+
+
+def close_client(client: Any):
+    """Закрывает HTTP-сессию клиента (ошибки закрытия не важны)."""
+    transport = getattr(client, 'transport', None)
+    try:
+        if transport is not None:
+            transport.close()
+    except Exception as e:
+        logger.debug(f"Ошибка при закрытии клиента Gemini: {e}")
+
+
+def key_fingerprint(api_key: str) -> str:
+    """Ключ пула: сам ключ в памяти пула не хранится."""
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()
+
+
+class _PooledClient:
+    __slots__ = ('client', 'last_used', 'leases', 'evicted')
+
+    def __init__(self, client: Any, now: float):
+        self.client = client
+        self.last_used = now
+        self.leases = 0 # сколько запросов сейчас работают с клиентом
+        self.evicted = False
+
+
+class GeminiClientPool:
+    """
+    Потокобезопасный LRU-пул клиентов по ключу API с вытеснением простаивающих.
+    Клиент выдается в аренду (lease): вытесненный клиент закрывается только после того,
+    как его вернет последний запрос, - иначе закрытие оборвало бы чужой вызов на полпути.
+    """
+
+    def __init__(self, max_clients: int = 32, idle_seconds: float = 600.0,
+                 factory: Callable[[str], Any] = make_client, close: Callable[[Any], None] = close_client,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_clients = max_clients
+        self.idle_seconds = idle_seconds
+        self.factory = factory
+        self.close = close
+        self.clock = clock
+        self.created = 0
+        self.evicted = 0
+        self._clients: 'OrderedDict[str, _PooledClient]' = OrderedDict() # отпечаток ключа -> клиент
+        self._lock = threading.Lock()
+
+    def _evict(self, fingerprint: str, to_close: list):
+        entry = self._clients.pop(fingerprint)
+        entry.evicted = True
+        self.evicted += 1
+        if entry.leases == 0:
+            to_close.append(entry.client)
+
+    def _evict_idle(self, now: float, to_close: list):
+        # Порядок - от давно использованных к недавним: простаивающие в начале
+        for fingerprint, entry in list(self._clients.items()):
+            if now - entry.last_used < self.idle_seconds:
+                break
+            self._evict(fingerprint, to_close)
+
+    def _acquire(self, api_key: str) -> _PooledClient:
+        fingerprint = key_fingerprint(api_key)
+        to_close = []
+        with self._lock:
+            now = self.clock()
+            self._evict_idle(now, to_close)
+            entry = self._clients.get(fingerprint)
+            if entry is None:
+                entry = self._clients[fingerprint] = _PooledClient(self.factory(api_key), now)
+                self.created += 1
+                while len(self._clients) > self.max_clients:
+                    self._evict(next(iter(self._clients)), to_close)
+            else:
+                self._clients.move_to_end(fingerprint)
+            entry.last_used = now
+            entry.leases += 1
+        # Закрытие - вне блокировки: другие потоки не ждут сеть
+        for client in to_close:
+            self.close(client)
+        return entry
+
+    def _release(self, entry: _PooledClient):
+        with self._lock:
+            entry.leases -= 1
+            entry.last_used = self.clock()
+            close = entry.evicted and entry.leases == 0
+        if close:
+            self.close(entry.client)
+
+    @contextmanager
+    def lease(self, api_key: str) -> Iterator[Any]:
+        """Клиент для ключа (существующий из пула или новый) на время вызова."""
+        entry = self._acquire(api_key)
+        try:
+            yield entry.client
+        finally:
+            self._release(entry)
+
+    def clear(self):
+        """Вытесняет все клиенты (остановка сервера); занятые закроются по возврату."""
+        to_close = []
+        with self._lock:
+            for fingerprint in list(self._clients):
+                self._evict(fingerprint, to_close)
+        for client in to_close:
+            self.close(client)
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'clients': len(self._clients), 'max_clients': self.max_clients,
+                    'in_use': sum(entry.leases for entry in self._clients.values()),
+                    'created': self.created, 'evicted': self.evicted}
+
+
+# Общий пул процесса: переживает горячую перезагрузку движка (соединения остаются открытыми)
+shared_pool = GeminiClientPool()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+🚦 ДЕГРАДАЦИЯ ПОИСКА ПОД НАГРУЗКОЙ
+
+Когда запросов в работе становится слишком много или p95 последних запросов
+выходит за SLO, поиск постепенно упрощается, чтобы сервис отвечал всем:
+  0 normal         - полный конвейер;
+  1 no_expansion   - без расширения запроса (один эмбеддинг вместо пяти);
+  2 shallow_rerank - cross-encoder оценивает только первые SHALLOW_RERANK_DEPTH кандидатов;
+  3 no_rerank      - без переранжирования;
+  4 lexical_only   - только BM25 и точная фраза (без эмбеддингов и FAISS).
+
+Уровень поднимается сразу, а опускается не чаще раза в recovery_seconds:
+иначе быстрые ответы в деградированном режиме сразу возвращали бы полную нагрузку.
+
+Пакет /api/search/batch (до MAX_BATCH_QUERIES запросов) попадает в p95 задержкой
+на один запрос (время пакета / число запросов): иначе несколько пакетов агента
+выводили бы p95 за SLO и деградировали поиск всем пользователям. В очереди пакет
+считается одним запросом - эмбеддинги и переранжирование у него общие, один проход.
+"""
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Sequence
+
+try:
+    from rag.metrics import SEARCH_IN_FLIGHT, DEGRADATION_LEVEL, DEGRADED_REQUESTS
+except ImportError:
+    from metrics import SEARCH_IN_FLIGHT, DEGRADATION_LEVEL, DEGRADED_REQUESTS
+
+MODES = ('normal', 'no_expansion', 'shallow_rerank', 'no_rerank', 'lexical_only')
+SHALLOW_RERANK_DEPTH = 5
+
+# Уровень по числу запросов в работе: > 4 - уровень 1, > 8 - уровень 2 и т.д.
+DEFAULT_QUEUE_THRESHOLDS = (4, 8, 12, 16)
+# Уровень по p95: p95 > SLO * 1.0 - уровень 1, > SLO * 1.25 - уровень 2 и т.д.
+DEFAULT_P95_RATIOS = (1.0, 1.25, 1.5, 2.0)
+# p95 считается по последним запросам окна, но не больше стольких (сортировка на каждый запрос)
+MAX_LATENCY_SAMPLES = 1000
+
+
+def degraded_options(level: int) -> Dict[str, Any]:
+    """Параметры RAGEngine.search / search_batch для уровня деградации."""
+    options: Dict[str, Any] = {}
+    if level >= 1:
+        options['expand_query'] = False
+    if level >= 2:
+        options['rerank_depth'] = SHALLOW_RERANK_DEPTH
+    if level >= 3:
+        options['use_reranking'] = False
+    if level >= 4:
+        options['lexical_only'] = True
+    return options
+
+
+class LoadController:
+    """Уровень деградации по глубине очереди и p95 недавних запросов."""
+
+    def __init__(self, slo_p95_ms: float = 1500.0,
+                 queue_thresholds: Sequence[int] = DEFAULT_QUEUE_THRESHOLDS,
+                 p95_ratios: Sequence[float] = DEFAULT_P95_RATIOS,
+                 window_seconds: float = 30.0, min_samples: int = 20,
+                 recovery_seconds: float = 5.0, clock: Callable[[], float] = time.monotonic):
+        self.slo_p95_ms = slo_p95_ms
+        self.queue_thresholds = tuple(queue_thresholds)
+        self.p95_ratios = tuple(p95_ratios)
+        self.window_seconds = window_seconds
+        self.min_samples = min_samples
+        self.recovery_seconds = recovery_seconds
+        self.clock = clock
+        self.in_flight = 0
+        self.level = 0
+        self._changed_at = 0.0
+        self._latencies: deque = deque(maxlen=MAX_LATENCY_SAMPLES) # (время завершения, мс)
+        self._lock = threading.Lock()
+
+    def p95_ms(self) -> float:
+        """p95 запросов за последние window_seconds (0, если их меньше min_samples)."""
+        if len(self._latencies) < self.min_samples:
+            return 0.0
+        values = sorted(latency for _, latency in self._latencies)
+        return values[min(len(values) - 1, int(len(values) * 0.95))]
+
+    def _target_level(self) -> int:
+        by_queue = sum(1 for threshold in self.queue_thresholds if self.in_flight > threshold)
+        p95 = self.p95_ms()
+        by_latency = sum(1 for ratio in self.p95_ratios if p95 > self.slo_p95_ms * ratio) if p95 else 0
+        return min(len(MODES) - 1, max(by_queue, by_latency))
+
+    def _update(self, now: float):
+        while self._latencies and now - self._latencies[0][0] > self.window_seconds:
+            self._latencies.popleft()
+        target = self._target_level()
+        if target > self.level:
+            self.level, self._changed_at = target, now
+        elif target < self.level and now - self._changed_at >= self.recovery_seconds:
+            self.level, self._changed_at = self.level - 1, now
+        DEGRADATION_LEVEL.set(self.level)
+
+    @contextmanager
+    def admit(self, queries: int = 1) -> Iterator[int]:
+        """
+        Запрос в работе: отдает уровень деградации, по выходу записывает задержку.
+        queries - сколько поисковых запросов в пакете (задержка делится на них).
+        """
+        with self._lock:
+            self.in_flight += 1
+            SEARCH_IN_FLIGHT.set(self.in_flight)
+            self._update(self.clock())
+            level = self.level
+        if level:
+            DEGRADED_REQUESTS.inc(mode=MODES[level])
+        started_at = time.perf_counter()
+        try:
+            yield level
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+                SEARCH_IN_FLIGHT.set(self.in_flight)
+            self.record((time.perf_counter() - started_at) * 1000, queries)
+
+    def record(self, latency_ms: float, queries: int = 1):
+        """Задержка завершенного запроса (учитывается в p95); у пакета - на один его запрос."""
+        with self._lock:
+            self._latencies.append((self.clock(), latency_ms / max(1, queries)))
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'level': self.level, 'mode': MODES[self.level], 'in_flight': self.in_flight,
+                    'p95_ms': round(self.p95_ms(), 1), 'slo_p95_ms': self.slo_p95_ms}
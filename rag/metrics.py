@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+📈 МЕТРИКИ ПОИСКА
+
+Гистограммы и счетчики в памяти процесса (без prometheus_client):
+- RAGEngine.search замеряет каждый этап через StageTimer
+  (search_batch - в отдельную гистограмму, там время на весь пакет);
+- /api/metrics отдает все в текстовом формате Prometheus.
+
+Этапы поиска: exact, expansion, embedding, vector, bm25, simple_match,
+fusion, diversify, rerank и total (весь запрос).
+Нагрузка: запросы в работе и уровень деградации (load_shedding.py),
+состояние предохранителей внешних вызовов (circuit_breaker.py).
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Границы корзин (сек): от 1 мс до 30 сек, с запасом под embedding через сеть
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values)) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != float('inf') else '+Inf'
+
+
+class Counter:
+    """Монотонный счетчик с метками."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(str(labels[name]) for name in self.labelnames), 0.0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Gauge:
+    """Текущее значение с метками (может расти и падать)."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(str(labels[name]) for name in self.labelnames), 0.0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами (кумулятивные счетчики, как в Prometheus)."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # метки -> [счетчики по корзинам (+Inf последней), сумма, количество]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        position = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][position] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, **labels) -> int:
+        series = self._series.get(tuple(str(labels[name]) for name in self.labelnames))
+        return series[2] if series else 0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += bucket_count
+                    labels = _format_labels(self.labelnames, key, ('le', _format_value(bound)))
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Набор метрик процесса."""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Текстовый формат Prometheus (version 0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+SEARCH_STAGE_SECONDS = REGISTRY.histogram(
+    'rag_search_stage_seconds', 'Latency of RAGEngine.search stages', labelnames=('stage', 'language'))
+SEARCH_BATCH_STAGE_SECONDS = REGISTRY.histogram(
+    'rag_search_batch_stage_seconds', 'Latency of RAGEngine.search_batch stages (whole batch)',
+    labelnames=('stage', 'language'))
+SEARCH_REQUESTS = REGISTRY.counter(
+    'rag_search_requests_total', 'Search requests by outcome', labelnames=('language', 'outcome'))
+SEARCH_IN_FLIGHT = REGISTRY.gauge('rag_search_in_flight', 'Search requests being processed')
+DEGRADATION_LEVEL = REGISTRY.gauge(
+    'rag_degradation_level', 'Load-shedding level (0 - full pipeline, see load_shedding.py)')
+DEGRADED_REQUESTS = REGISTRY.counter(
+    'rag_degraded_requests_total', 'Search requests served in a degraded mode', labelnames=('mode',))
+CIRCUIT_STATE = REGISTRY.gauge(
+    'rag_circuit_state', 'Circuit breaker state (0 - closed, 1 - half-open, 2 - open)', labelnames=('name',))
+CIRCUIT_REJECTIONS = REGISTRY.counter(
+    'rag_circuit_rejections_total', 'Calls rejected by an open circuit breaker', labelnames=('name',))
+
+
+class StageTimer:
+    """
+    Замер этапов поиска "по кругам": lap(stage) записывает время с прошлой
+    отметки, поэтому этапы не нужно оборачивать в блоки with.
+    """
+
+    def __init__(self, language: str = '', histogram: Histogram = SEARCH_STAGE_SECONDS):
+        self.language = language
+        self.histogram = histogram
+        self.started_at = time.perf_counter()
+        self._last = self.started_at
+        self.timings: Dict[str, float] = {} # этап -> мс
+
+    def lap(self, stage: str) -> float:
+        now = time.perf_counter()
+        elapsed = now - self._last
+        self._last = now
+        self.histogram.observe(elapsed, stage=stage, language=self.language)
+        self.timings[stage] = round(self.timings.get(stage, 0.0) + elapsed * 1000, 3)
+        return elapsed
+
+    def skip(self):
+        """Сбрасывает отметку, не записывая этап (время между этапами не относится ни к одному)."""
+        self._last = time.perf_counter()
+
+    def finish(self) -> Dict[str, float]:
+        elapsed = time.perf_counter() - self.started_at
+        self.histogram.observe(elapsed, stage='total', language=self.language)
+        self.timings['total'] = round(elapsed * 1000, 3)
+        return self.timings
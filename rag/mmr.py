@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+🎛️ ДИВЕРСИФИКАЦИЯ КАНДИДАТОВ (MMR)
+
+Maximal Marginal Relevance: кандидаты выбираются по одному, и каждый
+следующий - тот, у кого лучше баланс между релевантностью и непохожестью
+на уже выбранных:
+
+    mmr(d) = λ · relevance(d) − (1 − λ) · max_{s ∈ выбранные} cos(d, s)
+
+Соседние перекрывающиеся чанки одной главы почти совпадают по вектору,
+поэтому MMR не дает им занять все места перед переранжированием.
+"""
+
+from typing import List, Optional
+
+import numpy as np
+
+
+def mmr_select(relevance, vectors: np.ndarray, k: int, lambda_mult: float = 0.7,
+               redundancy_threshold: Optional[float] = 0.95, pinned: int = 0) -> List[int]:
+    """
+    Выбирает до k кандидатов по MMR.
+
+    Args:
+        relevance: релевантность кандидатов (любая шкала, нормализуется к [0, 1])
+        vectors: L2-нормализованные векторы кандидатов (n, dim)
+        k: сколько выбрать
+        lambda_mult: 1.0 - только релевантность, 0.0 - только разнообразие
+        redundancy_threshold: кандидаты с cos к уже выбранному не ниже порога
+                              откладываются и добавляются в конец (по релевантности),
+                              только если остальных не хватило до k (None - не откладывать)
+        pinned: первые pinned кандидатов выбираются всегда (точные совпадения)
+
+    Returns:
+        позиции выбранных кандидатов в порядке выбора
+    """
+    relevance = np.asarray(relevance, dtype='float32')
+    n = relevance.shape[0]
+    if n == 0 or k <= 0:
+        return []
+
+    # Шкала считается без закрепленных: они выбираются в любом случае, а их оценки
+    # (другого происхождения, чем у остальных) только растянули бы ее
+    free = relevance[pinned:] if n > pinned else relevance
+    low, span = float(free.min()), float(free.max() - free.min())
+    relevance = np.clip((relevance - low) / span, 0.0, 1.0) if span > 0 else np.ones(n, dtype='float32')
+
+    vectors = np.asarray(vectors, dtype='float32')
+    similarity = vectors @ vectors.T
+
+    selected = list(range(min(pinned, n, k)))
+    available = np.ones(n, dtype=bool)
+    available[selected] = False
+    # Максимальное сходство каждого кандидата с уже выбранными
+    max_similarity = similarity[:, selected].max(axis=1) if selected else np.full(n, -1.0, dtype='float32')
+
+    redundant = np.zeros(n, dtype=bool)
+    while len(selected) < k and available.any():
+        if redundancy_threshold is not None and selected:
+            too_similar = available & (max_similarity >= redundancy_threshold)
+            redundant |= too_similar
+            available &= ~too_similar
+            if not available.any():
+                break
+        penalty = np.maximum(max_similarity, 0.0) if selected else np.zeros(n, dtype='float32')
+        scores = lambda_mult * relevance - (1.0 - lambda_mult) * penalty
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        max_similarity = np.maximum(max_similarity, similarity[:, best])
+
+    if len(selected) < k and redundant.any():
+        # Разнообразных не хватило: лучше почти-повтор, чем меньше top_k результатов
+        backfill = np.flatnonzero(redundant)
+        backfill = backfill[np.argsort(-relevance[backfill], kind='stable')]
+        selected.extend(int(position) for position in backfill[:k - len(selected)])
+
+    return selected
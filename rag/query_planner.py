@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+🧭 ПЛАНИРОВЩИК ЗАПРОСОВ
+
+Полный гибридный поиск (расширение, до пяти эмбеддингов, вектор, BM25,
+полный просмотр корпуса на точную фразу и cross-encoder) окупается не всегда.
+Планировщик по форме запроса выбирает, какие этапы запускать:
+- verse_reference - ссылка на стих: точный поиск по метаданным;
+- term     - одно слово или имя ("Камса", "Шрила Прабхупада"): BM25 и фраза
+             решают сами, вектор - только если они ничего не нашли, без переранжирования;
+- phrase   - короткая фраза: все этапы (синонимы и точная фраза здесь полезнее всего);
+- passage  - длинный текст без вопроса (чаще всего вставленная цитата): без расширения
+             (эмбеддинг сам ловит смысл), но с поиском точной фразы - он и находит цитату;
+- question - вопрос на естественном языке: вектор и BM25 без расширения
+             и без поиска фразы (вопрос дословно в текстах не встречается).
+"""
+
+import re
+from typing import Any, Dict
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+VERSE_REFERENCE = 'verse_reference'
+TERM = 'term'
+PHRASE = 'phrase'
+PASSAGE = 'passage'
+QUESTION = 'question'
+FULL = 'full'
+
+# С этого числа слов запрос - уже не короткая фраза
+PASSAGE_MIN_WORDS = 6
+# Имя из нескольких слов (все с заглавной) - не длиннее
+MAX_NAME_WORDS = 3
+QUESTION_WORDS = {
+    'что', 'как', 'почему', 'зачем', 'кто', 'где', 'когда', 'какой', 'какая', 'какое', 'какие', 'каков', 'чем',
+    'what', 'how', 'why', 'who', 'where', 'when', 'which', 'is', 'are', 'does', 'do', 'can', 'should',
+}
+
+
+class QueryPlan:
+    """Какие этапы поиска запускать для класса запроса."""
+
+    __slots__ = ('query_class', 'expand', 'vector', 'keyword', 'simple_match', 'rerank', 'fallback')
+
+    def __init__(self, query_class: str, expand: bool = True, vector: bool = True, keyword: bool = True,
+                 simple_match: bool = True, rerank: bool = True, fallback: str = None):
+        self.query_class = query_class
+        self.expand = expand
+        self.vector = vector
+        self.keyword = keyword
+        self.simple_match = simple_match
+        self.rerank = rerank
+        self.fallback = fallback # этап, запущенный сверх плана (см. with_fallback)
+
+    def with_fallback(self, stage: str) -> 'QueryPlan':
+        """Копия плана с отметкой, что этап stage пришлось запустить (план не дал результатов)."""
+        plan = QueryPlan(self.query_class, self.expand, self.vector, self.keyword,
+                         self.simple_match, self.rerank, fallback=stage)
+        setattr(plan, stage, True)
+        return plan
+
+    def lexical(self, fallback: str = None, rerank: bool = False) -> 'QueryPlan':
+        """
+        Копия плана только с BM25 и точной фразой: деградация под нагрузкой
+        или fallback='lexical', когда эмбеддинги недоступны.
+        """
+        return QueryPlan(self.query_class, expand=False, vector=False, keyword=True,
+                         simple_match=True, rerank=rerank, fallback=fallback)
+
+    def describe(self) -> Dict[str, Any]:
+        """План для ответа поиска ('plan')."""
+        stages = [name for name in ('expand', 'vector', 'keyword', 'simple_match', 'rerank') if getattr(self, name)]
+        description = {'query_class': self.query_class, 'stages': stages}
+        if self.fallback:
+            description['fallback'] = self.fallback
+        return description
+
+
+PLANS = {
+    VERSE_REFERENCE: QueryPlan(VERSE_REFERENCE, expand=False, vector=False, keyword=False,
+                               simple_match=False, rerank=False),
+    TERM: QueryPlan(TERM, expand=False, vector=False, keyword=True, simple_match=True, rerank=False),
+    PHRASE: QueryPlan(PHRASE),
+    PASSAGE: QueryPlan(PASSAGE, expand=False),
+    QUESTION: QueryPlan(QUESTION, expand=False, simple_match=False),
+    FULL: QueryPlan(FULL), # планировщик выключен
+}
+
+
+def classify_query(query: str) -> str:
+    """Класс запроса (без ссылок на стихи: их находит RAGEngine._detect_verse_reference)."""
+    words = WORD_RE.findall(query)
+    if len(words) <= 1:
+        return TERM
+    if len(words) <= MAX_NAME_WORDS and all(word[0].isupper() for word in words):
+        return TERM
+    if '?' in query or words[0].lower() in QUESTION_WORDS:
+        return QUESTION
+    if len(words) >= PASSAGE_MIN_WORDS:
+        return PASSAGE
+    return PHRASE
+
+
+def plan_query(query: str) -> QueryPlan:
+    return PLANS[classify_query(query)]
@@ -22,6 +22,7 @@ import zipfile
 import requests
 import threading
 import time
+from contextlib import contextmanager
 from pathlib import Path
 
 # --- Настройка логгирования (СРАЗУ) ---
@@ -77,14 +78,36 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 try:
     # ⚠️ КРИТИЧЕСКИЙ ИМПОРТ ⚠️
     try:
-        from rag.rag_engine import RAGEngine
+        from rag.rag_engine import RAGEngine, preload_heavy_modules
     except ImportError:
         sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-        from rag_engine import RAGEngine
+        from rag_engine import RAGEngine, preload_heavy_modules
 except Exception as e:
     logger.critical(f"🔥 FATAL IMPORT ERROR: {e}", exc_info=True)
     # Пытаемся продолжить чтобы сервер запустился и отдал лог, но без движка
     RAGEngine = None 
+    preload_heavy_modules = None
+
+try:
+    from rag.data_downloader import RangeDownloader, fetch_expected_sha256
+    from rag.zip_extractor import download_and_extract
+    from rag.data_manifest import DataUpdater, forget_local_manifest
+    from rag.metrics import REGISTRY
+    from rag.session_memory import SessionMemory
+    from rag.response_format import parse_fields, project_results, dumps, encode_body
+    from rag.fusion import FUSION_METHODS
+    from rag.load_shedding import LoadController, degraded_options, MODES
+    from rag.gemini_clients import shared_pool as gemini_clients
+except ImportError:
+    from data_downloader import RangeDownloader, fetch_expected_sha256
+    from zip_extractor import download_and_extract
+    from data_manifest import DataUpdater, forget_local_manifest
+    from metrics import REGISTRY
+    from session_memory import SessionMemory
+    from response_format import parse_fields, project_results, dumps, encode_body
+    from fusion import FUSION_METHODS
+    from load_shedding import LoadController, degraded_options, MODES
+    from gemini_clients import shared_pool as gemini_clients
 
 # --- Константы ---
 
@@ -101,15 +124,46 @@ CORS(app)
 rag_engine_instance = None
 init_lock = threading.Lock()
 
-# Состояние процесса установки
-setup_state = {
-    "is_downloading": False,
-    "progress": 0,
-    "status": "idle", # idle, downloading, extracting, completed, error
-    "error": None,
-    "current_file": ""
+# --- Горячая перезагрузка движка (RCU) ---
+# Запрос берет ссылку на текущий движок (engine_lease) и работает с ней до конца.
+# Перезагрузка строит новый движок в фоне, атомарно подменяет глобальную ссылку,
+# а старый освобождает, когда завершатся все начатые на нем запросы.
+engine_leases = {} # id(engine) -> число запросов в работе
+lease_cond = threading.Condition()
+reload_lock = threading.Lock()
+ENGINE_DRAIN_TIMEOUT = 120 # сек: дольше ждать старое поколение нет смысла, его соберет GC
+MAX_BATCH_QUERIES = 20 # /api/search/batch: запросов в одном пакете
+# Какие строки индекса уже отданы в каждой сессии агента (session_id в /api/search)
+session_memory = SessionMemory()
+# Деградация поиска под нагрузкой (см. load_shedding.py): SLO на p95 поиска в мс
+load_controller = LoadController(slo_p95_ms=float(os.environ.get("SHUKABASE_SEARCH_SLO_MS", "1500")))
+engine_state = {
+    "generation": 0,
+    "reloading": False,
+    "last_reload_at": None,
+    "last_reload_error": None
 }
 
+def initial_setup_state():
+    """Состояние процесса установки до начала (при старте и после сброса данных)."""
+    return {
+        "is_downloading": False,
+        "progress": 0,
+        "status": "idle", # idle, downloading, extracting, completed, error
+        "error": None,
+        "current_file": "",
+        "downloaded_bytes": 0,
+        "total_bytes": 0,
+        "speed_bps": 0,
+        "eta_seconds": None,
+        "extracted_files": 0,
+        "total_files": 0,
+        "components": {} # загрузка движка: 'reranker', 'ru/index', ... -> loading, ready, failed, missing
+    }
+
+# Состояние процесса установки
+setup_state = initial_setup_state()
+
 # --- Функции для скачивания данных ---
 
 # --- Ссылки на данные (GitHub Releases) ---
@@ -118,11 +172,100 @@ DATA_URLS = {
     'ru': "https://github.com/amritagopi/shukabase-gemini/releases/download/data-v2/shukabase_data_ru.zip",
     'en': "https://github.com/amritagopi/shukabase-gemini/releases/download/data-v2/shukabase_data_en.zip"
 }
+# Языки, которые ставит каждый режим скачивания
+LANGUAGE_MODES = {
+    'all': {'ru', 'en'},
+    'ru': {'ru'},
+    'en': {'en'}
+}
+# Манифест для дельта-обновлений (файлы из манифеста лежат рядом с ним)
+DATA_MANIFEST_URL = os.environ.get(
+    "SHUKABASE_MANIFEST_URL",
+    "https://github.com/amritagopi/shukabase-gemini/releases/download/data-v2/data_manifest.json"
+)
+
+@contextmanager
+def engine_lease():
+    """Текущий движок (или None) на время запроса: пока запрос идет, движок не освободят."""
+    with lease_cond:
+        engine = rag_engine_instance
+        if engine is not None:
+            engine_leases[id(engine)] = engine_leases.get(id(engine), 0) + 1
+    try:
+        yield engine
+    finally:
+        if engine is not None:
+            with lease_cond:
+                engine_leases[id(engine)] -= 1
+                if engine_leases[id(engine)] == 0:
+                    del engine_leases[id(engine)]
+                lease_cond.notify_all()
+
+def report_engine_progress(component, status):
+    """Готовность компонентов движка (RAGEngine on_progress) для сплэша: 95-99% стадии initializing."""
+    components = setup_state["components"]
+    components[component] = status
+    if setup_state["status"] == "initializing":
+        done = sum(1 for value in list(components.values()) if value != 'loading')
+        setup_state["progress"] = max(setup_state["progress"], 95 + int(done / len(components) * 4))
+
+def swap_engine(new_engine):
+    """Атомарно публикует новый движок и возвращает предыдущий."""
+    global rag_engine_instance
+    with lease_cond:
+        old_engine = rag_engine_instance
+        rag_engine_instance = new_engine
+        engine_state["generation"] += 1
+    session_memory.clear() # номера строк в новых данных другие
+    return old_engine
+
+def retire_engine(engine, timeout=ENGINE_DRAIN_TIMEOUT):
+    """Ждет, пока старый движок допросит начатые запросы, и освобождает его данные."""
+    if engine is None:
+        return
+    with lease_cond:
+        drained = lease_cond.wait_for(lambda: engine_leases.get(id(engine), 0) == 0, timeout)
+    if not drained:
+        logger.warning(f"Old engine still has requests in flight after {timeout}s, leaving it to GC.")
+        return
+    if hasattr(engine, 'close'):
+        engine.close()
+
+def reload_engine():
+    """
+    Строит новый движок из DATA_DIR, не останавливая поиск, и подменяет текущий.
+    Если загрузка не удалась, продолжает работать старый движок.
+    """
+    if RAGEngine is None:
+        logger.critical("Cannot reload engine: RAGEngine class is missing (import failed).")
+        return False
+
+    with reload_lock:
+        engine_state["reloading"] = True
+        try:
+            logger.info(f"🔄 Reloading RAGEngine from {DATA_DIR} (generation {engine_state['generation'] + 1})...")
+            current = rag_engine_instance
+            setup_state["components"] = {}
+            # Модель переранжирования от данных не зависит - переиспользуем, а не грузим второй раз
+            new_engine = RAGEngine(base_dir=DATA_DIR, reranker=getattr(current, 'reranker', None),
+                                   on_progress=report_engine_progress)
+        except Exception as e:
+            logger.error(f"❌ Engine reload failed, keeping the current engine: {e}", exc_info=True)
+            engine_state["last_reload_error"] = str(e)
+            return False
+        finally:
+            engine_state["reloading"] = False
+
+        old_engine = swap_engine(new_engine)
+        engine_state["last_reload_at"] = time.time()
+        engine_state["last_reload_error"] = None
+
+    logger.info("✅ RAGEngine reloaded, old generation is draining.")
+    threading.Thread(target=retire_engine, args=(old_engine,), daemon=True).start()
+    return True
 
 def initialize_engine():
     """Initializes the RAG engine if data exists."""
-    global rag_engine_instance
-    
     with init_lock:
         if rag_engine_instance is not None:
             return True
@@ -146,7 +289,8 @@ def initialize_engine():
                 return False
                 
             # Initialize with our data directory
-            rag_engine_instance = RAGEngine(base_dir=DATA_DIR)
+            setup_state["components"] = {}
+            swap_engine(RAGEngine(base_dir=DATA_DIR, on_progress=report_engine_progress))
             
             logger.info("✅ RAGEngine initialized successfully!")
             return True
@@ -154,39 +298,105 @@ def initialize_engine():
             logger.error(f"❌ Failed to initialize RAGEngine: {e}", exc_info=True)
             return False
 
-def download_file_direct(url, destination):
-    session = requests.Session()
+def initialize_and_warm_up():
+    """
+    Фоновый старт: движок (если данные уже есть), затем импорт тяжелых модулей,
+    которые движок еще не загрузил (genai для первого эмбеддинга) - первый запрос их не ждет.
+    """
+    initialize_engine()
+    if preload_heavy_modules is not None:
+        timings = preload_heavy_modules()
+        logger.info(f"🔥 Прогрев импортов завершен (мс): {timings}")
+
+def download_and_extract_archive(url, destination, target_dir):
+    """
+    Скачивает архив данных Range-запросами в несколько потоков и одновременно
+    распаковывает его (каждый файл - как только докачаны его байты). В target_dir
+    файлы переносятся после проверки архива; движок перед этим отпускает свои файлы.
+    Недокачанный файл (<destination>.part) подхватывается после перезапуска.
+    """
     logger.info(f"Downloading from: {url}")
-    
+    expected_sha256 = fetch_expected_sha256(url)
+    if not expected_sha256:
+        logger.warning("⚠️ No .sha256 published for this archive, checksum will not be verified.")
+
+    def on_progress(downloaded, total, speed):
+        # Обновляем прогресс (0-80% выделяем на скачивание)
+        setup_state["progress"] = min(80, int((downloaded / total) * 80)) if total else 0
+        setup_state["downloaded_bytes"] = downloaded
+        setup_state["total_bytes"] = total
+        setup_state["speed_bps"] = int(speed)
+        setup_state["eta_seconds"] = int((total - downloaded) / speed) if speed > 0 and total else None
+        if downloaded >= total > 0:
+            # Байты на месте, дописываются последние файлы
+            setup_state["status"] = "extracting"
+
+    def on_extract(extracted, total_files):
+        setup_state["extracted_files"] = extracted
+        setup_state["total_files"] = total_files
+
+    def release_engine_files():
+        # Архив проверен, файлы сейчас заменят: открытые (memory-mapped) файлы на Windows
+        # не заменить - движок отпускает их и ищет по индексам в памяти до перезагрузки
+        engine = rag_engine_instance
+        if engine is not None:
+            engine.release_files()
+        # Хеши старого манифеста больше не соответствуют файлам - иначе дельта пропустит изменения
+        forget_local_manifest(target_dir)
+
     try:
-        response = session.get(url, stream=True, timeout=30)
-        response.raise_for_status() # Check for HTTP errors
-        
-        CHUNK_SIZE = 32768
-        total_size = int(response.headers.get('content-length', 0))
-        downloaded = 0
-        
-        # Если сервер не отдает размер, используем примерный (500MB)
-        if total_size == 0:
-            total_size = 500 * 1024 * 1024 
-        
-        with open(destination, "wb") as f:
-            for chunk in response.iter_content(CHUNK_SIZE):
-                if chunk:
-                    f.write(chunk)
-                    downloaded += len(chunk)
-                    
-                    # Обновляем прогресс (0-80% выделяем на скачивание)
-                    progress = min(80, int((downloaded / total_size) * 80))
-                    setup_state["progress"] = progress
-                    setup_state["status"] = "downloading"
-                    
-        logger.info("Download saved successfully.")
-        
+        downloader = RangeDownloader(url, destination, expected_sha256=expected_sha256,
+                                     progress_callback=on_progress)
+        download_and_extract(downloader, target_dir, progress_callback=on_extract,
+                             before_commit=release_engine_files)
+        logger.info("Download and extraction finished successfully.")
     except Exception as e:
         logger.error(f"❌ Download error: {e}")
         raise e
 
+def apply_data_update(min_version=0, languages=None):
+    """
+    Дельта-обновление по манифесту: качает только изменившиеся файлы,
+    подменяет их и перезагружает движок. Возвращает число замененных файлов.
+    languages - какие языки привести к манифесту (по умолчанию - установленные).
+    """
+    def on_progress(stage, done, total):
+        if stage == 'download':
+            setup_state["progress"] = min(80, int(done / total * 80)) if total else 80
+        else:
+            setup_state["status"] = "extracting"
+            setup_state["progress"] = 80 + int(done / total * 10) if total else 90
+        setup_state["current_file"] = f"{done}/{total}"
+
+    updater = DataUpdater(DATA_DIR, DATA_MANIFEST_URL, progress_callback=on_progress)
+    remote = updater.fetch_manifest()
+    if remote['version'] < min_version:
+        raise ValueError(f"Published manifest is version {remote['version']}, need {min_version}")
+    changed = updater.plan(remote, languages)
+    logger.info(f"Data update to version {remote['version']}: {len(changed)} file(s) changed, "
+                f"{sum(entry['size'] for entry in changed):,} bytes to download")
+
+    # Пока файлы качаются в staging, движок продолжает отвечать на запросы
+    updater.stage(changed)
+
+    # Открытые (memory-mapped) файлы на Windows не заменить: движок отпускает их,
+    # но продолжает искать по индексам в памяти до подмены на новое поколение
+    engine = rag_engine_instance
+    if engine is not None:
+        engine.release_files()
+    updater.apply(remote, changed, languages)
+
+    setup_state["progress"] = 95
+    setup_state["status"] = "initializing"
+    if engine is None:
+        initialize_engine()
+    else:
+        reload_engine()
+    return len(changed)
+
+def has_installed_data():
+    return os.path.exists(DATA_DIR) and any(f.startswith("faiss_index_") for f in os.listdir(DATA_DIR))
+
 def background_download_task(language_mode):
     global setup_state
     setup_state["is_downloading"] = True
@@ -198,6 +408,23 @@ def background_download_task(language_mode):
         if not os.path.exists(DATA_DIR):
             os.makedirs(DATA_DIR, exist_ok=True)
 
+        # Данные уже есть (например, после повышения DATA_VERSION) - пробуем докачать только изменения
+        if has_installed_data():
+            try:
+                # Недостающие языки выбранного режима докачиваются по тому же манифесту
+                apply_data_update(min_version=DATA_VERSION,
+                                  languages=LANGUAGE_MODES.get(language_mode, LANGUAGE_MODES['all']))
+                if rag_engine_instance is not None:
+                    setup_state["progress"] = 100
+                    setup_state["status"] = "completed"
+                    setup_state["is_downloading"] = False
+                    return
+                logger.warning("Engine failed to start after delta update, falling back to full download.")
+            except Exception as e:
+                logger.warning(f"⚠️ Delta update failed ({e}), falling back to full archive download.")
+            setup_state["status"] = "downloading"
+            setup_state["progress"] = 0
+
         zip_path = os.path.join(DATA_DIR, "shukabase_data.zip")
         
         # Выбираем URL
@@ -205,48 +432,15 @@ def background_download_task(language_mode):
         
         logger.info(f"Starting download for mode: {language_mode} from {download_url}")
         
-        download_file_direct(download_url, zip_path)
-        
-        # Проверка целостности архива ПЕРЕД извлечением
-        if not zipfile.is_zipfile(zip_path):
-             with open(zip_path, 'rb') as f:
-                 head = f.read(200)
-             logger.error(f"File is not a valid ZIP. Header: {head}")
-             setup_state["error"] = "Downloaded file is corrupted or not a zip file. Check logs."
-             setup_state["status"] = "error"
-             setup_state["is_downloading"] = False
-             return
-
-        setup_state["status"] = "extracting"
-        setup_state["progress"] = 85
-        
-        logger.info("Extracting archive...")
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(DATA_DIR)
-            
-            # Smart Flattening: Find where the key file is
-            found_root = None
-            for root, dirs, files in os.walk(DATA_DIR):
-                if any(f.startswith('faiss_index_') for f in files):
-                    found_root = root
-                    break
-            
-            if found_root and found_root != DATA_DIR:
-                logger.info(f"Found data in nested folder: {found_root}. Moving to {DATA_DIR}...")
-                for item in os.listdir(found_root):
-                    s = os.path.join(found_root, item)
-                    d = os.path.join(DATA_DIR, item)
-                    if os.path.exists(d):
-                        if os.path.isdir(d):
-                            shutil.rmtree(d)
-                        else:
-                            os.remove(d)
-                    shutil.move(s, d)
-                # Cleanup empty dirs
-                try:
-                    shutil.rmtree(found_root)
-                except:
-                    pass
+        try:
+            download_and_extract_archive(download_url, zip_path, DATA_DIR)
+        except zipfile.BadZipFile as e:
+            # Битый архив или вместо него пришла HTML-страница
+            logger.error(f"File is not a valid ZIP: {e}")
+            setup_state["error"] = "Downloaded file is corrupted or not a zip file. Check logs."
+            setup_state["status"] = "error"
+            setup_state["is_downloading"] = False
+            return
 
         # Write version file
         try:
@@ -255,14 +449,12 @@ def background_download_task(language_mode):
         except Exception as ve:
             logger.error(f"Failed to write version file: {ve}")
 
-        os.remove(zip_path)
-        
         setup_state["progress"] = 95
         setup_state["status"] = "initializing"
         
-        # Инициализируем движок
+        # Инициализируем движок (или перезагружаем, если работал на старых данных)
         # Важно: это может занять время, поэтому делаем это здесь
-        if initialize_engine():
+        if reload_engine() if rag_engine_instance is not None else initialize_engine():
             setup_state["progress"] = 100
             setup_state["status"] = "completed"
         else:
@@ -321,6 +513,61 @@ def start_download():
     
     return jsonify({"success": True, "message": "Download started"})
 
+@app.route('/api/setup/update/check', methods=['GET'])
+def check_data_update():
+    """Сравнивает локальные данные с опубликованным манифестом, ничего не скачивая."""
+    try:
+        updater = DataUpdater(DATA_DIR, DATA_MANIFEST_URL)
+        remote = updater.fetch_manifest()
+        changed = updater.plan(remote)
+        return jsonify({
+            "update_available": bool(changed),
+            "version": remote['version'],
+            "files": [entry['path'] for entry in changed],
+            "download_bytes": sum(entry['size'] for entry in changed)
+        })
+    except Exception as e:
+        logger.error(f"Update check failed: {e}")
+        return jsonify({"error": str(e)}), 502
+
+@app.route('/api/setup/update', methods=['POST'])
+def start_data_update():
+    if setup_state["is_downloading"]:
+        return jsonify({"error": "Download already in progress"}), 400
+    if not has_installed_data():
+        return jsonify({"error": "No installed data to update, use /api/setup/download"}), 400
+
+    def run_update():
+        setup_state["is_downloading"] = True
+        setup_state["status"] = "downloading"
+        setup_state["progress"] = 0
+        setup_state["error"] = None
+        try:
+            apply_data_update()
+            setup_state["progress"] = 100
+            setup_state["status"] = "completed" if rag_engine_instance is not None else "error"
+            if rag_engine_instance is None:
+                setup_state["error"] = "Initialization failed after update. Check logs."
+        except Exception as e:
+            logger.error(f"Data update failed: {e}", exc_info=True)
+            setup_state["status"] = "error"
+            setup_state["error"] = str(e)
+        finally:
+            setup_state["is_downloading"] = False
+
+    threading.Thread(target=run_update, daemon=True).start()
+    return jsonify({"success": True, "message": "Update started"})
+
+@app.route('/api/admin/reload', methods=['POST'])
+def admin_reload_engine():
+    """Перечитывает данные в новый движок в фоне; поиск все это время обслуживает текущий."""
+    if rag_engine_instance is None:
+        return jsonify({'success': initialize_engine(), 'generation': engine_state["generation"]})
+    if engine_state["reloading"]:
+        return jsonify({'success': False, 'error': 'Reload already in progress'}), 409
+    threading.Thread(target=reload_engine, daemon=True).start()
+    return jsonify({'success': True, 'message': 'Reload started', 'generation': engine_state["generation"]}), 202
+
 @app.route('/api/search', methods=['POST'])
 def search():
     if rag_engine_instance is None:
@@ -328,33 +575,212 @@ def search():
         if not initialize_engine():
             return jsonify({'success': False, 'error': 'Knowledge base not loaded. Please complete setup.'}), 503
 
+    with engine_lease() as engine:
+        if engine is None:
+            return jsonify({'success': False, 'error': 'Knowledge base not loaded. Please complete setup.'}), 503
+        with load_controller.admit() as level:
+            return _search_with_engine(engine, level)
+
+def _search_with_engine(engine, level=0):
     try:
         data = request.json
         query = data.get('query', '').strip()
         language = data.get('language', 'ru')
         top_k = int(data.get('top_k', 10))
+        ef_search = data.get('ef_search') # HNSW: компромисс задержка/точность на запрос
+        session_id = data.get('session_id') # уже отданные в сессии чанки не повторяются
+        fields = parse_fields(data.get('fields')) # например 'compact' или ['book', 'snippet']
+        snippet_length = int(data.get('snippet_length') or 0) # сниппет вместо полного текста
         
         if not query:
             return jsonify({'success': False, 'error': 'Empty query'}), 400
+        if data.get('fusion', 'rrf') not in FUSION_METHODS:
+            return jsonify({'success': False, 'error': f"Unknown fusion method (use one of {', '.join(FUSION_METHODS)})"}), 400
 
-        search_results = rag_engine_instance.search(
+        search_results = engine.search(
             query=query,
             language=language,
             top_k=top_k,
-            api_key=data.get('api_key') # Pass API key from request
+            api_key=data.get('api_key'), # Pass API key from request
+            ef_search=int(ef_search) if ef_search else None,
+            diversify=_parse_flag(data, 'diversify', True),
+            mmr_lambda=float(data.get('mmr_lambda', 0.7)),
+            adaptive_rerank=_parse_flag(data, 'adaptive_rerank', True),
+            return_timings=_parse_flag(data, 'timings', False), # длительность этапов в ответе
+            fusion=data.get('fusion', 'rrf'), # rrf / combsum / combmnz
+            fusion_weights=data.get('fusion_weights'), # {'vector': 1.0, 'keyword': 1.5, ...}
+            use_planner=_parse_flag(data, 'planner', True), # только нужные для такого запроса этапы
+            **_session_options(session_id, language),
+            **degraded_options(level) # под перегрузкой - упрощенный конвейер
         )
-        return jsonify(search_results), 200
+        _remember_results(session_id, language, search_results)
+        if search_results.get('success'):
+            search_results['results'] = project_results(
+                search_results.get('results', []), query, engine.stemmers.get(language), fields, snippet_length)
+            search_results['degradation'] = {'level': level, 'mode': MODES[level]}
+        return _search_response(search_results)
+    except BadRequestParam as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Search error: {e}", exc_info=True)
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/search/batch', methods=['POST'])
+def search_batch():
+    """
+    Несколько запросов за один HTTP-вызов (шаги агента):
+    {"queries": ["...", {"query": "...", "language": "en"}], "language": "ru", "top_k": 20}
+    Ответ: {"success": true, "results": [ответ /api/search для каждого запроса по порядку]}
+    """
+    if rag_engine_instance is None:
+        if not initialize_engine():
+            return jsonify({'success': False, 'error': 'Knowledge base not loaded. Please complete setup.'}), 503
+
+    with engine_lease() as engine:
+        if engine is None:
+            return jsonify({'success': False, 'error': 'Knowledge base not loaded. Please complete setup.'}), 503
+        # В p95 идет задержка на один запрос пакета, а не всего пакета
+        with load_controller.admit(queries=_batch_size()) as level:
+            return _search_batch_with_engine(engine, level)
+
+def _batch_size():
+    """Число запросов в теле /api/search/batch (1, если тело некорректно - ошибку вернет обработчик)."""
+    data = request.get_json(silent=True)
+    items = data.get('queries') if isinstance(data, dict) else None
+    return min(len(items), MAX_BATCH_QUERIES) if isinstance(items, list) and items else 1
+
+def _search_batch_with_engine(engine, level=0):
+    try:
+        data = request.json or {}
+        items = data.get('queries') or []
+        if not isinstance(items, list) or not items:
+            return jsonify({'success': False, 'error': 'Empty queries'}), 400
+        if len(items) > MAX_BATCH_QUERIES:
+            return jsonify({'success': False, 'error': f'Too many queries (max {MAX_BATCH_QUERIES})'}), 400
+        if data.get('fusion', 'rrf') not in FUSION_METHODS:
+            return jsonify({'success': False, 'error': f"Unknown fusion method (use one of {', '.join(FUSION_METHODS)})"}), 400
+
+        default_language = data.get('language', 'ru')
+        ef_search = data.get('ef_search')
+        session_id = data.get('session_id')
+        fields = parse_fields(data.get('fields'))
+        snippet_length = int(data.get('snippet_length') or 0)
+        # Пакет делится по языкам: у каждого языка свой индекс
+        by_language = {}
+        for position, item in enumerate(items):
+            query, language = (item, default_language) if isinstance(item, str) else \
+                (item.get('query', ''), item.get('language', default_language)) if isinstance(item, dict) else \
+                (None, None)
+            if not isinstance(query, str) or not isinstance(language, str):
+                return jsonify({'success': False, 'error': f'Invalid query at position {position} '
+                                                           '(expected a string or {"query": "...", "language": "..."})'}), 400
+            query = query.strip()
+            if not query:
+                return jsonify({'success': False, 'error': f'Empty query at position {position}'}), 400
+            by_language.setdefault(language, []).append((position, query))
+
+        results = [None] * len(items)
+        timings = {}
+        for language, group in by_language.items():
+            batch = engine.search_batch(
+                queries=[query for _, query in group],
+                language=language,
+                top_k=int(data.get('top_k', 10)),
+                api_key=data.get('api_key'),
+                ef_search=int(ef_search) if ef_search else None,
+                diversify=_parse_flag(data, 'diversify', True),
+                mmr_lambda=float(data.get('mmr_lambda', 0.7)),
+                adaptive_rerank=_parse_flag(data, 'adaptive_rerank', True),
+                return_timings=_parse_flag(data, 'timings', False),
+                fusion=data.get('fusion', 'rrf'),
+                fusion_weights=data.get('fusion_weights'),
+                use_planner=_parse_flag(data, 'planner', True),
+                **_session_options(session_id, language),
+                **degraded_options(level)
+            )
+            if not batch.get('success'):
+                return jsonify(batch), 200 # как /api/search: ошибка движка - в теле ответа
+            for (position, query), response in zip(group, batch['results']):
+                _remember_results(session_id, language, response)
+                if response.get('success'):
+                    response['results'] = project_results(
+                        response.get('results', []), query, engine.stemmers.get(language), fields, snippet_length)
+                results[position] = response
+            if 'timings' in batch:
+                timings[language] = batch['timings']
+
+        response = {'success': True, 'results': results, 'count': len(results),
+                    'degradation': {'level': level, 'mode': MODES[level]}}
+        if timings:
+            response['timings'] = timings
+        return _search_response(response)
+    except BadRequestParam as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Batch search error: {e}", exc_info=True)
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+class BadRequestParam(ValueError):
+    """Некорректный параметр запроса поиска (ответ 400)."""
+
+FLAG_VALUES = {'true': True, '1': True, 'yes': True, 'on': True,
+               'false': False, '0': False, 'no': False, 'off': False}
+
+def _parse_flag(data, name, default):
+    """Булев параметр: true/false из JSON или строкой ('false' - это False, а не непустая строка)."""
+    value = data.get(name, default)
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        return bool(value)
+    if isinstance(value, str) and value.strip().lower() in FLAG_VALUES:
+        return FLAG_VALUES[value.strip().lower()]
+    raise BadRequestParam(f"Invalid value for '{name}': expected true or false")
+
+def _search_response(payload, status=200):
+    """Ответ поиска: быстрый JSON (orjson) и сжатие по Accept-Encoding."""
+    body, encoding = encode_body(dumps(payload), request.headers.get('Accept-Encoding', ''))
+    response = flask.Response(body, status=status, mimetype='application/json')
+    response.headers['Vary'] = 'Accept-Encoding'
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+def _session_options(session_id, language):
+    """Параметры engine.search для сессии: исключить уже отданное, вернуть ссылки на него."""
+    if not session_id:
+        return {}
+    return {'exclude_ids': session_memory.seen(session_id, language), 'include_references': True}
+
+def _remember_results(session_id, language, search_results):
+    if session_id and search_results.get('success'):
+        session_memory.remember(session_id, language, (
+            res['index'] for res in search_results.get('results', []) if res.get('index') is not None
+        ))
+
+@app.route('/api/search/session/<string:session_id>', methods=['DELETE'])
+def forget_search_session(session_id):
+    """Сброс памяти сессии: следующий поиск снова может вернуть любые чанки."""
+    return jsonify({'success': session_memory.forget(session_id)})
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     return jsonify({
         'status': 'healthy',
-        'engine_initialized': rag_engine_instance is not None
+        'engine_initialized': rag_engine_instance is not None,
+        'engine': engine_state,
+        'load': load_controller.snapshot(),
+        'embedding_circuit': rag_engine_instance.embedding_breaker.snapshot() if rag_engine_instance else None,
+        'gemini_clients': gemini_clients.snapshot()
     }), 200
 
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Гистограммы этапов поиска в текстовом формате Prometheus."""
+    return flask.Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
 # --- Остальные эндпоинты (conversations) без изменений ---
 @app.route('/api/conversations', methods=['GET'])
 def get_conversations():
@@ -436,15 +862,10 @@ def reset_app_data():
         logger.warning("⚠️ RECEIVED FACTORY RESET REQUEST ⚠️")
         
         # 1. Reset Setup State
-        global setup_state, rag_engine_instance
-        setup_state = {
-            "is_downloading": False,
-            "progress": 0,
-            "status": "idle",
-            "error": None,
-            "current_file": ""
-        }
-        rag_engine_instance = None # Drop engine ref
+        global setup_state
+        setup_state = initial_setup_state()
+        # Drop engine ref: запросы в работе доживут на старом движке
+        retire_engine(swap_engine(None), timeout=10)
         
         # 2. Delete DATA_DIR
         if os.path.exists(DATA_DIR):
@@ -483,7 +904,7 @@ if __name__ == '__main__':
         print("STATUS: SERVER_STARTED", flush=True)
 
         # Инициализируем в фоне, чтобы не задерживать старт сервера и сплэша
-        threading.Thread(target=initialize_engine, daemon=True).start()
+        threading.Thread(target=initialize_and_warm_up, daemon=True).start()
         
         app.run(host='0.0.0.0', port=5000, debug=False)
     except Exception as e:
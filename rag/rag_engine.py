@@ -13,9 +13,12 @@ import json
 import numpy as np
 import pickle
 from pathlib import Path
-from typing import List, Dict, Tuple, Any
+from typing import List, Dict, Tuple, Any, Optional, Collection, Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+import importlib
 import logging
 import os
+import threading
 import time
 import re
 import difflib
@@ -23,20 +26,96 @@ import difflib
 # Управление зависимостями
 try:
     import faiss
-    from transformers import AutoTokenizer, AutoModelForSequenceClassification
-    import torch
-    import google.generativeai as genai
     from dotenv import load_dotenv
     from rank_bm25 import BM25Okapi
-    from nltk.stem import SnowballStemmer
 except ImportError as e:
     raise ImportError(
         f"Отсутствует зависимость: {e}. "
         "Установите необходимые пакеты: pip install faiss-cpu transformers torch google-generativeai python-dotenv rank_bm25 nltk"
     )
 
+# Тяжелые модули (секунды на импорт) загружаются при первом использовании или в preload_heavy_modules:
+# импорт rag_engine не должен задерживать старт сервера (STATUS: SERVER_STARTED) и quick_search.py
+HEAVY_MODULES = ('nltk.stem', 'torch', 'transformers', 'google.generativeai')
+
+
+def _import_heavy(name: str):
+    """Импорт тяжелого модуля по требованию с тем же сообщением об отсутствующей зависимости."""
+    try:
+        return importlib.import_module(name)
+    except ImportError as e:
+        raise ImportError(
+            f"Отсутствует зависимость: {e}. "
+            "Установите необходимые пакеты: pip install faiss-cpu transformers torch google-generativeai python-dotenv rank_bm25 nltk"
+        ) from e
+
+
+def preload_heavy_modules(names: Collection[str] = HEAVY_MODULES) -> Dict[str, float]:
+    """
+    Прогрев: импортирует тяжелые модули заранее (из фонового потока сервера),
+    чтобы первый запрос не ждал импорта. Возвращает время импорта по модулям, мс.
+    """
+    timings = {}
+    for name in names:
+        started_at = time.perf_counter()
+        try:
+            _import_heavy(name)
+        except ImportError as e:
+            logger.warning(f"⚠️ Прогрев: {e}")
+            continue
+        timings[name] = round((time.perf_counter() - started_at) * 1000, 1)
+    return timings
+
+try:
+    from rag.embedding_store import rows_from_structure, embeddings_file_name, load_embedding_matrix, exact_rerank
+except ImportError:
+    from embedding_store import rows_from_structure, embeddings_file_name, load_embedding_matrix, exact_rerank
+
+try:
+    from rag.faiss_indexer import apply_search_params
+except ImportError:
+    from faiss_indexer import apply_search_params
+
+try:
+    from rag.mmr import mmr_select
+except ImportError:
+    from mmr import mmr_select
+
+try:
+    from rag.fusion import fuse
+except ImportError:
+    from fusion import fuse
+
+try:
+    from rag.circuit_breaker import CircuitBreaker, CircuitBusyError, CircuitOpenError
+except ImportError:
+    from circuit_breaker import CircuitBreaker, CircuitBusyError, CircuitOpenError
+
+try:
+    from rag.query_planner import plan_query, PLANS, FULL, VERSE_REFERENCE
+except ImportError:
+    from query_planner import plan_query, PLANS, FULL, VERSE_REFERENCE
+
+try:
+    from rag.adaptive_rerank import has_clear_winner, progressive_rerank
+except ImportError:
+    from adaptive_rerank import has_clear_winner, progressive_rerank
+
+try:
+    from rag.metrics import StageTimer, SEARCH_REQUESTS, SEARCH_BATCH_STAGE_SECONDS
+except ImportError:
+    from metrics import StageTimer, SEARCH_REQUESTS, SEARCH_BATCH_STAGE_SECONDS
+
+try:
+    from rag.embedding_backends import EmbeddingBackend, EmbeddingBackendError, backend_from_config
+except ImportError:
+    from embedding_backends import EmbeddingBackend, EmbeddingBackendError, backend_from_config
+
 logger = logging.getLogger(__name__)
 
+# Во сколько раз пул кандидатов для MMR больше итогового top_k
+MMR_POOL_FACTOR = 2
+
 # --- Вспомогательные классы (QueryExpander, RerankerModel) без изменений ---
 
 class QueryExpander:
@@ -123,9 +202,11 @@ class RerankerModel:
         self.device = "cpu"
         
         try:
+            torch = _import_heavy('torch')
+            transformers = _import_heavy('transformers')
             # Сначала пробуем загрузить, если есть интернет или кэш
-            self.tokenizer = AutoTokenizer.from_pretrained(model_name, trust_remote_code=True)
-            self.model = AutoModelForSequenceClassification.from_pretrained(
+            self.tokenizer = transformers.AutoTokenizer.from_pretrained(model_name, trust_remote_code=True)
+            self.model = transformers.AutoModelForSequenceClassification.from_pretrained(
                 model_name, trust_remote_code=True, torch_dtype=torch.float32
             )
             self.device = "cuda" if torch.cuda.is_available() else "cpu"
@@ -137,16 +218,22 @@ class RerankerModel:
             logger.warning("⚠️ RAG будет работать без фазы переранжирования (только векторный поиск). Это нормально для оффлайн режима.")
             self.model = None
     
+    def score_pairs(self, pairs: List[Tuple[str, str]]) -> np.ndarray:
+        """Оценки пар (запрос, документ) одним прогоном модели - пары могут быть от разных запросов."""
+        import torch # уже загружен в __init__ вместе с моделью
+
+        with torch.no_grad():
+            inputs = self.tokenizer(
+                [[query, doc] for query, doc in pairs],
+                padding=True, truncation=True, return_tensors="pt", max_length=512
+            ).to(self.device)
+            return self.model(**inputs, return_dict=True).logits.squeeze(-1).cpu().numpy().reshape(-1)
+
     def rerank(self, query: str, documents: List[str], top_k: int = 5) -> List[Tuple[int, float, str]]:
         if not self.model or not documents:
             return [(i, 1.0, doc) for i, doc in enumerate(documents)][:top_k]
         try:
-            with torch.no_grad():
-                inputs = self.tokenizer(
-                    [[query, doc] for doc in documents],
-                    padding=True, truncation=True, return_tensors="pt", max_length=512
-                ).to(self.device)
-                scores = self.model(**inputs, return_dict=True).logits.squeeze(-1).cpu().numpy()
+            scores = self.score_pairs([(query, doc) for doc in documents])
             
             ranked = sorted([(i, score, documents[i]) for i, score in enumerate(scores)], key=lambda x: x[1], reverse=True)
             return ranked[:top_k]
@@ -164,8 +251,23 @@ class RAGEngine:
         self,
         reranker_model: str = "jinaai/jina-reranker-v2-base-multilingual",
         languages: List[str] = ['ru', 'en'],
-        base_dir: str = "rag"
+        base_dir: str = "rag",
+        reranker: "RerankerModel" = None,
+        embedding_backend: EmbeddingBackend = None,
+        on_progress: Callable[[str, str], None] = None
     ):
+        """
+        reranker - уже загруженная модель переранжирования (например, от предыдущего
+        поколения движка при горячей перезагрузке), чтобы не грузить ее второй раз.
+        embedding_backend - бэкенд эмбеддингов запросов для всех языков; по умолчанию
+        берется тот, которым построен индекс (embedding_backend в метаданных).
+        on_progress(component, status) - готовность компонентов загрузки ('reranker',
+        'ru/index', 'ru/metadata', ...): status - loading, ready, failed или missing.
+
+        Модель переранжирования, языки и компоненты каждого языка (индекс, метаданные,
+        чанки, BM25) загружаются параллельно: запуск занимает время самого долгого
+        компонента, а не сумму.
+        """
         logger.info("🚀 Инициализирую RAG Engine...")
         
         self._configure_gemini_api()
@@ -173,9 +275,9 @@ class RAGEngine:
         self.base_dir = Path(base_dir)
         self.embedding_model_name = "models/text-embedding-004"
         self.languages = languages
+        self.on_progress = on_progress
         
-        self.reranker = RerankerModel(reranker_model)
-        
+        SnowballStemmer = _import_heavy('nltk.stem').SnowballStemmer
         self.stemmers = {
             'ru': SnowballStemmer('russian'),
             'en': SnowballStemmer('english')
@@ -185,168 +287,299 @@ class RAGEngine:
         self.bm25_indices: Dict[str, Any] = {}
         self.metadata: Dict[str, Any] = {}
         self.chunked_data: Dict[str, Dict] = {}
+        self.index_configs: Dict[str, Dict[str, Any]] = {}
+        self.embeddings: Dict[str, np.ndarray] = {} # memory-mapped матрицы эмбеддингов (если поставлены)
+        self.embedding_backend = embedding_backend
+        self.embedding_backends: Dict[str, EmbeddingBackend] = {}
+        # Сетевые эмбеддинги: при сбоях API поиск сразу идет без вектора (BM25 + фраза)
+        self.embedding_breaker = CircuitBreaker('embedding')
+        self._init_lock = threading.Lock()
         
-        for lang in languages:
-            self._load_language_data(lang)
+        with ThreadPoolExecutor(max_workers=len(languages) + 1, thread_name_prefix="engine-init") as executor:
+            reranker_future = None
+            if reranker is None:
+                reranker_future = self._submit_component(executor, 'reranker', RerankerModel, reranker_model)
+            language_futures = [executor.submit(self._load_language_data, lang) for lang in languages]
+            for future in language_futures:
+                future.result()
+            self.reranker = reranker_future.result() if reranker_future is not None else reranker
         
         logger.info("✅ RAG Engine готов к работе!")
 
+    def _report_progress(self, component: str, status: str):
+        if self.on_progress is None:
+            return
+        try:
+            self.on_progress(component, status)
+        except Exception as e:
+            logger.debug(f"Ошибка в обработчике прогресса загрузки: {e}")
+
+    def _submit_component(self, executor: ThreadPoolExecutor, component: str, func: Callable, *args) -> Future:
+        """Загрузка компонента в пуле с отметками прогресса (loading -> ready / failed)."""
+        self._report_progress(component, 'loading')
+
+        def load():
+            try:
+                result = func(*args)
+            except Exception:
+                self._report_progress(component, 'failed')
+                raise
+            self._report_progress(component, 'ready')
+            return result
+
+        return executor.submit(load)
+
+    def release_files(self):
+        """
+        Закрывает memory-mapped матрицы эмбеддингов, чтобы файлы данных можно было
+        заменить (на Windows открытый файл не перезаписать). Поиск продолжает
+        работать, только без точной переоценки для сжатых индексов.
+        """
+        self.embeddings = {}
+
+    def close(self):
+        """Освобождает данные движка. Вызывается, когда старое поколение допросило все запросы."""
+        self.release_files()
+        self.indices = {}
+        self.bm25_indices = {}
+        self.metadata = {}
+        self.chunked_data = {}
+        self.embedding_breaker.close()
+        logger.info("♻️ RAG Engine освобожден")
+
     def _configure_gemini_api(self):
-        """Загружает и настраивает ключ API для Gemini."""
+        """
+        Загружает ключ API для Gemini из окружения (.env). Клиент с этим ключом создает
+        пул GeminiBackend при первом эмбеддинге - genai здесь не импортируется.
+        """
         load_dotenv()
         api_key = os.environ.get('GEMINI_API_KEY')
-        self.current_api_key = None
         
         if not api_key:
             logger.warning("⚠️ Переменная окружения GEMINI_API_KEY не найдена. RAG будет работать в ограниченном режиме.")
             return
 
+        logger.info("✅ Ключ Gemini API найден.")
+
+    @staticmethod
+    def _read_index(index_file: Path) -> "faiss.Index":
+        index = faiss.read_index(str(index_file))
         try:
-            genai.configure(api_key=api_key)
-            self.current_api_key = api_key
-            logger.info("✅ Ключ Gemini API успешно сконфигурирован.")
-        except Exception as e:
-            logger.error(f"❌ Ошибка при конфигурации Gemini API: {e}")
+            # IVF не умеет reconstruct(id) без прямой карты (8 байт на вектор) - нужна для MMR
+            faiss.extract_index_ivf(index).make_direct_map()
+        except RuntimeError:
+            pass # не IVF индекс
+        return index
+
+    @staticmethod
+    def _read_json(path: Path) -> Any:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    @staticmethod
+    def _read_pickle(path: Path) -> Any:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+    @staticmethod
+    def _flatten_metadata(raw_metadata: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Метаданные по row_id индекса FAISS (список в порядке строк индекса)."""
+        flat_metadata = []
+        structure = raw_metadata.get('structure', {})
+        if 'rows' in raw_metadata:
+            # Явная таблица row_id → (book, file, chunk_idx)
+            rows = raw_metadata['rows']
+            text_previews = raw_metadata.get('text_previews', [])
+        else:
+            # Старый формат: главы по embedding_key (embeddings_0, embeddings_1, ...)
+            rows, text_previews, _ = rows_from_structure(structure)
+        
+        # Почти-дубликаты схлопнуты в одну строку: здесь остальные места, где встречается текст
+        row_sources = raw_metadata.get('row_sources', {})
+        
+        for row_id, (book, chapter, chunk_idx) in enumerate(rows):
+            entry = {
+                'book': book,
+                'chapter': chapter,
+                'chunk_idx': chunk_idx,
+                'text_preview': text_previews[row_id] if row_id < len(text_previews) else "",
+                'html_path': structure.get(book, {}).get(chapter, {}).get('html_path')
+            }
+            if str(row_id) in row_sources:
+                entry['sources'] = [
+                    {
+                        'book': source_book,
+                        'chapter': source_chapter,
+                        'chunk_idx': source_idx,
+                        'html_path': structure.get(source_book, {}).get(source_chapter, {}).get('html_path')
+                    }
+                    for source_book, source_chapter, source_idx in row_sources[str(row_id)]
+                ]
+            flat_metadata.append(entry)
+        return flat_metadata
+
+    def _read_metadata(self, metadata_file: Path) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        raw_metadata = self._read_json(metadata_file)
+        return raw_metadata, self._flatten_metadata(raw_metadata)
 
     def _load_language_data(self, language: str):
-        """Загружает индекс, метаданные и чанки для указанного языка."""
+        """
+        Загружает индекс, метаданные и чанки для указанного языка. Файлы читаются
+        и разбираются параллельно, связываются между собой - после загрузки всех.
+        """
         index_file = self.base_dir / f"faiss_index_{language}.bin"
         metadata_file = self.base_dir / f"faiss_metadata_{language}.json"
         chunks_file = self.base_dir / f"chunked_scriptures_{language}.json"
+        bm25_file = self.base_dir / f"bm25_index_{language}.pkl"
+        embeddings_file = self.base_dir / embeddings_file_name(language)
 
         if not index_file.exists():
             logger.warning(f"⚠️ Индекс FAISS не найден: {index_file}")
+            self._report_progress(f"{language}/index", 'missing')
             return
             
         logger.info(f"📂 Загружаю данные для языка '{language}'...")
-        self.indices[language] = faiss.read_index(str(index_file))
-        logger.info(f"  - Загружено {self.indices[language].ntotal:,} векторов из {index_file}")
+        with ThreadPoolExecutor(max_workers=5, thread_name_prefix=f"load-{language}") as executor:
+            index_future = self._submit_component(executor, f"{language}/index", self._read_index, index_file)
+            metadata_future = chunks_future = bm25_future = embeddings_future = None
+            if metadata_file.exists():
+                metadata_future = self._submit_component(executor, f"{language}/metadata", self._read_metadata, metadata_file)
+            if chunks_file.exists():
+                chunks_future = self._submit_component(executor, f"{language}/chunks", self._read_json, chunks_file)
+            if bm25_file.exists():
+                logger.info(f"📂 Загружаю индекс BM25 для языка '{language}' из файла...")
+                bm25_future = executor.submit(self._read_pickle, bm25_file)
+                self._report_progress(f"{language}/bm25", 'loading')
+            if embeddings_file.exists():
+                embeddings_future = executor.submit(load_embedding_matrix, embeddings_file)
 
-        if metadata_file.exists():
-            with open(metadata_file, 'r', encoding='utf-8') as f:
-                raw_metadata = json.load(f)
-            
-            # Flatten metadata to match FAISS indices
-            flat_metadata = []
-            structure = raw_metadata.get('structure', {})
-            
-            # Collect all chapters
-            all_chapters = []
-            for book_key, book_data in structure.items():
-                for chapter_key, chapter_data in book_data.items():
-                    if 'embedding_key' in chapter_data:
-                        all_chapters.append({
-                            'book': book_key,
-                            'chapter': chapter_key,
-                            'data': chapter_data
-                        })
-            
-            # Sort by embedding_key index (e.g., embeddings_0, embeddings_1)
-            def get_embedding_index(item):
-                key = item['data']['embedding_key']
-                try:
-                    return int(key.split('_')[1])
-                except (IndexError, ValueError):
-                    return 999999
-            
-            all_chapters.sort(key=get_embedding_index)
-            
-            # Create flat list
-            for item in all_chapters:
-                book = item['book']
-                chapter = item['chapter']
-                data = item['data']
-                num_chunks = data.get('num_chunks', 0)
-                text_previews = data.get('text_previews', [])
+            index = self.indices[language] = index_future.result()
+            logger.info(f"  - Загружено {index.ntotal:,} векторов из {index_file}")
+
+            if metadata_future is not None:
+                raw_metadata, flat_metadata = metadata_future.result()
                 
-                for i in range(num_chunks):
-                    preview = text_previews[i] if i < len(text_previews) else ""
-                    flat_metadata.append({
-                        'book': book,
-                        'chapter': chapter,
-                        'chunk_idx': i,
-                        'text_preview': preview,
-                        'html_path': data.get('html_path')
-                    })
-            
-            self.metadata[language] = flat_metadata
-            logger.info(f"  - Загружены и обработаны метаданные ({len(flat_metadata)} записей)")
-        else:
-            logger.warning(f"  - Файл метаданных не найден: {metadata_file}")
+                # Параметры поиска, подобранные FAISSIndexer (nprobe, efSearch, ...)
+                index_config = raw_metadata.get('index_config') or {}
+                self.index_configs[language] = index_config
+                self._setup_embedding_backend(language, raw_metadata.get('embedding_backend'))
+                search_params = index_config.get('search_params') or {}
+                if search_params:
+                    apply_search_params(index, search_params)
+                    logger.info(f"  - Параметры индекса {index_config.get('spec')}: {search_params}")
+                
+                self.metadata[language] = flat_metadata
+                logger.info(f"  - Загружены и обработаны метаданные ({len(flat_metadata)} записей)")
+            else:
+                logger.warning(f"  - Файл метаданных не найден: {metadata_file}")
+                self._report_progress(f"{language}/metadata", 'missing')
+
+            # Матрица эмбеддингов (обычно float16) для точной переоценки кандидатов сжатого индекса
+            matrix = None
+            if embeddings_future is not None:
+                try:
+                    matrix = embeddings_future.result()
+                except Exception as e:
+                    # Матрица необязательна (MMR и точная переоценка): поиск работает и без нее
+                    logger.warning(f"⚠️ Не удалось открыть матрицу {embeddings_file.name}: {e}. Продолжаю без нее.")
+            if matrix is not None:
+                if matrix.shape[0] == index.ntotal:
+                    self.embeddings[language] = matrix
+                    logger.info(f"  - Открыта матрица эмбеддингов {embeddings_file.name} ({matrix.dtype}, mmap)")
+                else:
+                    logger.warning(f"  - Матрица {embeddings_file.name} не совпадает с индексом ({matrix.shape[0]} != {index.ntotal}), пропускаю")
 
-        if chunks_file.exists():
-            with open(chunks_file, 'r', encoding='utf-8') as f:
-                self.chunked_data[language] = json.load(f)
-            logger.info(f"  - Загружены чанки из {chunks_file}")
+            if chunks_future is not None:
+                self.chunked_data[language] = chunks_future.result()
+                logger.info(f"  - Загружены чанки из {chunks_file}")
+            else:
+                 logger.warning(f"  - Файл с чанками не найден: {chunks_file}")
+                 self._report_progress(f"{language}/chunks", 'missing')
+
+            # --- Построение или Загрузка BM25 индекса ---
+            if language in self.metadata and self.metadata[language]:
+                if bm25_future is not None:
+                    try:
+                        self.bm25_indices[language] = bm25_future.result()
+                        logger.info(f"✅ Индекс BM25 успешно загружен")
+                    except Exception as e:
+                        logger.error(f"❌ Ошибка при загрузке BM25 индекса: {e}. Буду строить заново.")
+
+                if language not in self.bm25_indices:
+                    logger.info(f"⏳ Строю индекс BM25 для языка '{language}'...")
+                    self._report_progress(f"{language}/bm25", 'loading')
+                    try:
+                        corpus = []
+                        for meta in self.metadata[language]:
+                            text = self._get_text_from_meta(meta, language)
+                            corpus.append(self._tokenize(text, language))
+                        
+                        self.bm25_indices[language] = BM25Okapi(corpus)
+                        logger.info(f"✅ Индекс BM25 построен ({len(corpus)} документов)")
+                        
+                        logger.info(f"💾 Сохраняю индекс BM25 в файл {bm25_file}...")
+                        with open(bm25_file, 'wb') as f:
+                            pickle.dump(self.bm25_indices[language], f)
+                        logger.info(f"✅ Индекс BM25 сохранен")
+                        
+                    except Exception as e:
+                        logger.error(f"❌ Ошибка при построении BM25: {e}")
+                self._report_progress(f"{language}/bm25", 'ready' if language in self.bm25_indices else 'failed')
+            elif bm25_future is not None:
+                self._report_progress(f"{language}/bm25", 'missing') # без метаданных BM25 не нужен
+
+    def _setup_embedding_backend(self, language: str, config: Dict[str, Any] = None):
+        """Бэкенд запросов для языка: явно переданный или тот, которым построен индекс."""
+        backend = self.embedding_backend
+        if backend is None:
+            # Оба языка обычно построены одной моделью - загружаем ее один раз
+            # (языки загружаются параллельно, поэтому поиск и создание - под блокировкой)
+            config = config or {}
+            key = (config.get('name', 'gemini'), config.get('model') or self.embedding_model_name)
+            with self._init_lock:
+                backend = next((existing for existing in self.embedding_backends.values()
+                                if (existing.name, existing.model_name) == key), None)
+                if backend is None:
+                    backend = backend_from_config(config)
+                self.embedding_backends[language] = backend
         else:
-             logger.warning(f"  - Файл с чанками не найден: {chunks_file}")
+            self.embedding_backends[language] = backend
 
-        # --- Построение или Загрузка BM25 индекса ---
-        bm25_file = self.base_dir / f"bm25_index_{language}.pkl"
+        index_dim = self.indices[language].d
+        if backend.dim and backend.dim != index_dim:
+            logger.error(f"❌ Размерность бэкенда {backend.name} ({backend.dim}) не совпадает с индексом {language} ({index_dim})")
+        logger.info(f"  - Эмбеддинги запросов: {backend.name} ({backend.model_name})")
 
-        if language in self.metadata and self.metadata[language]:
-            if bm25_file.exists():
-                logger.info(f"📂 Загружаю индекс BM25 для языка '{language}' из файла...")
-                try:
-                    with open(bm25_file, 'rb') as f:
-                        self.bm25_indices[language] = pickle.load(f)
-                    logger.info(f"✅ Индекс BM25 успешно загружен")
-                except Exception as e:
-                    logger.error(f"❌ Ошибка при загрузке BM25 индекса: {e}. Буду строить заново.")
+    def _query_backend(self, language: str = None) -> EmbeddingBackend:
+        backend = self.embedding_backends.get(language) or self.embedding_backend
+        if backend is None:
+            backend = self.embedding_backend = backend_from_config(None)
+        return backend
 
-            if language not in self.bm25_indices:
-                logger.info(f"⏳ Строю индекс BM25 для языка '{language}'...")
-                try:
-                    corpus = []
-                    for meta in self.metadata[language]:
-                        text = self._get_text_from_meta(meta, language)
-                        corpus.append(self._tokenize(text, language))
-                    
-                    self.bm25_indices[language] = BM25Okapi(corpus)
-                    logger.info(f"✅ Индекс BM25 построен ({len(corpus)} документов)")
-                    
-                    logger.info(f"💾 Сохраняю индекс BM25 в файл {bm25_file}...")
-                    with open(bm25_file, 'wb') as f:
-                        pickle.dump(self.bm25_indices[language], f)
-                    logger.info(f"✅ Индекс BM25 сохранен")
-                    
-                except Exception as e:
-                    logger.error(f"❌ Ошибка при построении BM25: {e}")
+    def _embeddings_available(self, language: str) -> bool:
+        """False, если предохранитель API эмбеддингов открыт (вызов был бы сразу отклонен)."""
+        return not self._query_backend(language).remote or not self.embedding_breaker.rejecting()
 
-    def _get_embedding(self, texts: List[str], api_key: str = None) -> np.ndarray:
-        """Получает эмбеддинги для списка текстов с помощью Gemini API."""
-        if api_key and api_key != self.current_api_key:
-            try:
-                masked_key = f"{api_key[:4]}...{api_key[-4:]}" if len(api_key) > 8 else "***"
-                logger.info(f"🔑 Using dynamic API key: {masked_key}")
-                genai.configure(api_key=api_key)
-                self.current_api_key = api_key
-            except Exception as e:
-                logger.error(f"Error configuring API key: {e}")
+    def _get_embedding(self, texts: List[str], api_key: str = None, language: str = None) -> np.ndarray:
+        """
+        Получает эмбеддинги запросов бэкендом, которым построен индекс языка (по умолчанию Gemini).
+        Сетевой бэкенд вызывается через предохранитель с таймаутом; при сбое или открытом
+        предохранителе - EmbeddingBackendError (поиск переходит на BM25 + фразу).
+        """
+        backend = self._query_backend(language)
+
+        if not backend.remote:
+            # Локальная модель: сеть и ключ не нужны
+            return backend.embed_queries(texts)
 
         try:
-            if len(texts) == 1:
-                result = genai.embed_content(
-                    model="models/text-embedding-004",
-                    content=texts[0],
-                    task_type="RETRIEVAL_QUERY"
-                )
-                embedding = result['embedding']
-                return np.array([embedding], dtype='float32')
-            else:
-                all_embeddings = []
-                for text in texts:
-                    result = genai.embed_content(
-                        model="models/text-embedding-004",
-                        content=text,
-                        task_type="RETRIEVAL_QUERY"
-                    )
-                    all_embeddings.append(result['embedding'])
-                return np.array(all_embeddings, dtype='float32')
+            # Ключ пользователя уходит в клиент из пула бэкенда, глобальное состояние genai не меняется
+            return self.embedding_breaker.call(backend.embed_queries, texts, api_key=api_key)
+        except (CircuitOpenError, CircuitBusyError) as e:
+            raise EmbeddingBackendError(str(e)) from e
         except Exception as e:
             logger.error(f"❌ Ошибка при получении эмбеддинга от Gemini API: {e}", exc_info=True)
-            dim = 768
-            return np.zeros((len(texts), dim), dtype='float32')
+            raise EmbeddingBackendError(f"{backend.name}: {e}") from e
 
     def _tokenize(self, text: str, language: str) -> List[str]:
         """Токенизация со стеммингом для BM25"""
@@ -407,6 +640,7 @@ class RAGEngine:
                     'verse': None, 
                     'chunk_idx': meta.get('chunk_idx'),
                     'html_path': meta.get('html_path'),
+                    'sources': meta.get('sources', []),
                     'source': 'bm25'
                 })
             
@@ -446,6 +680,7 @@ class RAGEngine:
                     'verse': None,
                     'chunk_idx': meta.get('chunk_idx'),
                     'html_path': meta.get('html_path'),
+                    'sources': meta.get('sources', []),
                     'source': 'simple_match'
                 })
 
@@ -453,61 +688,197 @@ class RAGEngine:
         results.sort(key=lambda x: x['score'], reverse=True)
         return results[:top_k]
 
-    def _search_by_vector(self, query_embedding: np.ndarray, language: str, top_k: int, vector_distance_threshold: float = None) -> List[Dict[str, Any]]:
-        """Внутренний метод векторного поиска в FAISS."""
-        index = self.indices.get(language)
-        if not index: return []
+    def _make_search_params(self, language: str, ef_search: int = None):
+        """Параметры поиска на один запрос (не меняют общий индекс, безопасно для потоков)."""
+        if not ef_search:
+            return None
+        index = faiss.downcast_index(self.indices[language])
+        if isinstance(index, faiss.IndexHNSW):
+            return faiss.SearchParametersHNSW(efSearch=int(ef_search))
+        return None
+
+    def _exact_rerank_factor(self, language: str) -> int:
+        """Запас кандидатов для точной переоценки (1 - переоценка не нужна или невозможна)."""
+        rerank = self.index_configs.get(language, {}).get('rerank')
+        if rerank and language in self.embeddings:
+            return max(1, int(rerank.get('factor', 1)))
+        return 1
+
+    @staticmethod
+    def _normalize_queries(query_embeddings) -> np.ndarray:
+        """Нормализует все векторы запроса одной векторной операцией."""
+        queries = np.asarray(query_embeddings, dtype='float32')
+        if queries.ndim == 1:
+            queries = queries[None, :]
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return queries / norms
 
+    def _candidate_vectors(self, language: str, ids: List[int]) -> Optional[np.ndarray]:
+        """Нормализованные векторы кандидатов: из mmap-матрицы, иначе восстановленные из индекса."""
+        ids_array = np.asarray(ids, dtype='int64')
+        embeddings = self.embeddings.get(language)
         try:
-            query_norm = query_embedding.copy().reshape(1, -1)
-            faiss.normalize_L2(query_norm)
-            distances, indices_found = index.search(query_norm, top_k * 2)
-            
-            results = []
-            metadata_list = self.metadata.get(language, [])
-            
-            seen_ids = set()
-            
-            for i, (dist, idx) in enumerate(zip(distances[0], indices_found[0])):
-                if idx < 0: continue
+            if embeddings is not None:
+                vectors = np.asarray(embeddings[ids_array], dtype='float32')
+            else:
+                index = self.indices[language]
+                vectors = np.vstack([index.reconstruct(int(i)) for i in ids_array])
+            return self._normalize_queries(vectors)
+        except Exception as e:
+            logger.debug(f"Векторы кандидатов недоступны ({language}): {e}")
+            return None
 
-                if vector_distance_threshold is not None and dist > vector_distance_threshold:
-                    continue
+    def _diversify(self, candidates: List[Dict[str, Any]], language: str, top_k: int,
+                   mmr_lambda: float) -> List[Dict[str, Any]]:
+        """MMR по векторам кандидатов: убирает почти одинаковые соседние чанки до переранжирования."""
+        vectors = self._candidate_vectors(language, [item['data']['index'] for item in candidates])
+        if vectors is None:
+            return candidates[:top_k]
+        pinned = sum(1 for item in candidates if item['pinned'])
+        order = mmr_select([item['rrf_score'] for item in candidates], vectors, top_k,
+                           lambda_mult=mmr_lambda, pinned=pinned)
+        logger.info(f"   🎛️ MMR: выбрано {len(order)} из {len(candidates)} кандидатов")
+        return [candidates[i] for i in order]
 
-                meta = metadata_list[idx] if isinstance(metadata_list, list) and idx < len(metadata_list) else {}
-                book, chapter = meta.get('book'), meta.get('chapter')
-                chunk_idx = meta.get('chunk_idx')
-                
-                unique_id = f"{book}_{chapter}_{chunk_idx}"
-                if unique_id in seen_ids:
-                    continue
-                seen_ids.add(unique_id)
-                
-                text = self._get_text_from_meta(meta, language)
-                if not text:
-                    text = meta.get('text_preview', '') + '...'
+    def _adaptive_rerank(self, query: str, candidates: List[Dict[str, Any]],
+                         rerank_depth: Optional[int] = None) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Переранжирование с адаптивной глубиной (см. adaptive_rerank.py).
+        rerank_depth - не больше стольких кандидатов (остальные идут после в порядке RRF).
+        Returns: (результаты, сколько документов оценил cross-encoder)
+        """
+        exact = [res for res in candidates if res.get('pinned')]
+        for res in exact:
+            res['final_score'] = 1.0
+        rest = [res for res in candidates if not res.get('pinned')]
+        tail = rest[rerank_depth:] if rerank_depth is not None else []
+        rest = rest[:rerank_depth]
 
-                results.append({
-                    'index': int(idx),
-                    'distance': float(dist),
-                    'score': float(1.0 / (1.0 + dist)),
-                    'text': text,
-                    'book': book, 
-                    'chapter': chapter, 
-                    'verse': None, 
-                    'chunk_idx': chunk_idx,
-                    'html_path': meta.get('html_path'),
-                    'source': 'vector'
-                })
-                
-                if len(results) >= top_k:
-                    break
+        if not rest or has_clear_winner(rest):
+            if rest:
+                logger.info("   ⏩ Явный лидер по RRF (вектор и BM25 согласны) - переранжирование пропущено")
+            return exact + rest + tail, 0
 
-            return results
+        def score_batch(positions: List[int]) -> List[float]:
+            ranked = self.reranker.rerank(query, [rest[i]['text'] for i in positions], len(positions))
+            scores = [0.0] * len(positions)
+            for idx_in_batch, score, _ in ranked:
+                scores[idx_in_batch] = float(score)
+            return scores
+
+        order, scores = progressive_rerank(score_batch, len(rest))
+        for i, score in scores.items():
+            rest[i]['final_score'] = score
+        logger.info(f"   ⚖️ Переранжировано {len(scores)} из {len(rest)} документов")
+        return exact + [rest[i] for i in order] + tail, len(scores)
+
+    def _search_by_vector(self, query_embedding: np.ndarray, language: str, top_k: int, vector_distance_threshold: float = None, ef_search: int = None, normalized: bool = False) -> List[Dict[str, Any]]:
+        """
+        Внутренний метод векторного поиска в FAISS.
+
+        query_embedding - один вектор или матрица (n, dim) вариантов запроса: все строки
+        ищутся одним вызовом index.search, результаты объединяются по лучшей оценке.
+        score - косинусное сходство, distance - квадрат L2 между единичными векторами
+        (2 - 2·cos) для индексов с METRIC_L2 и METRIC_INNER_PRODUCT одинаково,
+        поэтому vector_distance_threshold имеет один смысл для обоих.
+        ef_search - ширина поиска HNSW для этого запроса (компромисс задержка/recall).
+        """
+        if not self.indices.get(language): return []
+
+        try:
+            queries = query_embedding if normalized else self._normalize_queries(query_embedding)
+            ids, similarities = self._vector_candidates(queries, language, top_k, ef_search)
+            return self._vector_results(ids, similarities, language, top_k, vector_distance_threshold)
         except Exception as e:
             logger.error(f"Ошибка при поиске по вектору ({language}): {e}", exc_info=True)
             return []
 
+    def _vector_candidates(self, queries: np.ndarray, language: str, top_k: int,
+                           ef_search: int = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Один вызов index.search для всех строк queries (нормализованных).
+        Returns: (ids, similarities) - по top_k * 2 кандидатов на строку, cos-сходство.
+        """
+        index = self.indices[language]
+        queries = queries.reshape(-1, queries.shape[-1])
+        # Сжатый индекс (PQ/SQ): берем больше кандидатов и переоцениваем их по точным векторам
+        embeddings = self.embeddings.get(language)
+        rerank_factor = self._exact_rerank_factor(language) if embeddings is not None else 1
+        fetch_k = top_k * 2 * rerank_factor
+        search_params = self._make_search_params(language, ef_search)
+        if search_params is not None:
+            scores, indices_found = index.search(queries, fetch_k, params=search_params)
+        else:
+            scores, indices_found = index.search(queries, fetch_k)
+        scores, indices_found = np.asarray(scores, dtype='float32'), np.asarray(indices_found)
+
+        if rerank_factor > 1:
+            similarities = np.full((queries.shape[0], top_k * 2), -np.inf, dtype='float32')
+            reranked_ids = np.full((queries.shape[0], top_k * 2), -1, dtype='int64')
+            for row in range(queries.shape[0]):
+                ids, sims = exact_rerank(queries[row], indices_found[row], embeddings, top_k * 2)
+                reranked_ids[row, :len(ids)] = ids
+                similarities[row, :len(sims)] = sims
+            indices_found = reranked_ids
+        elif getattr(index, 'metric_type', None) == faiss.METRIC_INNER_PRODUCT:
+            similarities = scores
+        else:
+            # METRIC_L2 возвращает квадрат расстояния: для единичных векторов cos = 1 - d/2
+            similarities = 1.0 - scores / 2.0
+        return indices_found, similarities
+
+    def _vector_results(self, indices_found: np.ndarray, similarities: np.ndarray, language: str,
+                        top_k: int, vector_distance_threshold: float = None) -> List[Dict[str, Any]]:
+        """Результаты векторного поиска по строкам кандидатов (вариантам одного запроса)."""
+        # Лучшая оценка каждой строки по всем вариантам запроса
+        best: Dict[int, float] = {}
+        for row_ids, row_sims in zip(indices_found, similarities):
+            for idx, sim in zip(row_ids.tolist(), row_sims.tolist()):
+                if idx < 0: continue
+                if vector_distance_threshold is not None and 2.0 - 2.0 * sim > vector_distance_threshold:
+                    continue
+                if sim > best.get(idx, -np.inf):
+                    best[idx] = sim
+        
+        results = []
+        metadata_list = self.metadata.get(language, [])
+        
+        seen_ids = set()
+        
+        for idx, sim in sorted(best.items(), key=lambda item: item[1], reverse=True):
+            meta = metadata_list[idx] if isinstance(metadata_list, list) and idx < len(metadata_list) else {}
+            book, chapter = meta.get('book'), meta.get('chapter')
+            chunk_idx = meta.get('chunk_idx')
+            
+            unique_id = f"{book}_{chapter}_{chunk_idx}"
+            if unique_id in seen_ids:
+                continue
+            seen_ids.add(unique_id)
+            
+            text = self._get_text_from_meta(meta, language)
+            if not text:
+                text = meta.get('text_preview', '') + '...'
+
+            results.append({
+                'index': int(idx),
+                'distance': float(2.0 - 2.0 * sim),
+                'score': float(sim),
+                'text': text,
+                'book': book, 
+                'chapter': chapter, 
+                'verse': None, 
+                'chunk_idx': chunk_idx,
+                'html_path': meta.get('html_path'),
+                'sources': meta.get('sources', []),
+                'source': 'vector'
+            })
+            
+            if len(results) >= top_k:
+                break
+
+        return results
+
     def _detect_verse_reference(self, query: str) -> Dict[str, Any]:
         """Пытается определить, является ли запрос ссылкой на стих."""
         query = query.lower().strip()
@@ -550,12 +921,15 @@ class RAGEngine:
         
         logger.info(f"🎯 Ищу стих: Book={target_book}, Chapter={target_chapter}, Verse={target_verse}")
         
+        def normalize_chapter(ch):
+            return '.'.join([p.lstrip('0') for p in str(ch).split('.')])
+        
         for idx, meta in enumerate(metadata_list):
-            if meta.get('book') == target_book:
-                meta_chapter = str(meta.get('chapter', ''))
-                
-                def normalize_chapter(ch):
-                    return '.'.join([p.lstrip('0') for p in str(ch).split('.')])
+            # Текст мог быть схлопнут с дубликатом из другой главы/книги: проверяем все его места
+            for location in [meta] + meta.get('sources', []):
+                if location.get('book') != target_book:
+                    continue
+                meta_chapter = str(location.get('chapter', ''))
                 
                 if normalize_chapter(meta_chapter) == normalize_chapter(target_chapter):
                     
@@ -583,10 +957,11 @@ class RAGEngine:
                             'book': target_book, 
                             'chapter': meta_chapter, 
                             'verse': target_verse, 
-                            'chunk_idx': meta.get('chunk_idx'),
-                            'html_path': meta.get('html_path'),
+                            'chunk_idx': location.get('chunk_idx'),
+                            'html_path': location.get('html_path'),
                             'source': 'exact_verse'
                         })
+                        break
         
         return results
 
@@ -598,15 +973,42 @@ class RAGEngine:
         use_reranking: bool = True,
         expand_query: bool = True,
         vector_distance_threshold: float = None,
-        api_key: str = None
+        api_key: str = None,
+        ef_search: int = None,
+        diversify: bool = True,
+        mmr_lambda: float = 0.7,
+        adaptive_rerank: bool = True,
+        return_timings: bool = False,
+        exclude_ids: Collection[int] = None,
+        include_references: bool = False,
+        fusion: str = 'rrf',
+        fusion_weights: Optional[Dict[str, float]] = None,
+        use_planner: bool = True,
+        rerank_depth: Optional[int] = None,
+        lexical_only: bool = False
     ) -> Dict[str, Any]:
         """
         Основной метод поиска.
         Объединяет: Exact Verse + Vector Search + BM25 + Simple Keyword Search
+        ef_search - ширина поиска HNSW для этого запроса (если индекс HNSW)
+        diversify / mmr_lambda - MMR перед переранжированием (1.0 - без учета разнообразия)
+        adaptive_rerank - пропуск cross-encoder при явном лидере и ранняя остановка
+        return_timings - добавить в ответ 'timings': длительность этапов в мс
+        exclude_ids - строки, уже отданные клиенту (сессия): вместо них добираются новые
+        include_references - вернуть в 'already_sent' краткие ссылки на исключенные строки,
+                             которые попали бы в выдачу
+        fusion - слияние поисков: 'rrf', 'combsum' или 'combmnz' (см. fusion.py)
+        fusion_weights - веса поисков {'vector', 'keyword', 'simple_match'}
+        use_planner - запускать только этапы, нужные для класса запроса (см. query_planner.py);
+                      выбранный план - в ответе ('plan')
+        rerank_depth - cross-encoder оценивает не больше стольких кандидатов (остальные - после них)
+        lexical_only - только BM25 и точная фраза, без эмбеддингов (деградация под нагрузкой)
         """
         logger.info(f"🔍 Поиск: '{query}' ({language}, top_k={top_k})")
+        timer = StageTimer(language)
         if language not in self.indices:
-            return {'success': False, 'error': f'Индекс для языка {language} не загружен.'}
+            return self._finish_search({'success': False, 'error': f'Индекс для языка {language} не загружен.'},
+                                       timer, language, return_timings)
 
         try:
             # 0. Проверка на точный стих
@@ -614,127 +1016,141 @@ class RAGEngine:
             exact_results = []
             if verse_ref:
                 exact_results = self._find_verse_in_metadata(verse_ref, language)
-                if exact_results:
-                    logger.info(f"🎉 Найдены точные совпадения стихов: {len(exact_results)}")
-                    return {
-                        'success': True,
-                        'results': exact_results,
-                        'query': query,
-                        'search_type': 'exact_verse_reference',
-                        'count': len(exact_results)
-                    }
-
-            # 1. Расширение запроса
-            query_variants = [query]
-            if expand_query:
-                expander_method = getattr(QueryExpander, f'expand_query_{language}', None)
-                if expander_method:
-                    query_variants = expander_method(query)
-
-            logger.info(f"   📋 Варианты запроса: {query_variants}")
+            timer.lap('exact')
+            if exact_results:
+                logger.info(f"🎉 Найдены точные совпадения стихов: {len(exact_results)}")
+                return self._finish_search({
+                    'success': True,
+                    'results': exact_results,
+                    'query': query,
+                    'search_type': 'exact_verse_reference',
+                    'count': len(exact_results),
+                    'plan': PLANS[VERSE_REFERENCE].describe()
+                }, timer, language, return_timings)
 
-            # 2. Получение эмбеддингов
-            variant_embeddings = self._get_embedding(query_variants, api_key=api_key)
-            
-            # 3. Векторный поиск
-            all_vector_results = []
-            for idx, emb in enumerate(variant_embeddings):
-                vector_results = self._search_by_vector(emb, language, top_k * 2, vector_distance_threshold)
-                all_vector_results.extend(vector_results)
-
-            # Удаление дубликатов для векторного поиска
-            seen_indices = set()
-            unique_vector_results = []
-            for res in sorted(all_vector_results, key=lambda x: x['score'], reverse=True):
-                if res['index'] not in seen_indices:
-                    seen_indices.add(res['index'])
-                    unique_vector_results.append(res)
-            
-            top_vector_results = unique_vector_results[:top_k * 2]
-
-            # --- DEBUG: ЧТО НАШЕЛ ВЕКТОР? ---
-            if top_vector_results:
-                logger.info(f"   👀 ВЕКТОРНЫЙ ПОИСК (Топ-3):")
-                for i, res in enumerate(top_vector_results[:3]):
-                    preview = res['text'][:100].replace('\n', ' ')
-                    logger.info(f"      {i+1}. [{res['score']:.4f}] {preview}...")
-            else:
-                logger.info("   👀 Векторный поиск ничего не нашел.")
-            # --------------------------------
+            # 1. План: какие поиски окупаются для такого запроса (см. query_planner.py)
+            plan = plan_query(query) if use_planner else PLANS[FULL]
+            if lexical_only:
+                plan = plan.lexical()
+            elif plan.vector and not self._embeddings_available(language):
+                # Предохранитель API эмбеддингов открыт: не ждем сеть, сразу BM25 + фраза
+                plan = plan.lexical(fallback='lexical', rerank=plan.rerank)
+            logger.info(f"   🧭 План: {plan.describe()}")
+            exclude_ids = exclude_ids or frozenset()
+            depth = self._retrieval_depth(top_k, exclude_ids)
 
-            # 4. Keyword Search (BM25)
+            # 2. Keyword Search (BM25) - локально и дешево, поэтому до эмбеддингов
+            timer.skip()
             keyword_results = []
-            if language in self.bm25_indices:
-                keyword_results = self._search_by_keyword(query, language, top_k * 2)
+            if plan.keyword and language in self.bm25_indices:
+                keyword_results = self._search_by_keyword(query, language, depth)
+            timer.lap('bm25')
 
-            # 5. Simple Exact Phrase Search (NEW)
-            simple_match_results = self._search_by_simple_match(query, language, top_k * 2)
+            # 3. Simple Exact Phrase Search
+            simple_match_results = []
+            simple_match_done = plan.simple_match
+            if plan.simple_match:
+                timer.skip()
+                simple_match_results = self._search_by_simple_match(query, language, depth)
+                timer.lap('simple_match')
             if simple_match_results:
                 logger.info(f"   📝 Простой поиск нашел {len(simple_match_results)} точных совпадений")
 
-            # 6. Hybrid Fusion (RRF - Reciprocal Rank Fusion)
-            k_rrf = 60
-            combined_scores = {}
-            
-            # Добавляем точные результаты (если вдруг есть)
-            for res in exact_results:
-                idx = res['index']
-                combined_scores[idx] = {'data': res, 'rrf_score': 100.0}
-
-            # Process Vector Results
-            for rank, res in enumerate(top_vector_results):
-                idx = res['index']
-                if idx not in combined_scores:
-                    combined_scores[idx] = {'data': res, 'rrf_score': 0.0}
-                if combined_scores[idx]['rrf_score'] < 50.0:
-                    combined_scores[idx]['rrf_score'] += 1.0 / (k_rrf + rank + 1)
-                    combined_scores[idx]['data']['vector_rank'] = rank + 1
-                
-            # Process BM25 Results
-            for rank, res in enumerate(keyword_results):
-                idx = res['index']
-                if idx not in combined_scores:
-                    combined_scores[idx] = {'data': res, 'rrf_score': 0.0}
-                if combined_scores[idx]['rrf_score'] < 50.0:
-                    # BM25 обычно точнее вектора для редких слов
-                    combined_scores[idx]['rrf_score'] += 1.0 / (k_rrf + rank + 1)
-                    combined_scores[idx]['data']['keyword_rank'] = rank + 1
-
-            # Process Simple Match Results (NEW)
-            # Точное совпадение фразы должно иметь высокий вес
-            for rank, res in enumerate(simple_match_results):
-                idx = res['index']
-                if idx not in combined_scores:
-                    combined_scores[idx] = {'data': res, 'rrf_score': 0.0}
-                if combined_scores[idx]['rrf_score'] < 50.0:
-                    # Добавляем вес. Если слово редкое, ранг будет высоким.
-                    combined_scores[idx]['rrf_score'] += 1.0 / (k_rrf + rank + 1)
-                    combined_scores[idx]['data']['simple_match_rank'] = rank + 1
-
-            # Sort by RRF score
-            hybrid_results = sorted(combined_scores.values(), key=lambda x: x['rrf_score'], reverse=True)
-            
-            # Extract top_k
-            final_candidates = []
-            for item in hybrid_results[:top_k]:
-                res = item['data']
-                res['score'] = item['rrf_score']
-                final_candidates.append(res)
+            # Лексика ничего не нашла (опечатка в имени, нет BM25) - нужен вектор
+            if not plan.vector and not plan.fallback and not lexical_only \
+                    and not keyword_results and not simple_match_results:
+                plan = plan.with_fallback('vector')
+
+            query_variants = [query]
+            top_vector_results = []
+            if plan.vector:
+                # 4. Расширение запроса
+                timer.skip()
+                if expand_query and plan.expand:
+                    expander_method = getattr(QueryExpander, f'expand_query_{language}', None)
+                    if expander_method:
+                        query_variants = expander_method(query)
+                timer.lap('expansion')
+
+                logger.info(f"   📋 Варианты запроса: {query_variants}")
+
+                # 5. Эмбеддинги (все варианты запроса - одним батчем)
+                try:
+                    variant_embeddings = self._get_embedding(query_variants, api_key=api_key, language=language)
+                    timer.lap('embedding')
+                except EmbeddingBackendError as e:
+                    logger.warning(f"⚡ Эмбеддинги недоступны ({e}) - только BM25 и точная фраза")
+                    plan = plan.lexical(fallback='lexical', rerank=plan.rerank)
+                    query_variants = [query]
+                    if not simple_match_done:
+                        simple_match_results = self._search_by_simple_match(query, language, depth)
+                        timer.lap('simple_match')
+
+            if plan.vector:
+                # 6. Векторный поиск
+                query_matrix = self._normalize_queries(variant_embeddings)
+                all_vector_results = self._search_by_vector(
+                    query_matrix, language, depth, vector_distance_threshold,
+                    ef_search=ef_search, normalized=True
+                )
+
+                # Удаление дубликатов для векторного поиска
+                seen_indices = set()
+                unique_vector_results = []
+                for res in sorted(all_vector_results, key=lambda x: x['score'], reverse=True):
+                    if res['index'] not in seen_indices:
+                        seen_indices.add(res['index'])
+                        unique_vector_results.append(res)
+
+                top_vector_results = unique_vector_results[:depth]
+                timer.lap('vector')
+
+                # --- DEBUG: ЧТО НАШЕЛ ВЕКТОР? ---
+                if top_vector_results:
+                    logger.info(f"   👀 ВЕКТОРНЫЙ ПОИСК (Топ-3):")
+                    for i, res in enumerate(top_vector_results[:3]):
+                        preview = res['text'][:100].replace('\n', ' ')
+                        logger.info(f"      {i+1}. [{res['score']:.4f}] {preview}...")
+                else:
+                    logger.info("   👀 Векторный поиск ничего не нашел.")
+                # --------------------------------
+
+            # 7. Hybrid Fusion (RRF - Reciprocal Rank Fusion)
+            hybrid_results = self._fuse_results(exact_results, top_vector_results, keyword_results, simple_match_results,
+                                                self._fusion_limit(top_k, exclude_ids), fusion, fusion_weights)
+            hybrid_results, already_sent = self._split_excluded(hybrid_results, exclude_ids, top_k)
+            timer.lap('fusion')
+
+            # 8. Диверсификация (MMR): из расширенного пула берем top_k непохожих друг на друга
+            final_candidates = self._select_candidates(hybrid_results, language, top_k, diversify, mmr_lambda)
+            timer.lap('diversify')
             
             logger.info(f"   🤝 Гибридный поиск: объединено {len(final_candidates)} результатов")
 
-            # 7. Переранжирование (Re-ranking)
-            if use_reranking and self.reranker.model:
+            # 9. Переранжирование (Re-ranking)
+            timer.skip()
+            reranked_count = 0
+            use_reranking = use_reranking and plan.rerank
+            if use_reranking and self.reranker.model and adaptive_rerank:
+                try:
+                    final_results, reranked_count = self._adaptive_rerank(query, final_candidates, rerank_depth)
+                except Exception as e:
+                    logger.error(f"❌ Re-ranking failed (using standard results): {e}")
+                    final_results = final_candidates
+            elif use_reranking and self.reranker.model:
                 try:
                     logger.info("⏳ Starting Re-ranking process...")
                     docs_to_rerank = []
                     indices_to_rerank = []
                     final_results = []
                     
+                    not_reranked = []
                     for i, res in enumerate(final_candidates):
-                        if res['score'] > 50.0:
+                        if res.get('pinned'):
                             res['final_score'] = 1.0
                             final_results.append(res)
+                        elif rerank_depth is not None and len(docs_to_rerank) >= rerank_depth:
+                            not_reranked.append(res)
                         else:
                             docs_to_rerank.append(res['text'])
                             indices_to_rerank.append(i)
@@ -742,12 +1158,14 @@ class RAGEngine:
                     if docs_to_rerank:
                         logger.info(f"   Reranking {len(docs_to_rerank)} documents...")
                         reranked_tuples = self.reranker.rerank(query, docs_to_rerank, len(docs_to_rerank))
+                        reranked_count = len(docs_to_rerank)
                         
                         for original_idx_in_subset, score, text in reranked_tuples:
                             original_idx = indices_to_rerank[original_idx_in_subset]
                             original_result = final_candidates[original_idx]
                             original_result['final_score'] = float(score)
                             final_results.append(original_result)
+                        final_results.extend(not_reranked)
                     else:
                         # If nothing to rerank (all exact matches), just copy
                         final_results.extend([res for res in final_candidates if 'final_score' not in res])
@@ -761,17 +1179,309 @@ class RAGEngine:
                 if use_reranking:
                     logger.info("⏩ Skipping Re-ranking (model not loaded or disabled)")
                 final_results = final_candidates
+            timer.lap('rerank')
 
-            return {
+            response = {
                 'success': True,
                 'results': final_results,
                 'query_variants': query_variants,
-                'count': len(final_results)
+                'count': len(final_results),
+                'reranked_count': reranked_count,
+                'plan': plan.describe()
             }
+            if exclude_ids:
+                response['excluded_count'] = len(already_sent)
+                if include_references:
+                    response['already_sent'] = already_sent
+            return self._finish_search(response, timer, language, return_timings)
         
         except Exception as e:
             logger.error(f"❌ Критическая ошибка при поиске: {e}", exc_info=True)
-            return {'success': False, 'error': str(e), 'query': query}
+            return self._finish_search({'success': False, 'error': str(e), 'query': query},
+                                       timer, language, return_timings)
+
+    def search_batch(
+        self,
+        queries: List[str],
+        language: str = 'ru',
+        top_k: int = 5,
+        use_reranking: bool = True,
+        expand_query: bool = True,
+        vector_distance_threshold: float = None,
+        api_key: str = None,
+        ef_search: int = None,
+        diversify: bool = True,
+        mmr_lambda: float = 0.7,
+        adaptive_rerank: bool = True,
+        return_timings: bool = False,
+        exclude_ids: Collection[int] = None,
+        include_references: bool = False,
+        fusion: str = 'rrf',
+        fusion_weights: Optional[Dict[str, float]] = None,
+        use_planner: bool = True,
+        rerank_depth: Optional[int] = None,
+        lexical_only: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Поиск сразу по нескольким запросам (несколько шагов агента за один вызов).
+        Те же этапы, что и в search, но эмбеддинги всех вариантов всех запросов -
+        одним вызовом бэкенда, векторный поиск - одним index.search, переранжирование -
+        одним прогоном модели по парам всех запросов (без ранней остановки:
+        она имеет смысл только для последовательных пачек одного запроса).
+
+        exclude_ids / include_references / fusion / use_planner / rerank_depth / lexical_only - как в search,
+        общие для всех запросов пакета (план - свой у каждого запроса).
+
+        Returns:
+            {'success', 'results': [ответ как у search для каждого запроса], 'count'}
+        """
+        logger.info(f"🔍 Пакетный поиск: {len(queries)} запросов ({language}, top_k={top_k})")
+        timer = StageTimer(language, histogram=SEARCH_BATCH_STAGE_SECONDS)
+        if language not in self.indices:
+            return self._finish_search({'success': False, 'error': f'Индекс для языка {language} не загружен.'},
+                                       timer, language, return_timings)
+
+        try:
+            responses: List[Dict[str, Any]] = [None] * len(queries)
+            pending = [] # запросы без точного стиха
+
+            # 0. Точные стихи
+            for position, query in enumerate(queries):
+                verse_ref = self._detect_verse_reference(query)
+                exact_results = self._find_verse_in_metadata(verse_ref, language) if verse_ref else []
+                if exact_results:
+                    responses[position] = {
+                        'success': True,
+                        'results': exact_results,
+                        'query': query,
+                        'search_type': 'exact_verse_reference',
+                        'count': len(exact_results),
+                        'plan': PLANS[VERSE_REFERENCE].describe()
+                    }
+                else:
+                    pending.append(position)
+            timer.lap('exact')
+
+            # 1. План каждого запроса
+            plans = {position: plan_query(queries[position]) if use_planner else PLANS[FULL]
+                     for position in pending}
+            if lexical_only:
+                plans = {position: plan.lexical() for position, plan in plans.items()}
+            elif not self._embeddings_available(language):
+                plans = {position: plan.lexical(fallback='lexical', rerank=plan.rerank) if plan.vector else plan
+                         for position, plan in plans.items()}
+            exclude_ids = exclude_ids or frozenset()
+            depth = self._retrieval_depth(top_k, exclude_ids)
+
+            # 2-3. BM25 и простой поиск (локально, по каждому запросу) - до эмбеддингов
+            keyword_results: Dict[int, List[Dict[str, Any]]] = {}
+            for position in pending:
+                keyword_results[position] = self._search_by_keyword(queries[position], language, depth) \
+                    if plans[position].keyword and language in self.bm25_indices else []
+            timer.lap('bm25')
+            simple_match_results = {position: self._search_by_simple_match(queries[position], language, depth)
+                                    if plans[position].simple_match else []
+                                    for position in pending}
+            timer.lap('simple_match')
+            for position in pending if not lexical_only else ():
+                if not plans[position].vector and not plans[position].fallback and not keyword_results[position] \
+                        and not simple_match_results[position]:
+                    plans[position] = plans[position].with_fallback('vector')
+
+            # 4. Расширение запросов (только тех, кому нужен вектор)
+            vector_pending = [position for position in pending if plans[position].vector]
+            variants: Dict[int, List[str]] = {position: [queries[position]] for position in pending}
+            for position in vector_pending:
+                if expand_query and plans[position].expand:
+                    expander_method = getattr(QueryExpander, f'expand_query_{language}', None)
+                    if expander_method:
+                        variants[position] = expander_method(queries[position])
+            timer.lap('expansion')
+
+            # 5. Эмбеддинги и векторный поиск - один вызов на все варианты всех запросов
+            vector_results: Dict[int, List[Dict[str, Any]]] = {position: [] for position in pending}
+            all_variants = [variant for position in vector_pending for variant in variants[position]]
+            variant_embeddings = None
+            if all_variants:
+                try:
+                    variant_embeddings = self._get_embedding(all_variants, api_key=api_key, language=language)
+                    timer.lap('embedding')
+                except EmbeddingBackendError as e:
+                    logger.warning(f"⚡ Эмбеддинги недоступны ({e}) - только BM25 и точная фраза")
+                    for position in vector_pending:
+                        if not plans[position].simple_match:
+                            simple_match_results[position] = self._search_by_simple_match(
+                                queries[position], language, depth)
+                        plans[position] = plans[position].lexical(fallback='lexical', rerank=plans[position].rerank)
+                        variants[position] = [queries[position]]
+            if variant_embeddings is not None:
+                query_matrix = self._normalize_queries(variant_embeddings)
+                ids, similarities = self._vector_candidates(query_matrix, language, depth, ef_search)
+                row = 0
+                for position in vector_pending:
+                    rows = slice(row, row + len(variants[position]))
+                    vector_results[position] = self._vector_results(
+                        ids[rows], similarities[rows], language, depth, vector_distance_threshold
+                    )
+                    row = rows.stop
+                timer.lap('vector')
+
+            # 6-7. Слияние и диверсификация
+            candidates: Dict[int, List[Dict[str, Any]]] = {}
+            already_sent: Dict[int, List[Dict[str, Any]]] = {}
+            for position in pending:
+                hybrid_results = self._fuse_results([], vector_results[position], keyword_results[position],
+                                                    simple_match_results[position],
+                                                    self._fusion_limit(top_k, exclude_ids), fusion, fusion_weights)
+                hybrid_results, already_sent[position] = self._split_excluded(hybrid_results, exclude_ids, top_k)
+                candidates[position] = self._select_candidates(hybrid_results, language, top_k, diversify, mmr_lambda)
+            timer.lap('fusion')
+
+            # 8. Переранжирование: пары (запрос, документ) всех запросов одним прогоном
+            pairs, owners = [], []
+            reranked_counts = {position: 0 for position in pending}
+            if use_reranking and self.reranker.model:
+                for position in pending:
+                    if not plans[position].rerank:
+                        continue
+                    rest = [res for res in candidates[position] if not res.get('pinned')]
+                    if adaptive_rerank and has_clear_winner(rest):
+                        continue
+                    for res in rest[:rerank_depth]:
+                        pairs.append((queries[position], res['text']))
+                        owners.append((position, res))
+            if pairs:
+                try:
+                    logger.info(f"   Reranking {len(pairs)} documents for {len(pending)} queries...")
+                    for (position, res), score in zip(owners, self.reranker.score_pairs(pairs)):
+                        res['final_score'] = float(score)
+                        reranked_counts[position] += 1
+                except Exception as e:
+                    logger.error(f"❌ Re-ranking failed (using standard results): {e}")
+
+            for position in pending:
+                exact = [res for res in candidates[position] if res.get('pinned')]
+                for res in exact:
+                    res['final_score'] = 1.0
+                rest = [res for res in candidates[position] if not res.get('pinned')]
+                scored = sorted((res for res in rest if 'final_score' in res),
+                                key=lambda res: res['final_score'], reverse=True)
+                final_results = exact + scored + [res for res in rest if 'final_score' not in res]
+                responses[position] = {
+                    'success': True,
+                    'results': final_results,
+                    'query': queries[position],
+                    'query_variants': variants[position],
+                    'count': len(final_results),
+                    'reranked_count': reranked_counts[position],
+                    'plan': plans[position].describe()
+                }
+                if exclude_ids:
+                    responses[position]['excluded_count'] = len(already_sent[position])
+                    if include_references:
+                        responses[position]['already_sent'] = already_sent[position]
+            timer.lap('rerank')
+
+            return self._finish_search({
+                'success': True,
+                'results': responses,
+                'count': len(responses)
+            }, timer, language, return_timings)
+
+        except Exception as e:
+            logger.error(f"❌ Критическая ошибка при пакетном поиске: {e}", exc_info=True)
+            return self._finish_search({'success': False, 'error': str(e), 'queries': queries},
+                                       timer, language, return_timings)
+
+    @staticmethod
+    def _retrieval_depth(top_k: int, exclude_ids: Collection[int]) -> int:
+        """Сколько кандидатов брать из каждого поиска: с запасом на исключенные строки сессии."""
+        return top_k * 2 + min(len(exclude_ids), top_k * 2)
+
+    @staticmethod
+    def _fusion_limit(top_k: int, exclude_ids: Collection[int]) -> int:
+        """Сколько строк слияния нужно дальше: пул MMR плюс исключенные строки сессии."""
+        return top_k * MMR_POOL_FACTOR + len(exclude_ids)
+
+    @staticmethod
+    def _split_excluded(hybrid_results: List[Dict[str, Any]], exclude_ids: Collection[int],
+                        top_k: int) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        Убирает из слияния строки, уже отданные в сессии (их не нужно ни переранжировать,
+        ни пересылать). Returns: (оставшиеся, краткие ссылки на исключенные из первых top_k).
+        """
+        if not exclude_ids:
+            return hybrid_results, []
+        remaining, already_sent = [], []
+        for item in hybrid_results:
+            if item['data']['index'] not in exclude_ids:
+                remaining.append(item)
+            elif len(already_sent) < top_k:
+                res = item['data']
+                already_sent.append({key: res.get(key)
+                                     for key in ('index', 'book', 'chapter', 'verse', 'chunk_idx', 'html_path')})
+        return remaining, already_sent
+
+    @staticmethod
+    def _fuse_results(exact_results: List[Dict[str, Any]], top_vector_results: List[Dict[str, Any]],
+                      keyword_results: List[Dict[str, Any]],
+                      simple_match_results: List[Dict[str, Any]], limit: Optional[int] = None,
+                      method: str = 'rrf', weights: Optional[Dict[str, float]] = None) -> List[Dict[str, Any]]:
+        """
+        Гибридное слияние (см. fusion.py): список {'data', 'rrf_score', 'pinned'} по убыванию оценки.
+        Точные совпадения закреплены первыми; словари создаются только для первых limit строк.
+        """
+        retrievers = {'vector': top_vector_results, 'keyword': keyword_results, 'simple_match': simple_match_results}
+        fused = fuse(
+            {name: [res['index'] for res in results] for name, results in retrievers.items()},
+            method=method, weights=weights,
+            scores={name: [res['score'] for res in results] for name, results in retrievers.items()},
+            pinned=[res['index'] for res in exact_results], limit=limit
+        )
+
+        # Данные строки - из первого источника, где она есть (точные, вектор, BM25, простой поиск)
+        rows: Dict[int, Dict[str, Any]] = {}
+        for results in (simple_match_results, keyword_results, top_vector_results, exact_results):
+            rows.update((res['index'], res) for res in results)
+
+        hybrid_results = []
+        for position, row_id in enumerate(fused.row_ids.tolist()):
+            res = rows[row_id]
+            for name in retrievers:
+                rank = int(fused.ranks[name][position])
+                if rank:
+                    res[f"{name}_rank"] = rank
+            pinned = bool(fused.pinned[position])
+            if pinned:
+                res['pinned'] = True
+            hybrid_results.append({'data': res, 'rrf_score': float(fused.scores[position]), 'pinned': pinned})
+        return hybrid_results
+
+    def _select_candidates(self, hybrid_results: List[Dict[str, Any]], language: str, top_k: int,
+                           diversify: bool, mmr_lambda: float) -> List[Dict[str, Any]]:
+        """top_k кандидатов после слияния (с MMR), score - оценка RRF."""
+        if diversify and len(hybrid_results) > 1:
+            selected = self._diversify(hybrid_results[:top_k * MMR_POOL_FACTOR], language, top_k, mmr_lambda)
+        else:
+            selected = hybrid_results[:top_k]
+
+        # Extract top_k
+        final_candidates = []
+        for item in selected:
+            res = item['data']
+            res['score'] = item['rrf_score']
+            final_candidates.append(res)
+        return final_candidates
+
+    @staticmethod
+    def _finish_search(result: Dict[str, Any], timer: StageTimer, language: str,
+                       return_timings: bool) -> Dict[str, Any]:
+        """Записывает итоговые метрики запроса и при необходимости прикладывает timings."""
+        timings = timer.finish()
+        SEARCH_REQUESTS.inc(language=language, outcome='success' if result.get('success') else 'error')
+        if return_timings:
+            result['timings'] = timings
+        return result
 
     def keyword_search(self, query: str, language: str = 'en', case_sensitive: bool = False) -> Dict[str, Any]:
         """
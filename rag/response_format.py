@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+📦 КОМПАКТНЫЕ ОТВЕТЫ ПОИСКА
+
+По умолчанию /api/search отдает каждый результат целиком: полный текст чанка
+и служебные поля (distance, index, ранги источников). Для агента и больших top_k
+это лишние килобайты и время сериализации. Здесь:
+- project_results - проекция полей (fields=...), сниппет вокруг совпадений
+  (snippet_length=...) и смещения подсветки по BM25-стеммам и фразе запроса;
+- dumps - orjson, если установлен (иначе стандартный json без ASCII-экранирования);
+- encode_body - gzip/brotli по Accept-Encoding для больших ответов.
+"""
+
+import gzip
+import json
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+# Поля, которых достаточно клиенту-агенту (fields='compact')
+COMPACT_FIELDS = ('index', 'book', 'chapter', 'verse', 'html_path', 'final_score', 'snippet', 'highlights')
+# Слова короче не подсвечиваются (предлоги, союзы)
+MIN_HIGHLIGHT_WORD = 3
+# Ответы меньше этого не сжимаются: выигрыш меньше накладных расходов
+MIN_COMPRESS_BYTES = 1024
+DEFAULT_SNIPPET_LENGTH = 300
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+
+
+def parse_fields(fields: Union[None, str, Sequence[str]]) -> Optional[Tuple[str, ...]]:
+    """fields из запроса: список, строка через запятую или 'compact'. None - все поля."""
+    if not fields:
+        return None
+    if isinstance(fields, str):
+        if fields == 'compact':
+            return COMPACT_FIELDS
+        fields = fields.split(',')
+    return tuple(field.strip() for field in fields if field and field.strip())
+
+
+def find_highlights(text: str, query: str, stemmer=None) -> List[Tuple[int, int]]:
+    """
+    Отрезки [start, end) текста, совпавшие с запросом: вхождения всей фразы
+    и слова, чей стемм (как в BM25) совпадает со стеммом слова запроса.
+    Отрезки отсортированы и не пересекаются.
+    """
+    stem = stemmer.stem if stemmer else (lambda word: word)
+    query_stems = {stem(word) for word in WORD_RE.findall(query.lower()) if len(word) >= MIN_HIGHLIGHT_WORD}
+    spans = []
+
+    phrase = query.strip()
+    if phrase and len(WORD_RE.findall(phrase)) > 1:
+        spans.extend(m.span() for m in re.finditer(re.escape(phrase), text, re.IGNORECASE))
+
+    if query_stems:
+        # Стемм - почти всегда префикс слова: дешевый отсев до вызова стеммера
+        prefixes = {s[:MIN_HIGHLIGHT_WORD] for s in query_stems}
+        for match in WORD_RE.finditer(text):
+            word = match.group().lower()
+            if len(word) >= MIN_HIGHLIGHT_WORD and word[:MIN_HIGHLIGHT_WORD] in prefixes \
+                    and stem(word) in query_stems:
+                spans.append(match.span())
+
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def make_snippet(text: str, highlights: Sequence[Tuple[int, int]],
+                 length: int) -> Tuple[str, int, List[Tuple[int, int]]]:
+    """
+    Окно текста длиной до length с наибольшим числом подсветок (по границам слов).
+    Returns: (сниппет, смещение сниппета в тексте, подсветки относительно сниппета)
+    """
+    if len(text) <= length:
+        return text, 0, list(highlights)
+
+    # Окно начинается чуть раньше одной из подсветок; выбираем то, где их больше
+    lead = length // 4
+    best_start, best_count = 0, -1
+    right = 0
+    for left, (anchor, _) in enumerate(highlights):
+        start = max(0, anchor - lead)
+        right = max(right, left)
+        while right < len(highlights) and highlights[right][1] <= start + length:
+            right += 1
+        if right - left > best_count:
+            best_start, best_count = start, right - left
+
+    start = best_start
+    if start > 0:
+        space = text.find(' ', start, start + lead)
+        start = space + 1 if space != -1 else start
+    end = min(len(text), start + length)
+    if end < len(text):
+        space = text.rfind(' ', start, end)
+        end = space if space > start else end
+
+    inside = [(s - start, e - start) for s, e in highlights if s >= start and e <= end]
+    return text[start:end], start, inside
+
+
+def project_result(result: Dict[str, Any], query: str, stemmer=None,
+                   fields: Optional[Sequence[str]] = None,
+                   snippet_length: Optional[int] = None) -> Dict[str, Any]:
+    """Один результат поиска: сниппет и подсветка (если запрошены), затем проекция полей."""
+    want_snippet = bool(snippet_length) or bool(fields and 'snippet' in fields)
+    projected = dict(result)
+
+    if want_snippet or (fields and 'highlights' in fields):
+        text = result.get('text') or ''
+        highlights = find_highlights(text, query, stemmer)
+        if want_snippet:
+            snippet, offset, highlights = make_snippet(text, highlights, snippet_length or DEFAULT_SNIPPET_LENGTH)
+            projected['snippet'] = snippet
+            projected['snippet_offset'] = offset
+        projected['highlights'] = [list(span) for span in highlights]
+
+    if fields:
+        projected = {name: projected[name] for name in fields if name in projected}
+    return projected
+
+
+def project_results(results: List[Dict[str, Any]], query: str, stemmer=None,
+                    fields: Optional[Sequence[str]] = None,
+                    snippet_length: Optional[int] = None) -> List[Dict[str, Any]]:
+    if not fields and not snippet_length:
+        return results
+    return [project_result(result, query, stemmer, fields, snippet_length) for result in results]
+
+
+def _json_default(value):
+    # numpy-скаляры и прочее, что не знает стандартный json
+    if hasattr(value, 'item'):
+        return value.item()
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(payload: Any) -> bytes:
+    """JSON в байтах: orjson (в разы быстрее на больших ответах) или стандартный json."""
+    if orjson is not None:
+        return orjson.dumps(payload, default=_json_default, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':'), default=_json_default).encode('utf-8')
+
+
+def _accepted_qualities(accept_encoding: str) -> Dict[str, float]:
+    """Accept-Encoding -> {кодировка: q} (без q - 1.0, нечитаемый q - 0)."""
+    qualities = {}
+    for part in (accept_encoding or '').split(','):
+        name, *params = [item.strip() for item in part.split(';')]
+        if not name:
+            continue
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[name.lower()] = quality
+    return qualities
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    Лучшее сжатие из поддерживаемых клиентом: br (если есть пакет brotli), затем gzip.
+    Кодировки с q=0 клиент явно отверг ('*' - остальные, не названные явно).
+    """
+    qualities = _accepted_qualities(accept_encoding)
+
+    def accepted(name: str) -> bool:
+        return qualities.get(name, qualities.get('*', 0.0)) > 0
+
+    if brotli is not None and accepted('br'):
+        return 'br'
+    if accepted('gzip'):
+        return 'gzip'
+    return None
+
+
+def encode_body(body: bytes, accept_encoding: str) -> Tuple[bytes, Optional[str]]:
+    """Сжимает тело ответа, если клиент это принимает и ответ достаточно большой."""
+    encoding = choose_encoding(accept_encoding) if len(body) >= MIN_COMPRESS_BYTES else None
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY), encoding
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=GZIP_LEVEL), encoding
+    return body, None
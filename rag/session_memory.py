@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+🧾 ПАМЯТЬ СЕССИЙ ПОИСКА
+
+Агент в одном диалоге ищет похожие термины много раз, и сервер снова и снова
+отдает те же чанки, которые уже лежат в промпте. SessionMemory помнит для
+session_id, какие строки индекса уже были отданы, - поиск исключает их
+и добирает новые кандидаты.
+
+Память ограничена: не больше max_sessions сессий (вытесняется давно
+неактивная, LRU), сессия живет ttl_seconds с последнего обращения,
+в сессии не больше max_rows_per_language строк на язык (старые забываются).
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, FrozenSet, Iterable
+
+
+class SessionMemory:
+    """session_id → язык → уже отданные строки индекса (в порядке выдачи)."""
+
+    def __init__(self, max_sessions: int = 1000, ttl_seconds: float = 3600.0,
+                 max_rows_per_language: int = 2000):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_rows_per_language = max_rows_per_language
+        # session_id -> (время последнего обращения, {язык: OrderedDict строк})
+        self._sessions: "OrderedDict[str, list]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self, now: float):
+        """Вытесняет просроченные сессии и лишние по LRU (самые старые - в начале)."""
+        while self._sessions:
+            session_id, (last_access, _) = next(iter(self._sessions.items()))
+            if now - last_access > self.ttl_seconds or len(self._sessions) > self.max_sessions:
+                del self._sessions[session_id]
+            else:
+                break
+
+    def _touch(self, session_id: str, now: float) -> Dict[str, "OrderedDict[int, None]"]:
+        entry = self._sessions.get(session_id)
+        if entry is None or now - entry[0] > self.ttl_seconds:
+            entry = [now, {}]
+        entry[0] = now
+        self._sessions[session_id] = entry
+        self._sessions.move_to_end(session_id)
+        return entry[1]
+
+    def seen(self, session_id: str, language: str) -> FrozenSet[int]:
+        """Строки, уже отданные в этой сессии (пустое множество для новой или истекшей)."""
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return frozenset()
+            entry[0] = now
+            self._sessions.move_to_end(session_id)
+            return frozenset(entry[1].get(language, ()))
+
+    def remember(self, session_id: str, language: str, row_ids: Iterable[int]):
+        now = time.monotonic()
+        with self._lock:
+            rows = self._touch(session_id, now).setdefault(language, OrderedDict())
+            for row_id in row_ids:
+                rows[int(row_id)] = None
+                rows.move_to_end(int(row_id))
+            while len(rows) > self.max_rows_per_language:
+                rows.popitem(last=False)
+            self._evict(now)
+
+    def forget(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def clear(self):
+        """Сброс всех сессий (после перезагрузки данных номера строк другие)."""
+        with self._lock:
+            self._sessions.clear()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+⏱️ БЕНЧМАРК СТАРТА
+
+Время до первого ответа складывается из трех частей, и мерить их нужно раздельно:
+- import_ms       - импорт модуля (rag.rag_engine или rag.rag_api_server): до него
+                    сервер не может напечатать STATUS: SERVER_STARTED;
+- init_ms         - создание RAGEngine (индекс, BM25, модель переранжирования);
+- first_query_ms  - первый поиск (ленивые импорты, холодные кэши);
+- second_query_ms - повторный поиск для сравнения с первым.
+
+Каждый замер - в свежем интерпретаторе (как при запуске приложения), итог - медиана
+по --repeats запускам. В отчете также список тяжелых модулей, загруженных уже при
+импорте (после ленивых импортов он должен быть пустым).
+
+ЗАПУСК:
+    python rag/startup_benchmark.py --synthetic
+    python rag/startup_benchmark.py --data-dir rag --language ru --reranker jina --module rag.rag_api_server
+"""
+
+import argparse
+import importlib
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT_DIR))
+
+PHASES = ('import_ms', 'init_ms', 'first_query_ms', 'second_query_ms')
+
+
+def probe(module: str, data_dir: str, language: str, query: str, reranker: str) -> Dict[str, Any]:
+    """Один замер в текущем (свежем) процессе."""
+    started_at = time.perf_counter()
+    importlib.import_module(module)
+    import_ms = (time.perf_counter() - started_at) * 1000
+
+    from rag.rag_engine import HEAVY_MODULES, RAGEngine
+    loaded_on_import = [name for name in HEAVY_MODULES if name in sys.modules]
+
+    from rag.benchmark import DisabledReranker
+    started_at = time.perf_counter()
+    engine = RAGEngine(languages=[language], base_dir=data_dir,
+                       reranker=DisabledReranker() if reranker == 'none' else None)
+    init_ms = (time.perf_counter() - started_at) * 1000
+
+    query_ms = []
+    for _ in range(2):
+        started_at = time.perf_counter()
+        result = engine.search(query, language=language, top_k=10)
+        query_ms.append((time.perf_counter() - started_at) * 1000)
+        if not result.get('success'):
+            raise RuntimeError(f"поиск не удался: {result.get('error')}")
+
+    return {'import_ms': import_ms, 'init_ms': init_ms, 'first_query_ms': query_ms[0],
+            'second_query_ms': query_ms[1], 'heavy_loaded_on_import': loaded_on_import}
+
+
+def run_probe(module: str, data_dir: str, language: str, query: str, reranker: str) -> Dict[str, Any]:
+    """Замер в отдельном интерпретаторе: модули еще не импортированы."""
+    args = json.dumps({'module': module, 'data_dir': data_dir, 'language': language,
+                       'query': query, 'reranker': reranker})
+    completed = subprocess.run([sys.executable, str(Path(__file__).resolve()), '--probe', args],
+                               capture_output=True, text=True, cwd=str(ROOT_DIR), check=True)
+    # Последняя строка stdout - результат (выше может быть вывод библиотек)
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def run_startup_benchmark(data_dir: str, language: str = 'en', query: str = 'soul',
+                          module: str = 'rag.rag_engine', reranker: str = 'none',
+                          repeats: int = 3) -> Dict[str, Any]:
+    runs: List[Dict[str, Any]] = [run_probe(module, data_dir, language, query, reranker) for _ in range(repeats)]
+    return {
+        'config': {'module': module, 'language': language, 'query': query,
+                   'reranker': reranker, 'repeats': repeats},
+        'median_ms': {phase: round(statistics.median(run[phase] for run in runs), 1) for phase in PHASES},
+        'runs_ms': [{phase: round(run[phase], 1) for phase in PHASES} for run in runs],
+        'heavy_loaded_on_import': runs[0]['heavy_loaded_on_import'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Время импорта, запуска RAGEngine и первого запроса")
+    parser.add_argument('--synthetic', action='store_true', help="сгенерировать синтетический корпус")
+    parser.add_argument('--data-dir', default='rag', help="папка с индексом (если не --synthetic)")
+    parser.add_argument('--language', default='en')
+    parser.add_argument('--query', default='soul')
+    parser.add_argument('--module', default='rag.rag_engine', help="какой модуль импортировать первым")
+    parser.add_argument('--reranker', choices=['none', 'jina'], default='none')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--output', help="куда записать отчет JSON")
+    parser.add_argument('--probe', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.probe:
+        print(json.dumps(probe(**json.loads(args.probe))))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_dir = args.data_dir
+        if args.synthetic:
+            from rag.benchmark import build_synthetic_corpus
+            data_dir = tmp_dir
+            print("🧪 Генерирую синтетический корпус...")
+            build_synthetic_corpus(tmp_dir, args.language, num_queries=1)
+
+        print(f"⏱️ Замеряю старт x{args.repeats} ({args.module})...")
+        report = run_startup_benchmark(str(Path(data_dir).resolve()), args.language, args.query,
+                                       module=args.module, reranker=args.reranker, repeats=args.repeats)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+        print(f"💾 Отчет сохранен: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
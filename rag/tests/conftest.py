@@ -1,6 +1,8 @@
 import pytest
 import sys
 import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from unittest.mock import MagicMock
 
 # Add the project root to sys.path so we can import 'rag'
@@ -82,3 +84,55 @@ def mock_rag_engine(mocker, sample_metadata, mock_faiss, mock_genai):
     # engine.bm25_indices['ru'] = ...
     
     return engine
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """Minimal stand-in for GitHub Releases: serves `payload` (or `files[path]`) with optional Range support."""
+    payload = b''
+    files = None  # {'/name': bytes} to serve several assets
+    requested = None
+    supports_range = True
+    fail_after = None  # close the connection after this many body bytes
+    served_bytes = 0
+
+    def do_GET(self):
+        payload = self.payload
+        if self.files is not None:
+            type(self).requested = (self.requested or []) + [self.path]
+            payload = self.files.get(self.path)
+            if payload is None:
+                self.send_error(404)
+                return
+        start, end = 0, len(payload) - 1
+        range_header = self.headers.get('Range')
+        if range_header and self.supports_range:
+            first, last = range_header.split('=')[1].split('-')
+            start, end = int(first), int(last or end)
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(payload)}')
+        else:
+            self.send_response(200)
+        body = payload[start:end + 1]
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', '"v1"')
+        self.end_headers()
+        if self.fail_after is not None and len(body) > self.fail_after:
+            body = body[:self.fail_after]
+            self.close_connection = True
+        type(self).served_bytes += len(body)
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def range_http_server():
+    """Local HTTP server with Range support; yields (handler_class, url). Set handler.payload before use."""
+    handler = type('Handler', (RangeHandler,), {})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield handler, f"http://127.0.0.1:{server.server_address[1]}/data.zip"
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,39 @@
+from rag.adaptive_rerank import has_clear_winner, progressive_rerank
+
+
+def candidate(score, vector_rank=None, keyword_rank=None):
+    return {'score': score, 'vector_rank': vector_rank, 'keyword_rank': keyword_rank}
+
+
+def test_clear_winner_needs_margin_and_agreement():
+    leader = candidate(2 / 61, vector_rank=1, keyword_rank=1)
+    assert has_clear_winner([leader, candidate(1 / 62, vector_rank=2)])
+    # Отрыв маленький: второй почти так же высоко в обоих списках
+    assert not has_clear_winner([leader, candidate(2 / 62, vector_rank=2, keyword_rank=2)])
+    # BM25 не согласен с вектором
+    assert not has_clear_winner([candidate(0.03, vector_rank=1, keyword_rank=3), candidate(0.01)])
+
+
+def test_progressive_rerank_stops_when_head_is_stable():
+    relevance = [9, 8, 7, 6, 5, 4, 3, 2, 1, 0, -1, -2]
+    batches = []
+
+    def score_batch(positions):
+        batches.append(positions)
+        return [relevance[i] for i in positions]
+
+    order, scores = progressive_rerank(score_batch, len(relevance), stable_k=3, batch_size=4)
+
+    assert batches == [[0, 1, 2, 3], [4, 5, 6, 7]]
+    assert len(scores) == 8
+    assert order == list(range(12))
+
+
+def test_progressive_rerank_continues_while_head_changes():
+    # Лучшие документы в конце списка RRF - придется оценить все
+    relevance = [1, 2, 3, 4, 5, 6, 7, 8]
+    order, scores = progressive_rerank(lambda positions: [relevance[i] for i in positions],
+                                       len(relevance), stable_k=2, batch_size=2)
+
+    assert len(scores) == 8
+    assert order[:2] == [7, 6]
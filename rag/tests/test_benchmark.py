@@ -0,0 +1,51 @@
+from rag.benchmark import build_synthetic_corpus, run_benchmark, compare_to_baseline, relevance_scores
+
+
+def test_synthetic_benchmark_reports_latency_and_relevance(tmp_path):
+    queries = build_synthetic_corpus(str(tmp_path), 'en', num_books=2, chapters_per_book=5,
+                                     chunks_per_chapter=10, num_queries=20)
+
+    report = run_benchmark(str(tmp_path), queries, 'en', top_k=5, warmup=2)
+
+    assert report['config']['vectors'] == 100
+    assert report['errors'] == 0
+    assert report['qps'] > 0
+    assert set(report['latency_ms']['total']) == {'p50', 'p95', 'p99', 'mean'}
+    assert 'vector' in report['latency_ms'] and 'bm25' in report['latency_ms']
+    assert report['relevance']['recall@5'] >= 0.9
+    assert report['relevance']['labelled_queries'] == 20
+
+
+def test_relevance_counts_duplicate_sources():
+    results = [
+        {'book': 'bg', 'chapter': '1.html', 'chunk_idx': 0},
+        {'book': 'sb', 'chapter': '2.html', 'chunk_idx': 3,
+         'sources': [{'book': 'cc', 'chapter': '4.html', 'chunk_idx': 1}]},
+    ]
+    assert relevance_scores(results, [['cc', '4.html', 1]]) == (1.0, 0.5)
+
+
+def test_baseline_comparison_flags_regressions():
+    baseline = {'qps': 100.0, 'latency_ms': {'total': {'p95': 10.0, 'p99': 12.0}},
+                'relevance': {'recall@10': 0.95, 'mrr': 0.9}}
+    same = {'qps': 98.0, 'latency_ms': {'total': {'p95': 10.5, 'p99': 12.0}},
+            'relevance': {'recall@10': 0.95, 'mrr': 0.9}}
+    worse = {'qps': 70.0, 'latency_ms': {'total': {'p95': 15.0, 'p99': 12.0}},
+             'relevance': {'recall@10': 0.8, 'mrr': 0.9}}
+
+    assert compare_to_baseline(same, baseline) == []
+    regressions = compare_to_baseline(worse, baseline)
+    assert len(regressions) == 3
+
+
+def test_startup_benchmark_imports_engine_without_heavy_modules(tmp_path):
+    from rag.startup_benchmark import PHASES, run_startup_benchmark
+
+    build_synthetic_corpus(str(tmp_path), 'en', num_books=1, chapters_per_book=2,
+                           chunks_per_chapter=5, num_queries=1)
+
+    report = run_startup_benchmark(str(tmp_path), 'en', repeats=1)
+
+    assert report['heavy_loaded_on_import'] == []
+    assert set(report['median_ms']) == set(PHASES)
+    assert all(value > 0 for value in report['median_ms'].values())
@@ -0,0 +1,28 @@
+from rag.chunk_dedup import MinHashDeduplicator, sources_by_canonical, load_duplicates, save_duplicates
+from rag.chunk_splitter import ChunkSplitter
+
+PURPORT = ' '.join(f"In purport {i} the Lord explains that the soul is eternal and cannot be slain by weapons, "
+                   f"burned by fire, moistened by water or withered by the wind." for i in range(10))
+
+
+def test_near_duplicates_collapse_to_first_chunk(tmp_path):
+    chunks = {
+        'bg': {'2': [PURPORT, 'Text 13. As the embodied soul continuously passes from boyhood to youth.']},
+        'sb': {'1': [PURPORT.replace('purport 3 ', 'purport three '), 'Completely unrelated commentary about the universe.']},
+    }
+    duplicates = MinHashDeduplicator(threshold=0.8).find_duplicates(chunks, verbose=False)
+
+    assert duplicates == {('sb', '1', 0): ('bg', '2', 0)}
+    assert sources_by_canonical(duplicates) == {('bg', '2', 0): [('sb', '1', 0)]}
+
+    save_duplicates(duplicates, 'en', base_dir=str(tmp_path))
+    assert load_duplicates('en', base_dir=str(tmp_path)) == duplicates
+
+
+def test_overlapping_neighbour_chunks_are_not_duplicates():
+    words = ' '.join(f"word{i}." for i in range(2000))
+    chunks = ChunkSplitter(chunk_size=2048, overlap=256).split_text(words)
+    assert len(chunks) > 2
+
+    duplicates = MinHashDeduplicator().find_duplicates({'bg': {'1': chunks}}, verbose=False)
+    assert duplicates == {}
@@ -0,0 +1,110 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from rag.benchmark import DisabledReranker, build_synthetic_corpus
+from rag.circuit_breaker import CircuitBreaker, CircuitOpenError, CLOSED, HALF_OPEN, OPEN
+from rag.embedding_backends import EmbeddingBackendError, HashBackend
+from rag.rag_engine import RAGEngine
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def failing():
+    raise ConnectionError("API down")
+
+
+def test_breaker_opens_rejects_and_recovers_after_probe():
+    clock = FakeClock()
+    breaker = CircuitBreaker('test', window=4, min_calls=2, reset_timeout=10, call_timeout=0, clock=clock)
+
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            breaker.call(failing)
+    assert breaker.state == OPEN and breaker.rejecting()
+    with pytest.raises(CircuitOpenError):
+        breaker.call(lambda: 'ok')
+
+    clock.now = 11 # пауза прошла: один пробный вызов
+    with pytest.raises(ConnectionError):
+        breaker.call(failing)
+    assert breaker.state == OPEN
+
+    clock.now = 22
+    assert breaker.call(lambda: 'ok') == 'ok'
+    assert breaker.state == CLOSED
+
+
+def test_breaker_times_out_hanging_calls():
+    breaker = CircuitBreaker('slow', min_calls=1, call_timeout=0.05)
+
+    with pytest.raises(TimeoutError):
+        breaker.call(time.sleep, 1)
+    assert breaker.state == OPEN
+
+
+class FlakyRemoteBackend(HashBackend):
+    remote = True
+
+    def __init__(self):
+        super().__init__(dim=64)
+        self.calls = 0
+        self.down = True
+
+    def embed_queries(self, texts, api_key=None):
+        self.calls += 1
+        if self.down:
+            raise ConnectionError("API down")
+        return super().embed_queries(texts)
+
+
+def test_search_falls_back_to_lexical_and_skips_open_circuit(tmp_path):
+    queries = build_synthetic_corpus(str(tmp_path), 'en', num_books=2, chapters_per_book=4,
+                                     chunks_per_chapter=10, num_queries=1, embedder=HashBackend(dim=64))
+    backend = FlakyRemoteBackend()
+    engine = RAGEngine(languages=['en'], base_dir=str(tmp_path), reranker=DisabledReranker(),
+                       embedding_backend=backend)
+    engine.embedding_breaker = CircuitBreaker('embedding', min_calls=1, reset_timeout=60, call_timeout=0)
+    query = queries[0]['query']
+
+    first = engine.search(query, language='en', top_k=5)
+    assert first['success'] and first['count'] > 0 and first['plan']['fallback'] == 'lexical'
+    with pytest.raises(EmbeddingBackendError):
+        engine._get_embedding([query], language='en')
+
+    # Предохранитель открыт: сеть больше не вызывается
+    second = engine.search(query, language='en', top_k=5)
+    batch = engine.search_batch([query, 'another query about dharma'], language='en', top_k=5)
+    assert backend.calls == 1
+    assert [r['index'] for r in second['results']] == [r['index'] for r in first['results']]
+    assert all(r['plan'].get('fallback') == 'lexical' for r in batch['results'])
+
+
+def test_queue_wait_does_not_count_toward_timeout():
+    breaker = CircuitBreaker('busy', min_calls=1, call_timeout=0.3, max_workers=2)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        # 4 вызова по 0.2 сек на 2 потока: вторая пара ждет очереди, но каждый вызов укладывается в таймаут
+        results = list(executor.map(lambda _: breaker.call(time.sleep, 0.2), range(4)))
+
+    assert results == [None] * 4
+    assert breaker.state == CLOSED and breaker.snapshot()['failures'] == 0
+
+
+def test_close_stops_worker_threads():
+    breaker = CircuitBreaker('closing', call_timeout=1)
+    breaker.call(lambda: 'ok')
+    threads = list(breaker._executor._threads)
+
+    breaker.close()
+
+    for thread in threads:
+        thread.join(timeout=1)
+    assert not any(thread.is_alive() for thread in threads)
@@ -0,0 +1,106 @@
+import json
+import os
+import shutil
+
+from rag.data_manifest import DataUpdater, build_manifest, forget_local_manifest
+
+
+def write_data(directory, index=b'index-v1', page=b'<p>v1</p>'):
+    (directory / 'books' / 'en' / 'bg').mkdir(parents=True, exist_ok=True)
+    (directory / 'faiss_index_en.bin').write_bytes(index)
+    (directory / 'faiss_metadata_en.json').write_text('{}', encoding='utf-8')
+    (directory / 'books' / 'en' / 'bg' / '1.html').write_bytes(page)
+
+
+def publish(handler, output_dir):
+    handler.files = {'/' + name: (output_dir / name).read_bytes() for name in os.listdir(output_dir)}
+    handler.requested = []
+
+
+def run_update(data_dir, url, languages=None):
+    updater = DataUpdater(str(data_dir), url)
+    remote = updater.fetch_manifest()
+    changed = updater.plan(remote, languages)
+    updater.stage(changed)
+    updater.apply(remote, changed, languages)
+    return [entry['path'] for entry in changed]
+
+
+def test_only_changed_files_are_downloaded(range_http_server, tmp_path):
+    handler, url = range_http_server
+    manifest_url = url.rsplit('/', 1)[0] + '/data_manifest.json'
+
+    installed = tmp_path / 'installed'
+    write_data(installed)  # installed from a full archive: no local manifest yet
+    release = tmp_path / 'release_v3'
+    write_data(release, index=b'index-v2')
+    build_manifest(str(release), 3, str(tmp_path / 'out_v3'))
+    publish(handler, tmp_path / 'out_v3')
+
+    assert run_update(installed, manifest_url) == ['faiss_index_en.bin']
+    assert (installed / 'faiss_index_en.bin').read_bytes() == b'index-v2'
+    assert '/books_en.zip' not in handler.requested
+    assert (installed / 'data_version.txt').read_text() == '3'
+    assert not (installed / '.update_staging').exists()
+    local = json.loads((installed / 'data_manifest.json').read_text(encoding='utf-8'))
+    assert local['version'] == 3
+
+
+def test_changed_bundle_replaces_books_folder(range_http_server, tmp_path):
+    handler, url = range_http_server
+    manifest_url = url.rsplit('/', 1)[0] + '/data_manifest.json'
+
+    installed = tmp_path / 'installed'
+    write_data(installed)
+    (installed / 'books' / 'en' / 'stale.html').write_bytes(b'old')
+    release = tmp_path / 'release_v4'
+    write_data(release, page=b'<p>v2</p>')
+    build_manifest(str(release), 4, str(tmp_path / 'out_v4'))
+    publish(handler, tmp_path / 'out_v4')
+
+    assert run_update(installed, manifest_url) == ['books/en']
+    assert (installed / 'books' / 'en' / 'bg' / '1.html').read_bytes() == b'<p>v2</p>'
+    assert not (installed / 'books' / 'en' / 'stale.html').exists()
+
+    # Second run: the local manifest says everything is current
+    handler.requested = []
+    assert run_update(installed, manifest_url) == []
+    assert handler.requested == ['/data_manifest.json']
+
+
+def test_requested_language_is_installed_by_delta(range_http_server, tmp_path):
+    handler, url = range_http_server
+    manifest_url = url.rsplit('/', 1)[0] + '/data_manifest.json'
+
+    installed = tmp_path / 'installed'
+    write_data(installed)
+    release = tmp_path / 'release_v3'
+    write_data(release)
+    (release / 'faiss_index_ru.bin').write_bytes(b'index-ru')
+    build_manifest(str(release), 3, str(tmp_path / 'out_v3'))
+    publish(handler, tmp_path / 'out_v3')
+
+    assert run_update(installed, manifest_url) == []  # only the installed language is tracked
+    assert run_update(installed, manifest_url, languages={'en', 'ru'}) == ['faiss_index_ru.bin']
+    assert (installed / 'faiss_index_ru.bin').read_bytes() == b'index-ru'
+
+
+def test_full_archive_install_invalidates_local_manifest(range_http_server, tmp_path):
+    handler, url = range_http_server
+    manifest_url = url.rsplit('/', 1)[0] + '/data_manifest.json'
+
+    installed = tmp_path / 'installed'
+    write_data(installed)
+    release = tmp_path / 'release_v3'
+    write_data(release)
+    build_manifest(str(release), 3, str(tmp_path / 'out_v3'))
+    publish(handler, tmp_path / 'out_v3')
+    assert run_update(installed, manifest_url) == []
+
+    # A full archive replaces the files behind the manifest's back
+    (installed / 'faiss_index_en.bin').write_bytes(b'index-xx')
+    forget_local_manifest(str(installed))
+
+    assert not (installed / 'data_manifest.json').exists()
+    assert run_update(installed, manifest_url) == ['faiss_index_en.bin']
+    assert (installed / 'faiss_index_en.bin').read_bytes() == b'index-v1'
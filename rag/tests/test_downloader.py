@@ -0,0 +1,70 @@
+import hashlib
+import json
+import os
+
+import pytest
+
+from rag.data_downloader import RangeDownloader, DownloadError
+
+PAYLOAD = os.urandom(300 * 1024)
+
+
+@pytest.fixture
+def http_server(range_http_server):
+    handler, url = range_http_server
+    handler.payload = PAYLOAD
+    return handler, url
+
+
+def test_parallel_download_with_checksum(http_server, tmp_path):
+    _, url = http_server
+    destination = str(tmp_path / "data.zip")
+    progress = []
+
+    RangeDownloader(url, destination, num_segments=4, min_segment_size=32 * 1024, chunk_size=8192,
+                    expected_sha256=hashlib.sha256(PAYLOAD).hexdigest(),
+                    progress_callback=lambda done, total, speed: progress.append((done, total))).download()
+
+    assert open(destination, 'rb').read() == PAYLOAD
+    assert not os.path.exists(destination + '.part.json')
+    assert progress[-1] == (len(PAYLOAD), len(PAYLOAD))
+
+
+def test_resume_after_interrupted_download(http_server, tmp_path):
+    handler, url = http_server
+    destination = str(tmp_path / "data.zip")
+
+    handler.fail_after = 50 * 1024
+    with pytest.raises(DownloadError):
+        RangeDownloader(url, destination, num_segments=2, min_segment_size=32 * 1024, chunk_size=8192,
+                        max_retries=0).download()
+    with open(destination + '.part.json', encoding='utf-8') as f:
+        saved = sum(segment['done'] for segment in json.load(f)['segments'])
+    assert saved > 0
+
+    handler.fail_after = None
+    handler.served_bytes = 0
+    RangeDownloader(url, destination, num_segments=2, min_segment_size=32 * 1024, chunk_size=8192).download()
+
+    assert open(destination, 'rb').read() == PAYLOAD
+    # Only the missing tail of each segment was requested again (plus the 1-byte probe)
+    assert handler.served_bytes == len(PAYLOAD) - saved + 1
+
+
+def test_checksum_mismatch_discards_partial_file(http_server, tmp_path):
+    _, url = http_server
+    destination = str(tmp_path / "data.zip")
+
+    with pytest.raises(DownloadError):
+        RangeDownloader(url, destination, expected_sha256='0' * 64).download()
+    assert not os.path.exists(destination)
+    assert not os.path.exists(destination + '.part')
+
+
+def test_falls_back_to_sequential_without_range_support(http_server, tmp_path):
+    handler, url = http_server
+    handler.supports_range = False
+    destination = str(tmp_path / "data.zip")
+
+    RangeDownloader(url, destination).download()
+    assert open(destination, 'rb').read() == PAYLOAD
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from rag.embedding_backends import (
+    GeminiBackend, HashBackend, LocalBackend, backend_from_config, create_backend
+)
+from rag.rag_engine import RAGEngine
+from rag.benchmark import DisabledReranker, build_synthetic_corpus
+
+
+def test_hash_backend_is_deterministic_and_normalized():
+    backend = HashBackend(dim=64)
+    first = backend.embed_queries(["krishna arjuna", "dharma"])
+    second = HashBackend(dim=64).embed_documents(["krishna arjuna", "dharma"])
+
+    assert first.shape == (2, 64)
+    np.testing.assert_allclose(first, second)
+    np.testing.assert_allclose(np.linalg.norm(first, axis=1), 1.0, rtol=1e-5)
+
+
+def test_backend_from_config_round_trip():
+    assert isinstance(backend_from_config(None), GeminiBackend)
+    restored = backend_from_config(HashBackend(dim=32).describe())
+    assert isinstance(restored, HashBackend) and restored.dim == 32
+    # dim из метаданных: модель не загружается, пока не нужна
+    local = backend_from_config({'name': 'local', 'model': 'intfloat/multilingual-e5-small', 'dim': 384})
+    assert isinstance(local, LocalBackend) and local.query_prefix == "query: "
+    with pytest.raises(ValueError):
+        create_backend('word2vec')
+
+
+def test_engine_embeds_queries_with_index_backend(tmp_path, mock_genai):
+    build_synthetic_corpus(str(tmp_path), 'en', num_books=1, chapters_per_book=2,
+                           chunks_per_chapter=5, num_queries=1, embedder=HashBackend(dim=64))
+
+    engine = RAGEngine(languages=['en'], base_dir=str(tmp_path), reranker=DisabledReranker())
+
+    assert isinstance(engine.embedding_backends['en'], HashBackend)
+    assert engine._get_embedding(["query"], language='en').shape == (1, 64)
+    mock_genai.assert_not_called()
@@ -0,0 +1,64 @@
+import json
+
+import numpy as np
+
+from rag.embedding_store import (
+    EmbeddingStoreWriter, load_embedding_matrix, rows_from_structure, exact_rerank, package_embedding_matrix
+)
+
+
+def test_writer_roundtrip_float16(tmp_path):
+    """Batches are appended into one memory-mappable matrix with a row table."""
+    path = tmp_path / "embeddings_ru.npy"
+    with EmbeddingStoreWriter(str(path), 4, dtype='float16') as writer:
+        writer.append(np.ones((2, 4)), [('bg', '1', 0), ('bg', '1', 1)], ['a', 'b'])
+        writer.append(np.full((1, 4), 3.0), [('sb', '2', 0)], ['c'])
+
+    matrix = load_embedding_matrix(str(path))
+    assert matrix.shape == (3, 4)
+    assert matrix.dtype == np.float16
+    assert isinstance(matrix, np.memmap)
+    # Rows are stored L2-normalized
+    np.testing.assert_allclose(np.linalg.norm(matrix.astype('float32'), axis=1), 1.0, atol=1e-3)
+
+    metadata = writer.metadata()
+    assert metadata['rows'] == [['bg', '1', 0], ['bg', '1', 1], ['sb', '2', 0]]
+    assert metadata['total_embeddings'] == 3
+
+
+def test_rows_from_structure_uses_numeric_key_order():
+    """Legacy npz keys must be ordered embeddings_2 < embeddings_10."""
+    structure = {
+        'bg': {'ch10': {'embedding_key': 'embeddings_10', 'num_chunks': 1, 'text_previews': ['ten']}},
+        'sb': {'ch2': {'embedding_key': 'embeddings_2', 'num_chunks': 2, 'text_previews': ['two-a', 'two-b']}},
+    }
+    rows, previews, keys = rows_from_structure(structure)
+    assert keys == ['embeddings_2', 'embeddings_10']
+    assert rows == [['sb', 'ch2', 0], ['sb', 'ch2', 1], ['bg', 'ch10', 0]]
+    assert previews == ['two-a', 'two-b', 'ten']
+
+
+def test_exact_rerank_orders_candidates_by_true_similarity():
+    """Candidates from a compressed index are re-scored against the stored vectors."""
+    embeddings = np.eye(4, dtype='float16')
+    query = np.array([0.0, 0.6, 0.8, 0.0], dtype='float32')
+    ids, similarities = exact_rerank(query, np.array([0, 1, 2, -1]), embeddings, top_k=2)
+    assert ids.tolist() == [2, 1]
+    np.testing.assert_allclose(similarities, [0.8, 0.6], atol=1e-3)
+
+
+def test_archive_gets_float16_matrix_only_for_compressed_index(tmp_path):
+    data_dir, archive_dir = tmp_path / "rag", tmp_path / "archive"
+    data_dir.mkdir(), archive_dir.mkdir()
+    vectors = np.random.default_rng(0).standard_normal((10, 8)).astype('float32')
+    np.save(data_dir / "embeddings_en.npy", vectors)
+    np.save(data_dir / "embeddings_ru.npy", vectors)
+    (data_dir / "faiss_metadata_en.json").write_text(json.dumps({'index_config': {'spec': 'IVF4,Flat'}}))
+    (data_dir / "faiss_metadata_ru.json").write_text(json.dumps({'index_config': {'spec': 'IVF4,PQ4', 'rerank': {'factor': 4}}}))
+
+    assert package_embedding_matrix(str(data_dir), 'en', str(archive_dir)) is None
+    packaged = load_embedding_matrix(package_embedding_matrix(str(data_dir), 'ru', str(archive_dir)))
+
+    assert packaged.dtype == np.float16 and packaged.shape == vectors.shape
+    np.testing.assert_allclose(packaged, vectors, atol=1e-2)
+    assert not (archive_dir / "embeddings_en.npy").exists()
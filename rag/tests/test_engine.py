@@ -53,3 +53,18 @@ def test_search_error_handling(mock_rag_engine):
     # In rag_engine.py: catch Exception -> return {'success': False, 'error': ...}
     assert result['success'] is False
     assert "API Error" in result['error']
+
+def test_search_returns_stage_timings(mock_rag_engine):
+    """Timings are opt-in and cover every stage of the hybrid search."""
+    engine = mock_rag_engine
+    engine._get_embedding = MagicMock(return_value=[[0.1] * 768])
+    engine._search_by_vector = MagicMock(return_value=[
+        {'index': 0, 'score': 0.9, 'text': 'Result 1', 'book': 'bg', 'chapter': '1', 'chunk_idx': 0}
+    ])
+    engine.reranker.model = None
+
+    assert 'timings' not in engine.search("meaning of work", language="ru")
+    result = engine.search("meaning of work", language="ru", return_timings=True)
+
+    for stage in ('exact', 'expansion', 'embedding', 'vector', 'bm25', 'simple_match', 'fusion', 'rerank', 'total'):
+        assert result['timings'][stage] >= 0
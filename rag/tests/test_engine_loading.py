@@ -0,0 +1,56 @@
+import threading
+from pathlib import Path
+
+import pytest
+
+from rag.benchmark import DisabledReranker, build_synthetic_corpus
+from rag.embedding_backends import HashBackend
+from rag.embedding_store import embeddings_file_name
+from rag.rag_engine import RAGEngine
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    for language in ('en', 'ru'):
+        build_synthetic_corpus(str(tmp_path), language, num_books=1, chapters_per_book=2,
+                               chunks_per_chapter=5, num_queries=1, embedder=HashBackend(dim=64))
+    RAGEngine(languages=['en', 'ru'], base_dir=str(tmp_path), reranker=DisabledReranker()) # строит BM25 pickle
+    return str(tmp_path)
+
+
+def test_languages_and_components_load_concurrently(data_dir, mocker):
+    # Метаданные и чанки обоих языков: барьер пройдут, только если все четыре чтения идут одновременно
+    barrier = threading.Barrier(4, timeout=5)
+    read_json = RAGEngine._read_json
+
+    def read_json_together(path):
+        barrier.wait()
+        return read_json(path)
+
+    mocker.patch.object(RAGEngine, '_read_json', side_effect=read_json_together)
+
+    engine = RAGEngine(languages=['en', 'ru'], base_dir=data_dir, reranker=DisabledReranker())
+
+    assert set(engine.metadata) == set(engine.chunked_data) == set(engine.bm25_indices) == {'en', 'ru'}
+    assert engine.search('dharma', language='ru', top_k=3)['success']
+
+
+def test_progress_reports_each_component(data_dir):
+    events = []
+
+    RAGEngine(languages=['en', 'de'], base_dir=data_dir, reranker=DisabledReranker(),
+              on_progress=lambda component, status: events.append((component, status)))
+
+    final = dict(events)
+    assert final == {'en/index': 'ready', 'en/metadata': 'ready', 'en/chunks': 'ready',
+                     'en/bm25': 'ready', 'de/index': 'missing'}
+    assert events.index(('en/index', 'loading')) < events.index(('en/index', 'ready'))
+
+
+def test_corrupt_embedding_matrix_does_not_abort_init(data_dir):
+    Path(data_dir, embeddings_file_name('en')).write_bytes(b'\x93NUMPY truncated')
+
+    engine = RAGEngine(languages=['en'], base_dir=data_dir, reranker=DisabledReranker())
+
+    assert 'en' not in engine.embeddings
+    assert engine.search('dharma', language='en', top_k=3)['success']
@@ -0,0 +1,183 @@
+import json
+
+import faiss
+import numpy as np
+import pytest
+
+from rag.benchmark import DisabledReranker, build_synthetic_corpus
+from rag.embedding_backends import HashBackend
+from rag.faiss_indexer import FAISSIndexer, infer_index_config, pareto_front
+from rag.rag_engine import RAGEngine
+
+
+def test_migrate_to_inner_product_keeps_neighbours(tmp_path):
+    """An old L2 index is rebuilt as inner product from its own vectors, scores become cosine."""
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((50, 8)).astype('float32')
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    old_index = faiss.IndexFlatL2(8)
+    old_index.add(vectors)
+    faiss.write_index(old_index, str(tmp_path / "faiss_index_ru.bin"))
+    (tmp_path / "faiss_metadata_ru.json").write_text(json.dumps({'embedding_dim': 8}), encoding='utf-8')
+
+    assert FAISSIndexer(embedding_dim=8).migrate_to_inner_product('ru', data_dir=str(tmp_path))
+
+    index = faiss.read_index(str(tmp_path / "faiss_index_ru.bin"))
+    assert index.metric_type == faiss.METRIC_INNER_PRODUCT
+    _, old_ids = old_index.search(vectors[:5], 3)
+    scores, ids = index.search(vectors[:5], 3)
+    np.testing.assert_array_equal(ids, old_ids)
+    np.testing.assert_allclose(scores[:, 0], 1.0, atol=1e-5)
+
+    metadata = json.loads((tmp_path / "faiss_metadata_ru.json").read_text(encoding='utf-8'))
+    assert metadata['metric'] == 'ip'
+    assert metadata['index_config']['spec'] == 'Flat'
+
+
+def test_migration_refuses_index_without_metadata(tmp_path):
+    old_index = faiss.IndexFlatL2(8)
+    old_index.add(np.eye(8, dtype='float32'))
+    faiss.write_index(old_index, str(tmp_path / "faiss_index_ru.bin"))
+
+    assert not FAISSIndexer(embedding_dim=8).migrate_to_inner_product('ru', data_dir=str(tmp_path))
+
+    assert not (tmp_path / "faiss_metadata_ru.json").exists()
+    assert faiss.read_index(str(tmp_path / "faiss_index_ru.bin")).metric_type == faiss.METRIC_L2
+
+
+def test_migrate_hnsw_sq_index_without_index_config(tmp_path):
+    vectors = unit_vectors(300)
+    old_index = faiss.index_factory(16, 'HNSW16_SQ8', faiss.METRIC_L2)
+    old_index.train(vectors)
+    old_index.add(vectors)
+    faiss.downcast_index(old_index).hnsw.efSearch = 40
+    faiss.write_index(old_index, str(tmp_path / "faiss_index_en.bin"))
+    (tmp_path / "faiss_metadata_en.json").write_text(json.dumps({'rows': [[0, 0, i] for i in range(300)]}),
+                                                     encoding='utf-8')
+
+    assert FAISSIndexer(embedding_dim=16).migrate_to_inner_product('en', data_dir=str(tmp_path))
+
+    index = faiss.downcast_index(faiss.read_index(str(tmp_path / "faiss_index_en.bin")))
+    assert isinstance(index, faiss.IndexHNSWSQ) and index.metric_type == faiss.METRIC_INNER_PRODUCT
+    metadata = json.loads((tmp_path / "faiss_metadata_en.json").read_text(encoding='utf-8'))
+    assert metadata['index_config'] == {'spec': 'HNSW16_SQ8', 'search_params': {'efSearch': 40}}
+    assert len(metadata['rows']) == 300
+
+
+@pytest.mark.parametrize('spec, search_params', [
+    ('SQ8', {}),
+    ('HNSW16_SQ4', {'efSearch': 16}),
+    ('IVF4,PQ4x4', {'nprobe': 1}),
+    ('OPQ4,IVF4,PQ4x4', {'nprobe': 1}),
+])
+def test_infer_index_config_for_compressed_indexes(spec, search_params):
+    vectors = unit_vectors(500)
+    index = faiss.index_factory(16, spec)
+    index.train(vectors)
+
+    assert infer_index_config(index) == {'spec': spec, 'search_params': search_params}
+
+
+def unit_vectors(n, dim=16, seed=0):
+    vectors = np.random.default_rng(seed).standard_normal((n, dim)).astype('float32')
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def measurement(recall, latency, memory):
+    return {'recall_at_k': recall, 'latency_ms': latency, 'memory_mb': memory}
+
+
+def test_pareto_front_drops_dominated_configs_and_keeps_ties():
+    fast = measurement(0.90, 1.0, 10)
+    tie = measurement(0.90, 1.0, 10)
+    accurate = measurement(0.99, 5.0, 20)
+    beaten = measurement(0.85, 2.0, 10)           # хуже fast по recall и задержке
+    beaten_on_memory = measurement(0.90, 1.0, 12) # равен fast, но занимает больше памяти
+
+    assert pareto_front([fast, tie, accurate, beaten, beaten_on_memory]) == [fast, tie, accurate]
+
+
+def test_tune_index_meets_recall_floor():
+    vectors = unit_vectors(2000)
+    indexer = FAISSIndexer(embedding_dim=16)
+
+    config = indexer.tune_index(vectors, normalized=True, k=10, num_queries=50, min_recall=0.9)
+
+    assert config['spec'] in {candidate['spec'] for candidate in indexer.candidate_configs(2000)}
+    assert config['tuning']['recall_at_k'] >= 0.9
+    # Независимая проверка: индекс по выбранной конфигурации дает тот же recall
+    index = indexer.build_index(vectors, normalized=True, index_config=config)
+    queries = vectors[:50]
+    exact = faiss.IndexFlatIP(16)
+    exact.add(vectors)
+    _, ground_truth = exact.search(queries, 10)
+    assert indexer.measure_index(index, queries, ground_truth, 10, config['search_params'])['recall_at_k'] >= 0.9
+
+
+def corpus_with_embeddings(tmp_path):
+    """Синтетический корпус в tmp_path/rag с исходными эмбеддингами, как их оставляет генератор."""
+    data_dir = tmp_path / 'rag'
+    queries = build_synthetic_corpus(str(data_dir), 'en', num_books=2, chapters_per_book=4,
+                                     chunks_per_chapter=10, num_queries=1, embedder=HashBackend(dim=64))
+    flat = faiss.read_index(str(data_dir / 'faiss_index_en.bin'))
+    np.save(data_dir / 'embeddings_en.npy', flat.reconstruct_n(0, flat.ntotal))
+    metadata = json.loads((data_dir / 'faiss_metadata_en.json').read_text(encoding='utf-8'))
+    del metadata['index_config']
+    metadata['normalized'] = True
+    (data_dir / 'embeddings_metadata_en.json').write_text(json.dumps(metadata), encoding='utf-8')
+    return data_dir, queries[0]['query']
+
+
+def test_tuned_config_is_saved_and_applied_on_load(tmp_path, monkeypatch, mocker):
+    data_dir, _ = corpus_with_embeddings(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    mocker.patch.object(FAISSIndexer, 'candidate_configs', return_value=[
+        {'spec': 'HNSW16', 'build_params': {'efConstruction': 40}, 'search_params': [{'efSearch': 48}]}])
+
+    FAISSIndexer(embedding_dim=64).process_language('en', tune=True, force=True, min_recall=0.5)
+
+    metadata = json.loads((data_dir / 'faiss_metadata_en.json').read_text(encoding='utf-8'))
+    config = metadata['index_config']
+    assert (config['spec'], config['build_params'], config['search_params']) == \
+        ('HNSW16', {'efConstruction': 40}, {'efSearch': 48})
+    assert config['tuning']['recall_at_k'] >= 0.5
+
+    # Файл индекса сохранен с другим efSearch: при загрузке его выставляет index_config
+    index = faiss.read_index(str(data_dir / 'faiss_index_en.bin'))
+    faiss.downcast_index(index).hnsw.efSearch = 16
+    faiss.write_index(index, str(data_dir / 'faiss_index_en.bin'))
+    engine = RAGEngine(languages=['en'], base_dir=str(data_dir), reranker=DisabledReranker())
+
+    assert faiss.downcast_index(engine.indices['en']).hnsw.efSearch == 48
+
+
+@pytest.mark.parametrize('scalar_quantizer, index_type', [(None, faiss.IndexHNSWFlat), ('SQ8', faiss.IndexHNSWSQ)])
+def test_hnsw_index_applies_build_and_search_params(scalar_quantizer, index_type):
+    indexer = FAISSIndexer(embedding_dim=16)
+    config = indexer.hnsw_index_config(m=32, ef_construction=80, ef_search=24, scalar_quantizer=scalar_quantizer)
+
+    index = faiss.downcast_index(indexer.build_index(unit_vectors(500), normalized=True, index_config=config))
+
+    assert config['spec'] == 'HNSW32' + (f'_{scalar_quantizer}' if scalar_quantizer else '')
+    assert isinstance(index, index_type)
+    assert index.hnsw.efConstruction == 80
+    assert index.hnsw.efSearch == 24
+
+
+def test_ef_search_is_applied_per_request(tmp_path, mocker):
+    data_dir, query = corpus_with_embeddings(tmp_path)
+    indexer = FAISSIndexer(embedding_dim=64)
+    config = indexer.hnsw_index_config(m=32, ef_construction=80, ef_search=24)
+    vectors = np.load(data_dir / 'embeddings_en.npy')
+    faiss.write_index(indexer.build_index(vectors, normalized=True, index_config=config),
+                      str(data_dir / 'faiss_index_en.bin'))
+    engine = RAGEngine(languages=['en'], base_dir=str(data_dir), reranker=DisabledReranker())
+    index = engine.indices['en']
+    index.search = mocker.Mock(side_effect=index.search)
+
+    assert engine.search(query, language='en', top_k=5, ef_search=200, expand_query=False)['success']
+
+    params = index.search.call_args.kwargs['params']
+    assert isinstance(params, faiss.SearchParametersHNSW) and params.efSearch == 200
+    assert faiss.downcast_index(index).hnsw.efSearch == 24 # общий индекс не изменился
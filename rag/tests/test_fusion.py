@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from rag.fusion import RRF_K, fuse
+from rag.rag_engine import RAGEngine
+
+
+def reference_rrf(rankings, weights):
+    scores = {}
+    for name, ids in rankings.items():
+        for rank, row_id in enumerate(ids):
+            scores[row_id] = scores.get(row_id, 0.0) + weights.get(name, 1.0) / (RRF_K + rank + 1)
+    return scores
+
+
+def test_weighted_rrf_matches_reference():
+    rng = np.random.default_rng(0)
+    rankings = {name: rng.choice(200, size=40, replace=False).tolist() for name in ('vector', 'keyword', 'simple_match')}
+    weights = {'vector': 1.0, 'keyword': 1.5, 'simple_match': 0.5}
+
+    fused = fuse(rankings, weights=weights)
+    expected = reference_rrf(rankings, weights)
+
+    assert len(fused) == len(expected)
+    assert np.allclose(fused.scores, [expected[row_id] for row_id in fused.row_ids.tolist()])
+    assert np.all(np.diff(fused.scores) <= 0)
+    assert fused.ranks['vector'][fused.row_ids.tolist().index(rankings['vector'][0])] == 1
+
+
+def test_pinned_rows_lead_and_limit_keeps_best():
+    rankings = {'vector': [1, 2, 3, 4], 'keyword': [2, 1, 5]}
+
+    fused = fuse(rankings, pinned=[9, 4], limit=4)
+
+    assert fused.row_ids.tolist() == [9, 4, 1, 2] # 1 и 2 равны по RRF: раньше встретилась 1
+    assert fused.pinned.tolist() == [True, True, False, False]
+
+
+def test_combmnz_rewards_agreement():
+    rankings = {'vector': [1, 2], 'keyword': [2, 3]}
+    scores = {'vector': [0.9, 0.8], 'keyword': [7.0, 1.0]}
+
+    fused = fuse(rankings, method='combmnz', scores=scores)
+
+    assert fused.row_ids[0] == 2
+    with pytest.raises(ValueError):
+        fuse(rankings, method='combsum')
+
+
+def test_engine_fusion_marks_ranks_and_pins_exact():
+    vector = [{'index': 1, 'score': 0.9}, {'index': 2, 'score': 0.8}]
+    keyword = [{'index': 2, 'score': 5.0}]
+    exact = [{'index': 7, 'score': 1.0}]
+
+    hybrid = RAGEngine._fuse_results(exact, vector, keyword, [])
+
+    assert [item['data']['index'] for item in hybrid] == [7, 2, 1]
+    assert hybrid[0]['pinned'] and hybrid[0]['data']['pinned']
+    assert hybrid[1]['data']['vector_rank'] == 2 and hybrid[1]['data']['keyword_rank'] == 1
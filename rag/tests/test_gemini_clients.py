@@ -0,0 +1,86 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from rag.embedding_backends import GeminiBackend
+from rag.gemini_clients import GeminiClientPool
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_pool(**kwargs):
+    closed = []
+    pool = GeminiClientPool(factory=lambda key: SimpleNamespace(key=key), close=closed.append, **kwargs)
+    return pool, closed
+
+
+def lease(pool, key):
+    with pool.lease(key) as client:
+        return client
+
+
+def test_pool_reuses_client_per_key_and_evicts_least_recent():
+    pool, closed = make_pool(max_clients=2)
+
+    first = lease(pool, 'key-a')
+    assert lease(pool, 'key-a') is first
+    lease(pool, 'key-b')
+    lease(pool, 'key-a') # key-b теперь давно не использован
+    lease(pool, 'key-c')
+
+    assert [client.key for client in closed] == ['key-b']
+    assert len(pool) == 2 and lease(pool, 'key-a') is first
+    assert pool.snapshot()['created'] == 3
+
+
+def test_pool_closes_idle_clients():
+    clock = FakeClock()
+    pool, closed = make_pool(idle_seconds=60, clock=clock)
+    stale = lease(pool, 'key-a')
+    clock.now = 50
+    lease(pool, 'key-b')
+
+    clock.now = 100 # key-a простаивал 100 секунд, key-b - 50
+    fresh = lease(pool, 'key-a')
+
+    assert closed == [stale] and fresh is not stale
+    assert len(pool) == 2
+
+
+def test_evicted_client_is_closed_after_last_lease():
+    pool, closed = make_pool(max_clients=1)
+
+    with pool.lease('key-a') as busy:
+        lease(pool, 'key-b') # вытесняет key-a, пока он занят
+        assert closed == [] and pool.snapshot()['evicted'] == 1
+
+    assert closed == [busy]
+
+
+def test_concurrent_keys_use_their_own_clients(mocker):
+    pool, _ = make_pool()
+    seen = []
+    lock = threading.Lock()
+
+    def embed_content(model, content, task_type, client):
+        with lock:
+            seen.append((content, client.key))
+        return {'embedding': [0.1] * 8}
+
+    mocker.patch('google.generativeai.embed_content', side_effect=embed_content)
+    configure = mocker.patch('google.generativeai.configure')
+    backend = GeminiBackend(dim=8, clients=pool)
+
+    keys = [f'key-{i % 4}' for i in range(32)]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda key: backend.embed_queries([key], api_key=key), keys))
+
+    assert sorted(seen) == sorted((key, key) for key in keys)
+    assert pool.snapshot()['created'] == 4
+    configure.assert_not_called()
@@ -0,0 +1,84 @@
+import json
+from contextlib import ExitStack
+
+from rag.benchmark import DisabledReranker, build_synthetic_corpus
+from rag.embedding_backends import HashBackend
+from rag.load_shedding import LoadController, degraded_options
+from rag.rag_engine import RAGEngine
+from rag.rag_api_server import app
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_level_follows_queue_depth():
+    controller = LoadController(queue_thresholds=(1, 2))
+
+    with ExitStack() as stack:
+        levels = [stack.enter_context(controller.admit()) for _ in range(4)]
+
+    assert levels == [0, 1, 2, 2]
+    assert controller.in_flight == 0
+
+
+def test_level_follows_p95_and_recovers_step_by_step():
+    clock = FakeClock()
+    controller = LoadController(slo_p95_ms=100, p95_ratios=(1.0, 2.0), min_samples=5,
+                                window_seconds=10, recovery_seconds=3, clock=clock)
+    for _ in range(5):
+        controller.record(250)
+    with controller.admit() as level:
+        assert level == 2
+
+    clock.now = 11 # медленные запросы вышли из окна
+    with controller.admit() as level:
+        assert level == 1 # не больше одной ступени за recovery_seconds
+    clock.now = 15
+    with controller.admit() as level:
+        assert level == 0
+
+
+def test_slow_batch_does_not_degrade_single_searches():
+    controller = LoadController(slo_p95_ms=150, min_samples=1)
+    controller.record(2000, queries=20) # пакет из 20 запросов: 100 мс на запрос
+
+    with controller.admit() as level:
+        assert level == 0
+
+    controller.record(2000) # одиночный запрос с той же задержкой - уже деградация
+    with controller.admit() as level:
+        assert level == len(controller.p95_ratios)
+
+
+def test_degraded_options_escalate():
+    assert degraded_options(0) == {}
+    assert degraded_options(1) == {'expand_query': False}
+    assert degraded_options(4)['lexical_only'] is True and degraded_options(4)['use_reranking'] is False
+
+
+def test_lexical_only_search_skips_embeddings(tmp_path, mocker):
+    queries = build_synthetic_corpus(str(tmp_path), 'en', num_books=2, chapters_per_book=4,
+                                     chunks_per_chapter=10, num_queries=1, embedder=HashBackend(dim=64))
+    engine = RAGEngine(languages=['en'], base_dir=str(tmp_path), reranker=DisabledReranker())
+    embed = mocker.spy(engine.embedding_backends['en'], 'embed_queries')
+
+    result = engine.search(queries[0]['query'], language='en', top_k=5, **degraded_options(4))
+
+    assert result['count'] > 0 and embed.call_count == 0
+    assert result['plan']['stages'] == ['keyword', 'simple_match']
+
+
+def test_search_endpoint_reports_degradation(mocker, mock_rag_engine):
+    mocker.patch('rag.rag_api_server.rag_engine_instance', mock_rag_engine)
+    mocker.patch('rag.rag_api_server.load_controller', LoadController(queue_thresholds=(0, 0, 0)))
+    mock_rag_engine.search = mocker.MagicMock(return_value={'success': True, 'results': [], 'count': 0})
+
+    response = app.test_client().post('/api/search', json={'query': 'karma'})
+
+    assert json.loads(response.data)['degradation'] == {'level': 3, 'mode': 'no_rerank'}
+    assert mock_rag_engine.search.call_args.kwargs['use_reranking'] is False
@@ -0,0 +1,42 @@
+from unittest.mock import MagicMock
+
+from rag.metrics import MetricsRegistry, StageTimer
+from rag.rag_api_server import app
+
+
+def test_histogram_renders_cumulative_prometheus_buckets():
+    registry = MetricsRegistry()
+    histogram = registry.histogram('stage_seconds', 'Stage latency', labelnames=('stage',), buckets=(0.01, 0.1))
+    for value in (0.005, 0.05, 0.05, 3.0):
+        histogram.observe(value, stage='vector')
+
+    text = registry.render()
+
+    assert '# TYPE stage_seconds histogram' in text
+    assert 'stage_seconds_bucket{stage="vector",le="0.01"} 1' in text
+    assert 'stage_seconds_bucket{stage="vector",le="0.1"} 3' in text
+    assert 'stage_seconds_bucket{stage="vector",le="+Inf"} 4' in text
+    assert 'stage_seconds_count{stage="vector"} 4' in text
+
+
+def test_stage_timer_records_laps_and_total():
+    histogram = MetricsRegistry().histogram('t', 't', labelnames=('stage', 'language'))
+    timer = StageTimer('ru', histogram=histogram)
+    timer.lap('embedding')
+    timer.lap('vector')
+    timings = timer.finish()
+
+    assert set(timings) == {'embedding', 'vector', 'total'}
+    assert timings['total'] >= timings['embedding'] + timings['vector'] - 0.01
+    assert histogram.count(stage='total', language='ru') == 1
+
+
+def test_metrics_endpoint_serves_search_histograms(mock_rag_engine):
+    mock_rag_engine._get_embedding = MagicMock(side_effect=Exception("API Error"))
+    mock_rag_engine.search("test query", language="ru")
+
+    response = app.test_client().get('/api/metrics')
+
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    assert 'rag_search_stage_seconds_bucket{stage="total",language="ru"' in response.get_data(as_text=True)
@@ -0,0 +1,33 @@
+import numpy as np
+
+from rag.mmr import mmr_select
+
+
+def unit(*rows):
+    vectors = np.array(rows, dtype='float32')
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_near_identical_neighbours_are_not_both_selected():
+    # 0 и 1 - соседние перекрывающиеся чанки, 2 - другой текст чуть ниже по релевантности
+    vectors = unit([1.0, 0.0, 0.0], [0.99, 0.1, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0])
+    assert mmr_select([0.9, 0.85, 0.8, 0.5], vectors, 2, redundancy_threshold=None) == [0, 2]
+
+
+def test_pinned_candidates_come_first():
+    vectors = unit([1.0, 0.0], [0.0, 1.0], [0.7, 0.7])
+    order = mmr_select([100.0, 0.03, 0.02], vectors, 3, pinned=1)
+    assert order[0] == 0
+    assert sorted(order) == [0, 1, 2]
+
+
+def test_redundant_candidates_yield_to_distinct_ones_and_backfill():
+    vectors = unit([1.0, 0.0], [1.0, 0.001], [1.0, 0.002], [0.0, 1.0])
+    assert mmr_select([0.3, 0.2, 0.15, 0.1], vectors, 2) == [0, 3]
+    # Разнообразных меньше k: почти-повторы добавляются по релевантности, а не теряются
+    assert mmr_select([0.3, 0.2, 0.15, 0.1], vectors, 4) == [0, 3, 1, 2]
+
+
+def test_lambda_one_keeps_relevance_order():
+    vectors = unit([1.0, 0.0], [0.9, 0.2], [0.0, 1.0])
+    assert mmr_select([0.9, 0.8, 0.1], vectors, 3, lambda_mult=1.0, redundancy_threshold=None) == [0, 1, 2]
@@ -0,0 +1,58 @@
+import pytest
+
+from rag.benchmark import DisabledReranker, build_synthetic_corpus, relevance_scores
+from rag.embedding_backends import HashBackend
+from rag.query_planner import classify_query
+from rag.rag_engine import RAGEngine
+
+
+@pytest.mark.parametrize('query, expected', [
+    ('Камса', 'term'),
+    ('Шрила Прабхупада', 'term'),
+    ('преданное служение', 'phrase'),
+    ('Что такое душа?', 'question'),
+    ('why does the soul transmigrate', 'question'),
+    ('one who is not disturbed by happiness and distress', 'passage'),
+])
+def test_classify_query(query, expected):
+    assert classify_query(query) == expected
+
+
+@pytest.fixture
+def engine(tmp_path):
+    queries = build_synthetic_corpus(str(tmp_path), 'en', num_books=2, chapters_per_book=4,
+                                     chunks_per_chapter=10, num_queries=2, embedder=HashBackend(dim=64))
+    engine = RAGEngine(languages=['en'], base_dir=str(tmp_path), reranker=DisabledReranker())
+    return engine, queries[0]
+
+
+def test_term_query_skips_embedding(engine, mocker):
+    engine, labelled = engine
+    embed = mocker.spy(engine.embedding_backends['en'], 'embed_queries')
+    term = max(labelled['query'].split(), key=len)
+
+    result = engine.search(term, language='en', top_k=5, return_timings=True)
+
+    assert result['plan']['query_class'] == 'term' and 'vector' not in result['plan']['stages']
+    assert result['count'] > 0 and embed.call_count == 0
+    assert 'embedding' not in result['timings']
+
+
+def test_term_without_lexical_hits_falls_back_to_vector(engine, mocker):
+    engine, _ = engine
+    embed = mocker.spy(engine.embedding_backends['en'], 'embed_queries')
+
+    result = engine.search('Zzyzxquux', language='en', top_k=5)
+
+    assert result['plan']['fallback'] == 'vector' and embed.call_count == 1
+
+
+def test_passage_plan_keeps_relevance_of_full_search(engine):
+    engine, labelled = engine
+
+    planned = engine.search(labelled['query'], language='en', top_k=5)
+    full = engine.search(labelled['query'], language='en', top_k=5, use_planner=False)
+
+    assert planned['plan']['query_class'] == 'passage' and full['plan']['query_class'] == 'full'
+    assert relevance_scores(planned['results'], labelled['relevant']) == \
+        relevance_scores(full['results'], labelled['relevant']) == (1.0, 1.0)
@@ -0,0 +1,62 @@
+import gzip
+import json
+
+from nltk.stem import SnowballStemmer
+
+from rag.rag_api_server import app
+from rag.response_format import choose_encoding, find_highlights, make_snippet, parse_fields, project_result
+
+TEXT = ("Кришна говорит Арджуне о долге. " * 10 +
+        "Знание о душе освобождает: душа вечна, и знающий душу не скорбит. " +
+        "Далее следует описание битвы. " * 10)
+
+
+def test_highlights_match_stems_and_phrase():
+    highlights = find_highlights(TEXT, 'вечная душа', SnowballStemmer('russian'))
+
+    words = [TEXT[start:end].lower() for start, end in highlights]
+    assert words == ['душе', 'душа', 'вечна', 'душу']
+    assert find_highlights('Soul is eternal. The eternal soul.', 'eternal soul') == [(0, 4), (8, 15), (21, 33)]
+
+
+def test_snippet_window_covers_matches():
+    highlights = find_highlights(TEXT, 'душа', SnowballStemmer('russian'))
+    snippet, offset, inside = make_snippet(TEXT, highlights, 120)
+
+    assert len(snippet) <= 120 and TEXT[offset:offset + len(snippet)] == snippet
+    assert len(inside) == len(highlights) == 3
+    assert all(snippet[start:end].lower().startswith('душ') for start, end in inside)
+
+
+def test_projection_keeps_only_requested_fields():
+    result = {'index': 4, 'book': 'bg', 'text': TEXT, 'distance': 0.3, 'vector_rank': 2}
+
+    compact = project_result(result, 'душа', SnowballStemmer('russian'), parse_fields('compact'), 100)
+
+    assert set(compact) == {'index', 'book', 'snippet', 'highlights'}
+    assert project_result(result, 'душа', fields=parse_fields('book, index')) == {'book': 'bg', 'index': 4}
+
+
+def test_search_endpoint_projects_and_compresses(mocker, mock_rag_engine):
+    mocker.patch('rag.rag_api_server.rag_engine_instance', mock_rag_engine)
+    mock_rag_engine.search = mocker.MagicMock(return_value={
+        'success': True, 'results': [{'index': i, 'book': 'bg', 'text': TEXT} for i in range(20)], 'count': 20
+    })
+    client = app.test_client()
+
+    full = client.post('/api/search', json={'query': 'душа'}, headers={'Accept-Encoding': 'gzip'})
+    compact = client.post('/api/search', json={'query': 'душа', 'fields': 'compact', 'snippet_length': 200},
+                          headers={'Accept-Encoding': 'gzip'})
+
+    assert full.headers['Content-Encoding'] == 'gzip'
+    assert json.loads(gzip.decompress(full.data))['results'][0]['text'] == TEXT
+    results = json.loads(gzip.decompress(compact.data))['results']
+    assert 'text' not in results[0] and len(results[0]['snippet']) <= 200
+    assert len(compact.data) < len(full.data)
+
+
+def test_choose_encoding_respects_refused_encodings():
+    assert choose_encoding('gzip, br;q=0') == 'gzip'
+    assert choose_encoding('br;q=0, gzip;q=0') is None
+    assert choose_encoding('*;q=0.5, br;q=0') == 'gzip'
+    assert choose_encoding('identity') is None
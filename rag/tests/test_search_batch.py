@@ -0,0 +1,120 @@
+import json
+import time
+
+import numpy as np
+import pytest
+
+from rag.benchmark import DisabledReranker, build_synthetic_corpus
+from rag.embedding_backends import HashBackend
+from rag.load_shedding import LoadController
+from rag.rag_engine import RAGEngine
+from rag.rag_api_server import app
+
+
+class CountingReranker:
+    """Cross-encoder stand-in: shared word count, one call per scoring pass."""
+    model = object()
+
+    def __init__(self):
+        self.calls = []
+
+    def score_pairs(self, pairs):
+        self.calls.append(len(pairs))
+        return np.array([len(set(q.split()) & set(d.split())) for q, d in pairs], dtype='float32')
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    queries = build_synthetic_corpus(str(tmp_path), 'en', num_books=2, chapters_per_book=4,
+                                     chunks_per_chapter=10, num_queries=4, embedder=HashBackend(dim=64))
+    return str(tmp_path), [item['query'] for item in queries]
+
+
+def test_batch_matches_single_searches(corpus):
+    base_dir, queries = corpus
+    engine = RAGEngine(languages=['en'], base_dir=base_dir, reranker=DisabledReranker())
+
+    batch = engine.search_batch(queries, language='en', top_k=5)
+
+    assert batch['success'] is True and batch['count'] == len(queries)
+    for query, response in zip(queries, batch['results']):
+        single = engine.search(query, language='en', top_k=5)
+        assert [r['index'] for r in response['results']] == [r['index'] for r in single['results']]
+
+
+def test_batch_embeds_and_reranks_in_one_pass(corpus, mocker):
+    base_dir, queries = corpus
+    reranker = CountingReranker()
+    engine = RAGEngine(languages=['en'], base_dir=base_dir, reranker=reranker)
+    embed = mocker.spy(engine.embedding_backends['en'], 'embed_queries')
+
+    batch = engine.search_batch(queries, language='en', top_k=5, adaptive_rerank=False)
+
+    assert embed.call_count == 1
+    assert reranker.calls == [sum(r['reranked_count'] for r in batch['results'])]
+    for response in batch['results']:
+        scores = [r['final_score'] for r in response['results']]
+        assert scores == sorted(scores, reverse=True)
+
+
+def test_batch_endpoint_keeps_query_order_across_languages(mocker, mock_rag_engine):
+    mocker.patch('rag.rag_api_server.rag_engine_instance', mock_rag_engine)
+    mock_rag_engine.search_batch = mocker.MagicMock(side_effect=lambda queries, language, **kwargs: {
+        'success': True, 'results': [{'query': q, 'language': language} for q in queries]
+    })
+
+    response = app.test_client().post('/api/search/batch', json={
+        'queries': ['карма', {'query': 'karma', 'language': 'en'}, 'дхарма'], 'language': 'ru'
+    })
+
+    data = json.loads(response.data)
+    assert response.status_code == 200
+    assert [(r['query'], r['language']) for r in data['results']] == [('карма', 'ru'), ('karma', 'en'), ('дхарма', 'ru')]
+    assert mock_rag_engine.search_batch.call_count == 2
+
+
+def test_batch_endpoint_rejects_oversized_batches(mocker, mock_rag_engine):
+    mocker.patch('rag.rag_api_server.rag_engine_instance', mock_rag_engine)
+    response = app.test_client().post('/api/search/batch', json={'queries': ['q'] * 100})
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('item', [42, None, ['karma'], {'query': 7}, {'query': 'karma', 'language': 1}])
+def test_batch_endpoint_rejects_malformed_items(mocker, mock_rag_engine, item):
+    mocker.patch('rag.rag_api_server.rag_engine_instance', mock_rag_engine)
+    response = app.test_client().post('/api/search/batch', json={'queries': ['карма', item]})
+    assert response.status_code == 400
+    assert 'position 1' in json.loads(response.data)['error']
+
+
+def test_batch_endpoint_parses_string_flags(mocker, mock_rag_engine):
+    mocker.patch('rag.rag_api_server.rag_engine_instance', mock_rag_engine)
+    mock_rag_engine.search_batch = mocker.MagicMock(return_value={'success': True, 'results': [{'success': False}]})
+    client = app.test_client()
+
+    client.post('/api/search/batch', json={'queries': ['карма'], 'diversify': 'false', 'timings': 'true'})
+    kwargs = mock_rag_engine.search_batch.call_args.kwargs
+    assert kwargs['diversify'] is False and kwargs['return_timings'] is True
+
+    response = client.post('/api/search/batch', json={'queries': ['карма'], 'planner': 'maybe'})
+    assert response.status_code == 400
+
+
+def test_full_batch_does_not_push_load_controller_into_degradation(mocker, mock_rag_engine):
+    mocker.patch('rag.rag_api_server.rag_engine_instance', mock_rag_engine)
+    controller = LoadController(slo_p95_ms=100, min_samples=1)
+    mocker.patch('rag.rag_api_server.load_controller', controller)
+
+    def slow_batch(queries, language, **kwargs):
+        time.sleep(0.3) # весь пакет дольше SLO, но на один запрос - 15 мс
+        return {'success': True, 'results': [{'success': True, 'results': []} for _ in queries]}
+
+    mock_rag_engine.search_batch = mocker.MagicMock(side_effect=slow_batch)
+    client = app.test_client()
+
+    response = client.post('/api/search/batch', json={'queries': [f'query {i}' for i in range(20)]})
+
+    assert response.status_code == 200
+    assert controller.p95_ms() < controller.slo_p95_ms
+    with controller.admit() as level:
+        assert level == 0
@@ -58,3 +58,72 @@ def test_search_endpoint_success(client, mocker, mock_rag_engine):
     assert data['success'] is True
     assert len(data['results']) == 1
     assert data['results'][0]['text'] == 'Test Result'
+
+def test_reload_swaps_engine_and_drains_old_one(mocker):
+    """In-flight requests keep the old engine; it is closed only after they finish."""
+    import rag.rag_api_server as server
+
+    old_engine, new_engine = mocker.MagicMock(), mocker.MagicMock()
+    mocker.patch.object(server, 'rag_engine_instance', old_engine)
+    mocker.patch.object(server, 'RAGEngine', return_value=new_engine)
+    retire_threads = []
+    mocker.patch.object(server.threading, 'Thread',
+                        side_effect=lambda target, args=(), daemon=None: retire_threads.append((target, args)) or mocker.MagicMock())
+
+    with server.engine_lease() as engine:
+        assert server.reload_engine() is True
+        assert engine is old_engine
+        assert server.rag_engine_instance is new_engine
+        target, args = retire_threads[0]
+        target(*args, timeout=0.1)  # still leased: must not be released yet
+        old_engine.close.assert_not_called()
+
+    target(*args, timeout=0.1)
+    old_engine.close.assert_called_once()
+    # The reranker model is handed over instead of being loaded again
+    server.RAGEngine.assert_called_once_with(base_dir=server.DATA_DIR, reranker=old_engine.reranker,
+                                             on_progress=server.report_engine_progress)
+
+def test_full_download_releases_engine_files_before_replacing(mocker, range_http_server, tmp_path):
+    import io
+    import zipfile
+    import rag.rag_api_server as server
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('shukabase_data_en/faiss_index_en.bin', b'index')
+        archive.writestr('shukabase_data_en/embeddings_en.npy', b'new')
+    handler, url = range_http_server
+    handler.payload = buffer.getvalue()
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    (data_dir / 'embeddings_en.npy').write_bytes(b'old')
+    (data_dir / 'data_manifest.json').write_text('{"version": 1, "files": []}')
+
+    released = []
+    engine = mocker.MagicMock()
+    engine.release_files.side_effect = lambda: released.append((data_dir / 'embeddings_en.npy').read_bytes())
+    mocker.patch.object(server, 'rag_engine_instance', engine)
+    mocker.patch.object(server, 'fetch_expected_sha256', return_value=None)
+
+    server.download_and_extract_archive(url, str(data_dir / "data.zip"), str(data_dir))
+
+    assert released == [b'old']
+    assert (data_dir / 'embeddings_en.npy').read_bytes() == b'new'
+    # Stale hashes would let later delta updates skip changed files
+    assert not (data_dir / 'data_manifest.json').exists()
+
+def test_download_with_installed_data_updates_requested_languages(mocker):
+    import rag.rag_api_server as server
+
+    mocker.patch.object(server, 'has_installed_data', return_value=True)
+    mocker.patch.object(server, 'rag_engine_instance', mocker.MagicMock())
+    apply_update = mocker.patch.object(server, 'apply_data_update', return_value=1)
+    full_download = mocker.patch.object(server, 'download_and_extract_archive')
+
+    server.background_download_task('en')
+
+    apply_update.assert_called_once_with(min_version=server.DATA_VERSION, languages={'en'})
+    full_download.assert_not_called()
+    assert server.setup_state['status'] == 'completed'
+    server.setup_state.update(server.initial_setup_state())
@@ -0,0 +1,63 @@
+import json
+
+import pytest
+
+from rag.benchmark import DisabledReranker, build_synthetic_corpus
+from rag.embedding_backends import HashBackend
+from rag.rag_engine import RAGEngine
+from rag.rag_api_server import app
+from rag.session_memory import SessionMemory
+
+
+def test_memory_evicts_expired_and_least_recent_sessions(mocker):
+    clock = mocker.patch('rag.session_memory.time.monotonic', return_value=0.0)
+    memory = SessionMemory(max_sessions=2, ttl_seconds=10, max_rows_per_language=3)
+
+    memory.remember('a', 'ru', [1, 2, 3, 4])
+    memory.remember('b', 'ru', [5])
+    assert memory.seen('a', 'ru') == {2, 3, 4} # старые строки вытеснены
+    assert memory.seen('a', 'en') == frozenset()
+
+    memory.remember('c', 'ru', [6]) # 'b' - давно не использовалась
+    assert memory.seen('b', 'ru') == frozenset() and len(memory) == 2
+
+    clock.return_value = 11.0
+    assert memory.seen('a', 'ru') == frozenset() and len(memory) == 0
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    queries = build_synthetic_corpus(str(tmp_path), 'en', num_books=2, chapters_per_book=4,
+                                     chunks_per_chapter=10, num_queries=2, embedder=HashBackend(dim=64))
+    return str(tmp_path), queries[0]['query']
+
+
+def test_search_backfills_instead_of_repeating(corpus):
+    base_dir, query = corpus
+    engine = RAGEngine(languages=['en'], base_dir=base_dir, reranker=DisabledReranker())
+
+    first = engine.search(query, language='en', top_k=5)
+    sent = {r['index'] for r in first['results']}
+    second = engine.search(query, language='en', top_k=5, exclude_ids=sent, include_references=True)
+
+    assert second['count'] == 5
+    assert not sent & {r['index'] for r in second['results']}
+    assert {ref['index'] for ref in second['already_sent']} <= sent
+    assert second['excluded_count'] == len(second['already_sent']) > 0
+
+
+def test_endpoint_remembers_session_results(mocker, mock_rag_engine):
+    mocker.patch('rag.rag_api_server.rag_engine_instance', mock_rag_engine)
+    mocker.patch('rag.rag_api_server.session_memory', SessionMemory())
+    mock_rag_engine.search = mocker.MagicMock(return_value={
+        'success': True, 'results': [{'index': 3}, {'index': 7}], 'count': 2
+    })
+    client = app.test_client()
+
+    client.post('/api/search', json={'query': 'karma', 'language': 'en', 'session_id': 's1'})
+    client.post('/api/search', json={'query': 'karma', 'language': 'en', 'session_id': 's1'})
+
+    assert mock_rag_engine.search.call_args_list[0].kwargs['exclude_ids'] == frozenset()
+    assert mock_rag_engine.search.call_args_list[1].kwargs['exclude_ids'] == {3, 7}
+    response = client.delete('/api/search/session/s1')
+    assert json.loads(response.data)['success'] is True
@@ -0,0 +1,96 @@
+import io
+import os
+import zipfile
+
+import pytest
+
+from rag.data_downloader import RangeDownloader
+from rag.zip_extractor import StreamingZipExtractor, download_and_extract, staging_dir_for
+
+
+def make_archive(members, compression=zipfile.ZIP_DEFLATED):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', compression) as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def test_extracts_nested_root_flattened_and_skips_unsafe_paths(tmp_path):
+    archive_path = tmp_path / "data.zip"
+    archive_path.write_bytes(make_archive({
+        'shukabase_data_en/faiss_index_en.bin': b'index',
+        'shukabase_data_en/books/en/bg/1.html': b'<html/>',
+        '../evil.txt': b'nope',
+    }))
+    target = tmp_path / "rag_data"
+
+    StreamingZipExtractor(str(archive_path), str(target)).extract()
+
+    assert (target / 'faiss_index_en.bin').read_bytes() == b'index'
+    assert (target / 'books' / 'en' / 'bg' / '1.html').read_bytes() == b'<html/>'
+    assert not (tmp_path / 'evil.txt').exists()
+    assert not (target / 'shukabase_data_en').exists()
+
+
+def test_corrupted_member_fails_crc_check(tmp_path):
+    data = make_archive({'faiss_index_ru.bin': b'A' * 1000}, compression=zipfile.ZIP_STORED)
+    position = data.index(b'A' * 1000)
+    corrupted = data[:position] + b'B' + data[position + 1:]
+    archive_path = tmp_path / "data.zip"
+    archive_path.write_bytes(corrupted)
+
+    with pytest.raises(zipfile.BadZipFile):
+        StreamingZipExtractor(str(archive_path), str(tmp_path / "rag_data")).extract()
+
+
+def test_extracts_while_downloading(range_http_server, tmp_path):
+    handler, url = range_http_server
+    members = {f'shukabase_data_ru/books/ru/{i}.bin': os.urandom(200 * 1024) for i in range(15)}
+    members['shukabase_data_ru/faiss_index_ru.bin'] = b'index'
+    handler.payload = make_archive(members, compression=zipfile.ZIP_STORED)
+    destination = str(tmp_path / "data.zip")
+    target = tmp_path / "rag_data"
+
+    downloader = RangeDownloader(url, destination, num_segments=3, min_segment_size=256 * 1024, chunk_size=16384)
+    written = download_and_extract(downloader, str(target))
+
+    assert len(written) == len(members)
+    assert (target / 'faiss_index_ru.bin').read_bytes() == b'index'
+    assert (target / 'books' / 'ru' / '7.bin').read_bytes() == members['shukabase_data_ru/books/ru/7.bin']
+    # The verified archive is removed once the files are in place: no second copy on disk
+    assert not os.path.exists(destination) and not os.path.exists(destination + '.part')
+
+
+def test_checksum_mismatch_leaves_existing_data_untouched(range_http_server, tmp_path):
+    handler, url = range_http_server
+    handler.payload = make_archive({'faiss_index_ru.bin': b'tampered'})
+    target = tmp_path / "rag_data"
+    target.mkdir()
+    (target / 'faiss_index_ru.bin').write_bytes(b'good')
+
+    downloader = RangeDownloader(url, str(tmp_path / "data.zip"), expected_sha256='0' * 64)
+    with pytest.raises(Exception, match='Checksum mismatch'):
+        download_and_extract(downloader, str(target))
+
+    assert (target / 'faiss_index_ru.bin').read_bytes() == b'good'
+    assert not os.path.exists(staging_dir_for(str(target)))
+
+
+def test_files_move_into_place_after_before_commit(range_http_server, tmp_path):
+    handler, url = range_http_server
+    handler.payload = make_archive({'shukabase_data_ru/faiss_index_ru.bin': b'new'})
+    target = tmp_path / "rag_data"
+    target.mkdir()
+    (target / 'faiss_index_ru.bin').write_bytes(b'old')
+    seen_at_commit = []
+
+    archive = tmp_path / "data.zip"
+    downloader = RangeDownloader(url, str(archive))
+    download_and_extract(downloader, str(target),
+                         before_commit=lambda: seen_at_commit.append(((target / 'faiss_index_ru.bin').read_bytes(),
+                                                                      archive.exists())))
+
+    assert seen_at_commit == [(b'old', True)]
+    assert not archive.exists()
+    assert (target / 'faiss_index_ru.bin').read_bytes() == b'new'
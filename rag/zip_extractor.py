@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+📦 ПОТОКОВАЯ РАСПАКОВКА АРХИВА ДАННЫХ
+
+Вместо extractall() + поиска вложенной папки + перемещения файлов:
+- оглавление zip (central directory) читается с конца архива, поэтому
+  корневая папка данных (та, где лежит faiss_index_*) известна заранее;
+- каждый файл пишется сразу по "сплющенному" пути внутри папки распаковки
+  (через временный файл и os.replace), CRC проверяется zipfile при чтении;
+- если архив еще скачивается (RangeDownloader), каждый файл распаковывается,
+  как только докачаны его байты, так что распаковка идет параллельно
+  со скачиванием;
+- download_and_extract распаковывает в соседнюю папку <target_dir>.staging и переносит
+  файлы на место только после проверки SHA-256 всего архива: битая или подмененная
+  загрузка не затирает рабочие данные. После переноса архив удаляется.
+
+Цена проверки до замены - место на диске: пока идет распаковка, рядом лежат архив,
+распакованные файлы в staging и старые данные. Пик - архив + распакованные данные
+(+ старые данные при обновлении), после переноса на диске остаются только новые файлы.
+"""
+
+import logging
+import os
+import shutil
+import struct
+import threading
+import zipfile
+from typing import Callable, List, Optional, Tuple
+
+try:
+    from rag.data_downloader import RangeDownloader
+except ImportError:
+    from data_downloader import RangeDownloader
+
+logger = logging.getLogger(__name__)
+
+EOCD_SIGNATURE = b'PK\x05\x06'
+EOCD_SIZE = 22
+ZIP64_LOCATOR_SIGNATURE = b'PK\x06\x07'
+ZIP64_LOCATOR_SIZE = 20
+ZIP64_EOCD_SIZE = 56
+# EOCD + максимальный комментарий архива
+MAX_EOCD_SEARCH = EOCD_SIZE + 0xFFFF
+
+# wait_for_range(start, end) -> bool: ждет, пока байты [start, end) будут на диске
+RangeWaiter = Callable[[int, int], bool]
+# progress_callback(extracted_files, total_files)
+ExtractProgress = Callable[[int, int], None]
+
+STAGING_SUFFIX = '.staging'
+
+
+class StreamingZipExtractor:
+    """
+    Распаковывает zip по мере готовности его байтов.
+
+    Без wait_for_range архив считается полностью скачанным (обычная распаковка
+    с тем же сплющиванием путей).
+    """
+
+    def __init__(self, archive_path: str, target_dir: str, wait_for_range: Optional[RangeWaiter] = None,
+                 progress_callback: Optional[ExtractProgress] = None, marker_prefix: str = 'faiss_index_'):
+        self.archive_path = archive_path
+        self.target_dir = target_dir
+        self.wait_for_range = wait_for_range or (lambda start, end: True)
+        self.progress_callback = progress_callback
+        self.marker_prefix = marker_prefix
+
+    def _read(self, start: int, end: int) -> bytes:
+        if not self.wait_for_range(start, end):
+            raise zipfile.BadZipFile(f"Archive bytes {start}-{end} never arrived (download aborted)")
+        with open(self.archive_path, 'rb') as f:
+            f.seek(start)
+            return f.read(end - start)
+
+    def _central_directory_offset(self, archive_size: int) -> int:
+        """Находит начало central directory по EOCD (и ZIP64 EOCD) в хвосте архива."""
+        tail_start = max(0, archive_size - MAX_EOCD_SEARCH)
+        tail = self._read(tail_start, archive_size)
+        position = tail.rfind(EOCD_SIGNATURE)
+        if position < 0 or len(tail) - position < EOCD_SIZE:
+            raise zipfile.BadZipFile("File is not a zip file (end of central directory not found)")
+        cd_offset = struct.unpack('<L', tail[position + 16:position + 20])[0]
+
+        locator_position = position - ZIP64_LOCATOR_SIZE
+        if locator_position >= 0 and tail[locator_position:locator_position + 4] == ZIP64_LOCATOR_SIGNATURE:
+            zip64_eocd_offset = struct.unpack('<Q', tail[locator_position + 8:locator_position + 16])[0]
+            record = self._read(zip64_eocd_offset, zip64_eocd_offset + ZIP64_EOCD_SIZE)
+            cd_offset = struct.unpack('<Q', record[48:56])[0]
+        return cd_offset
+
+    def _flatten_root(self, names: List[str]) -> str:
+        """Папка внутри архива, содержащая индекс: ее содержимое ляжет прямо в target_dir."""
+        for name in names:
+            if os.path.basename(name).startswith(self.marker_prefix):
+                root = name.rsplit('/', 1)[0] + '/' if '/' in name else ''
+                if root:
+                    logger.info(f"Found data in nested folder: {root}. Extracting into {self.target_dir}...")
+                return root
+        return ''
+
+    def _target_path(self, name: str, root: str) -> Optional[str]:
+        if root and name.startswith(root):
+            name = name[len(root):]
+        parts = [part for part in name.replace('\\', '/').split('/') if part not in ('', '.')]
+        if not parts or '..' in parts or os.path.isabs(name) or ':' in parts[0]:
+            return None
+        return os.path.join(self.target_dir, *parts)
+
+    def _extract_member(self, archive: zipfile.ZipFile, info: zipfile.ZipInfo, target: str):
+        if info.is_dir():
+            os.makedirs(target, exist_ok=True)
+            return
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp_path = target + '.tmp'
+        # ZipExtFile проверяет CRC-32 при дочитывании и бросает BadZipFile при несовпадении
+        with archive.open(info) as source, open(tmp_path, 'wb') as destination:
+            shutil.copyfileobj(source, destination, 1024 * 1024)
+        os.replace(tmp_path, target)
+
+    def extract(self, archive_size: Optional[int] = None) -> List[str]:
+        """Распаковывает архив и возвращает список записанных файлов."""
+        if archive_size is None:
+            archive_size = os.path.getsize(self.archive_path)
+
+        cd_offset = self._central_directory_offset(archive_size)
+        # Остаток архива (оглавление) нужен zipfile целиком
+        if not self.wait_for_range(cd_offset, archive_size):
+            raise zipfile.BadZipFile("Central directory never arrived (download aborted)")
+
+        os.makedirs(self.target_dir, exist_ok=True)
+        written = []
+        with zipfile.ZipFile(self.archive_path, 'r') as archive:
+            members = sorted(archive.infolist(), key=lambda info: info.header_offset)
+            root = self._flatten_root([info.filename for info in members])
+            bounds: List[Tuple[int, int]] = [
+                (info.header_offset, members[i + 1].header_offset if i + 1 < len(members) else cd_offset)
+                for i, info in enumerate(members)
+            ]
+
+            for i, (info, (start, end)) in enumerate(zip(members, bounds)):
+                target = self._target_path(info.filename, root)
+                if target is None:
+                    logger.warning(f"⚠️ Skipping unsafe archive member: {info.filename}")
+                    continue
+                if not self.wait_for_range(start, end):
+                    raise zipfile.BadZipFile(f"Archive member {info.filename} never arrived (download aborted)")
+                self._extract_member(archive, info, target)
+                if not info.is_dir():
+                    written.append(target)
+                if self.progress_callback:
+                    self.progress_callback(i + 1, len(members))
+
+        logger.info(f"✅ Extracted {len(written)} files into {self.target_dir}")
+        return written
+
+
+def staging_dir_for(target_dir: str) -> str:
+    """Папка для распаковки до проверки архива - рядом с target_dir (os.replace в пределах диска)."""
+    return os.path.normpath(target_dir) + STAGING_SUFFIX
+
+
+def commit_staged(staging_dir: str, target_dir: str) -> List[str]:
+    """Переносит файлы из staging_dir в target_dir (os.replace) и удаляет staging_dir."""
+    written = []
+    for root, _, files in os.walk(staging_dir):
+        for name in files:
+            source = os.path.join(root, name)
+            target = os.path.join(target_dir, os.path.relpath(source, staging_dir))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(source, target)
+            written.append(target)
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    return written
+
+
+def download_and_extract(downloader: RangeDownloader, target_dir: str,
+                         progress_callback: Optional[ExtractProgress] = None,
+                         before_commit: Optional[Callable[[], None]] = None) -> List[str]:
+    """
+    Качает архив и распаковывает его одновременно.
+
+    Скачивание идет в фоновом потоке, распаковка - в текущем (в staging-папку), по мере
+    готовности байтов каждого файла. После распаковки проверяется SHA-256 всего архива,
+    .part переименовывается в downloader.destination, вызывается before_commit
+    (например, движок отпускает открытые файлы данных) и только затем файлы
+    переносятся в target_dir, а архив удаляется. При любой ошибке target_dir не меняется.
+    """
+    staging_dir = staging_dir_for(target_dir)
+    # Остатки прерванной распаковки: архив все равно распаковывается целиком заново
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    try:
+        _download_and_extract_to(downloader, staging_dir, progress_callback)
+        if before_commit is not None:
+            before_commit()
+    except BaseException:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+    written = commit_staged(staging_dir, target_dir)
+    # Данные на месте - вторая (сжатая) копия на диске больше не нужна
+    if os.path.exists(downloader.destination):
+        os.remove(downloader.destination)
+    logger.info(f"✅ Moved {len(written)} verified files into {target_dir}")
+    return written
+
+
+def _download_and_extract_to(downloader: RangeDownloader, target_dir: str,
+                             progress_callback: Optional[ExtractProgress] = None) -> List[str]:
+    errors: List[BaseException] = []
+
+    def run_download():
+        try:
+            downloader.download(finalize=False)
+        except BaseException as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=run_download, daemon=True)
+    thread.start()
+
+    try:
+        downloader.wait_until_ready()
+        if errors:
+            raise errors[0]
+        if downloader.total_size == 0:
+            # Размер заранее неизвестен: оглавление будет доступно только в конце
+            thread.join()
+            if errors:
+                raise errors[0]
+            wait_for_range = None
+        else:
+            wait_for_range = downloader.wait_for_range
+
+        extractor = StreamingZipExtractor(downloader.part_path, target_dir, wait_for_range=wait_for_range,
+                                          progress_callback=progress_callback)
+        written = extractor.extract(archive_size=downloader.total_size or None)
+    except BaseException:
+        thread.join()
+        # Причина "байты не пришли" - ошибка скачивания, ее и показываем
+        if errors:
+            raise errors[0]
+        raise
+
+    thread.join()
+    if errors:
+        raise errors[0]
+    downloader.finalize()
+    return written
@@ -38,6 +38,8 @@ hidden_imports += collect_submodules('rank_bm25')
 hidden_imports += collect_submodules('sklearn')
 hidden_imports += ['numpy', 'regex', 'requests', 'tqdm', 
                    'filelock', 'packaging', 'typing_extensions', 'pickle']
+# Optional fast JSON / Brotli for API responses (response_format falls back to json/gzip without them)
+hidden_imports += ['orjson', 'brotli']
 
 # Data files
 datas += collect_data_files('transformers')
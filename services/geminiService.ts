@@ -138,7 +138,8 @@ const callOpenRouter = async (
   }
 };
 
-export const searchScriptures = async (query: string, settings: AppSettings): Promise<SourceChunk[]> => {
+// sessionId: chunks already returned in this agent run are skipped and backfilled on the backend
+export const searchScriptures = async (query: string, settings: AppSettings, sessionId?: string): Promise<SourceChunk[]> => {
   if (settings.useMockData) return DEMO_CHUNKS;
 
   const url = settings.backendUrl || `${API_BASE_URL}/search`;
@@ -154,7 +155,8 @@ export const searchScriptures = async (query: string, settings: AppSettings): Pr
         query: query,
         language: lang,
         top_k: 20, // Reverted to 20 as requested
-        api_key: settings.apiKey
+        api_key: settings.apiKey,
+        session_id: sessionId
       })
     });
 
@@ -163,22 +165,58 @@ export const searchScriptures = async (query: string, settings: AppSettings): Pr
       return [];
     }
     const data = await response.json();
-    const results = data.results || [];
-    return results.map((item: any) => ({
-      id: `${(item.book || 'unknown').replace(/\s+/g, "").toLowerCase()}.${item.chapter}.${item.verse}`,
-      bookTitle: item.book || 'Unknown',
-      chapter: item.chapter,
-      verse: item.verse,
-      content: item.text,
-      score: item.final_score || item.score || 0,
-      sourceUrl: item.html_path
-    }));
+    return toSourceChunks(data.results || []);
   } catch (err: any) {
     console.error("Retrieval error", err);
     return [];
   }
 };
 
+const toSourceChunks = (results: any[]): SourceChunk[] => results.map((item: any) => ({
+  id: `${(item.book || 'unknown').replace(/\s+/g, "").toLowerCase()}.${item.chapter}.${item.verse}`,
+  bookTitle: item.book || 'Unknown',
+  chapter: item.chapter,
+  verse: item.verse,
+  content: item.text,
+  score: item.final_score || item.score || 0,
+  sourceUrl: item.html_path
+}));
+
+// Several queries in one round trip (/api/search/batch): one embedding call and one rerank pass on the backend
+export const searchScripturesBatch = async (queries: string[], settings: AppSettings, sessionId?: string): Promise<SourceChunk[][]> => {
+  if (settings.useMockData) return queries.map(() => DEMO_CHUNKS);
+  if (queries.length === 0) return [];
+  if (queries.length === 1) return [await searchScriptures(queries[0], settings, sessionId)];
+
+  const url = `${settings.backendUrl || `${API_BASE_URL}/search`}/batch`;
+
+  try {
+    const response = await fetch(url, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({
+        queries: queries.map(query => ({
+          query,
+          language: /[а-яА-ЯёЁ]/.test(query) ? 'ru' : (settings.language || 'en')
+        })),
+        top_k: 20,
+        api_key: settings.apiKey,
+        session_id: sessionId
+      })
+    });
+
+    if (!response.ok) {
+      console.warn(`Backend batch search failed: ${response.status}`);
+      return queries.map(() => []);
+    }
+    const data = await response.json();
+    return queries.map((_, i) => toSourceChunks(data.results?.[i]?.results || []));
+  } catch (err: any) {
+    console.error("Batch retrieval error", err);
+    return queries.map(() => []);
+  }
+};
+
 export const generateRAGResponse = async (
   userQuery: string,
   initialChunks: SourceChunk[],
@@ -188,6 +226,9 @@ export const generateRAGResponse = async (
   onSourcesFound?: (chunks: SourceChunk[]) => void,
   signal?: AbortSignal
 ) => {
+  // One search session per agent run: the model already has earlier results in its context
+  const searchSessionId = `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 10)}`;
+
   // --- GOOGLE PROVIDER (ReAct Pattern) ---
   if (settings.provider === 'google') {
     if (!settings.apiKey) throw new Error("Google API Key is missing.");
@@ -308,7 +349,7 @@ RULES:
       if (actionMatch) {
         const query = actionMatch[2];
         if (onStep) onStep({ type: 'action', content: `Searching: ${query}`, timestamp: Date.now() });
-        const results = await searchScriptures(query, settings);
+        const results = await searchScriptures(query, settings, searchSessionId);
         if (onSourcesFound) onSourcesFound(results);
 
         const obs = results.length > 0
@@ -421,35 +462,36 @@ Be Shuka - wise, kind, and devoted to truth.
       }
 
       if (toolCalls && toolCalls.length > 0) {
-        for (const toolCall of toolCalls) {
-          if (toolCall.function.name === 'search_database') {
-            const args = JSON.parse(toolCall.function.arguments);
-            const query = args.query;
-
-
-            if (onStep) onStep({ type: 'action', content: `Searching: "${query}"`, timestamp: Date.now() });
-            console.log(`[OpenRouter] Tool Call: Searching '${query}'`);
+        // All searches requested in this turn go to the backend as one batch
+        const searchCalls = toolCalls.filter((toolCall: any) => toolCall.function.name === 'search_database');
+        const queries: string[] = searchCalls.map((toolCall: any) => JSON.parse(toolCall.function.arguments).query);
+        for (const query of queries) {
+          if (onStep) onStep({ type: 'action', content: `Searching: "${query}"`, timestamp: Date.now() });
+          console.log(`[OpenRouter] Tool Call: Searching '${query}'`);
+        }
+        const batchResults = await searchScripturesBatch(queries, settings, searchSessionId);
 
-            const results = await searchScriptures(query, settings);
+        for (let callIndex = 0; callIndex < searchCalls.length; callIndex++) {
+          const toolCall = searchCalls[callIndex];
+          const results = batchResults[callIndex];
 
-            // Reverted truncation as requested
-            console.log(`[OpenRouter] Found ${results.length} results.`);
+          // Reverted truncation as requested
+          console.log(`[OpenRouter] Found ${results.length} results.`);
 
-            if (onSourcesFound) onSourcesFound(results);
+          if (onSourcesFound) onSourcesFound(results);
 
-            const toolResultContent = results.length > 0
-              ? `Found ${results.length} verses:\n${results.map(c => `[[${c.id}]] ${c.bookTitle} ${c.chapter}:${c.verse} - "${c.content}"`).join('\n')}`
-              : "No relevant verses found.";
+          const toolResultContent = results.length > 0
+            ? `Found ${results.length} verses:\n${results.map(c => `[[${c.id}]] ${c.bookTitle} ${c.chapter}:${c.verse} - "${c.content}"`).join('\n')}`
+            : "No relevant verses found.";
 
-            // Push Tool Result to history
-            messages.push({
-              role: "tool",
-              tool_call_id: toolCall.id,
-              name: toolCall.function.name,
-              content: toolResultContent
-            });
-            if (onStep) onStep({ type: 'observation', content: `Found ${results.length} results.`, timestamp: Date.now() });
-          }
+          // Push Tool Result to history
+          messages.push({
+            role: "tool",
+            tool_call_id: toolCall.id,
+            name: toolCall.function.name,
+            content: toolResultContent
+          });
+          if (onStep) onStep({ type: 'observation', content: `Found ${results.length} results.`, timestamp: Date.now() });
         }
       } else {
         // No tool calls -> Final Answer